@@ -1,41 +1,322 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, UploadFile, File
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType, DeleteOne, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+import io
 import os
+import re
+import csv
+import json
+import orjson
+import numpy as np
+import time
+import asyncio
 import logging
+import multiprocessing
+import threading
+import contextvars
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from collections import OrderedDict, defaultdict
+from itertools import chain
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, ValidationError
+from typing import Dict, List, Optional
 import uuid
-from datetime import datetime, timezone
-from fastapi.middleware.cors import CORSMiddleware
-import os
+import unicodedata
+import hashlib
+import statistics
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 origins = [
 "http://localhost:3000",              # dev local
     "https://epp-hkb-app-assana.onrender.com",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-    ROOT_DIR = Path(__file__).parent
+ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ========== INSTRUMENTATION ==========
+
+SEUIL_REQUETE_LENTE_MS = float(os.environ.get('SEUIL_REQUETE_LENTE_MS', '1000'))
+BORNES_HISTOGRAMME = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Requêtes /api traitées en même temps pour une école : au-delà, 429 plutôt que ralentir les autres
+REQUETES_SIMULTANEES_PAR_ECOLE = int(os.environ.get('REQUETES_SIMULTANEES_PAR_ECOLE', '32'))
+
+class MesureRequete:
+    """Commandes Mongo émises pendant une requête HTTP"""
+
+    def __init__(self):
+        self.commandes = []
+        self._en_cours = {}
+        # Motor exécute pymongo dans des threads : l'écouteur écrit depuis ces threads
+        self._verrou = threading.Lock()
+
+    def debut(self, request_id, nom: str, collection: str):
+        with self._verrou:
+            self._en_cours[request_id] = (nom, collection)
+
+    def fin(self, request_id, nom: str, duree_s: float):
+        with self._verrou:
+            nom, collection = self._en_cours.pop(request_id, (nom, None))
+            self.commandes.append((nom, collection, duree_s))
+
+    @property
+    def duree_mongo_s(self) -> float:
+        return sum(duree for _, _, duree in self.commandes)
+
+_mesure_courante: contextvars.ContextVar = contextvars.ContextVar("mesure_requete", default=None)
+
+class Metriques:
+    """Compteurs et histogrammes exposés au format texte Prometheus sur /metrics"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self.requetes = {}   # (méthode, route) -> [compte par borne..., somme, compte, commandes mongo]
+        self.commandes = {}  # nom -> [nombre, durée totale, échecs]
+        self.ecoles = {}     # école -> [requêtes, refusées (quota), en cours]
+        # Écoles qui possèdent au moins une classe : seules à avoir leur propre série et leur propre quota
+        self.ecoles_reconnues = set()
+
+    def observer_requete(self, methode: str, route: str, duree_s: float, nb_commandes: int):
+        with self._verrou:
+            serie = self.requetes.setdefault((methode, route), [0] * len(BORNES_HISTOGRAMME) + [0.0, 0, 0])
+            for i, borne in enumerate(BORNES_HISTOGRAMME):
+                if duree_s <= borne:
+                    serie[i] += 1
+            serie[-3] += duree_s
+            serie[-2] += 1
+            serie[-1] += nb_commandes
+
+    def reconnaitre_ecole(self, ecole: str):
+        with self._verrou:
+            self.ecoles_reconnues.add(ecole)
+
+    def ecole_reconnue(self, ecole: str) -> bool:
+        with self._verrou:
+            return ecole in self.ecoles_reconnues
+
+    def entrer_ecole(self, ecole: str, maximum: int) -> bool:
+        """Compte une requête de l'école ; False si elle a déjà `maximum` requêtes en cours"""
+        with self._verrou:
+            serie = self.ecoles.setdefault(ecole, [0, 0, 0])
+            if serie[2] >= maximum:
+                serie[1] += 1
+                return False
+            serie[0] += 1
+            serie[2] += 1
+            return True
+
+    def sortir_ecole(self, ecole: str):
+        with self._verrou:
+            self.ecoles[ecole][2] -= 1
+
+    def requetes_ecole(self, ecole: str) -> dict:
+        with self._verrou:
+            requetes, refusees, en_cours = self.ecoles.get(ecole, [0, 0, 0])
+        return {"requetes": requetes, "refusees": refusees, "en_cours": en_cours}
+
+    def observer_commande(self, nom: str, duree_s: float, echec: bool):
+        with self._verrou:
+            serie = self.commandes.setdefault(nom, [0, 0.0, 0])
+            serie[0] += 1
+            serie[1] += duree_s
+            serie[2] += int(echec)
+
+    def exposition(self) -> str:
+        lignes = [
+            "# HELP requetes_http_duree_secondes Durée des requêtes HTTP par route",
+            "# TYPE requetes_http_duree_secondes histogram",
+        ]
+        with self._verrou:
+            requetes = {cle: list(serie) for cle, serie in self.requetes.items()}
+            commandes = {nom: list(serie) for nom, serie in self.commandes.items()}
+            ecoles = {ecole: list(serie) for ecole, serie in self.ecoles.items()}
+        for (methode, route), serie in sorted(requetes.items()):
+            etiquettes = f'methode="{methode}",route="{route}"'
+            for borne, compte in zip(BORNES_HISTOGRAMME, serie):
+                lignes.append(f'requetes_http_duree_secondes_bucket{{{etiquettes},le="{borne}"}} {compte}')
+            lignes.append(f'requetes_http_duree_secondes_bucket{{{etiquettes},le="+Inf"}} {serie[-2]}')
+            lignes.append(f"requetes_http_duree_secondes_sum{{{etiquettes}}} {serie[-3]:.6f}")
+            lignes.append(f"requetes_http_duree_secondes_count{{{etiquettes}}} {serie[-2]}")
+        lignes += [
+            "# HELP requetes_http_commandes_mongo_total Commandes Mongo émises par route",
+            "# TYPE requetes_http_commandes_mongo_total counter",
+        ]
+        for (methode, route), serie in sorted(requetes.items()):
+            lignes.append(f'requetes_http_commandes_mongo_total{{methode="{methode}",route="{route}"}} {serie[-1]}')
+        lignes += [
+            "# HELP mongo_commandes_total Commandes Mongo par nom",
+            "# TYPE mongo_commandes_total counter",
+        ]
+        lignes += [f'mongo_commandes_total{{commande="{nom}"}} {serie[0]}' for nom, serie in sorted(commandes.items())]
+        lignes += [
+            "# HELP mongo_commandes_duree_secondes_total Temps passé dans les commandes Mongo",
+            "# TYPE mongo_commandes_duree_secondes_total counter",
+        ]
+        lignes += [
+            f'mongo_commandes_duree_secondes_total{{commande="{nom}"}} {serie[1]:.6f}'
+            for nom, serie in sorted(commandes.items())
+        ]
+        lignes += [
+            "# HELP mongo_commandes_echecs_total Commandes Mongo en échec",
+            "# TYPE mongo_commandes_echecs_total counter",
+        ]
+        lignes += [f'mongo_commandes_echecs_total{{commande="{nom}"}} {serie[2]}' for nom, serie in sorted(commandes.items())]
+        for nom, aide, type_serie, indice in (
+            ("requetes_ecole_total", "Requêtes /api par école", "counter", 0),
+            ("requetes_ecole_refusees_total", "Requêtes refusées par le quota de l'école", "counter", 1),
+            ("requetes_ecole_en_cours", "Requêtes /api en cours par école", "gauge", 2),
+        ):
+            lignes += [f"# HELP {nom} {aide}", f"# TYPE {nom} {type_serie}"]
+            lignes += [f'{nom}{{ecole="{ecole}"}} {serie[indice]}' for ecole, serie in sorted(ecoles.items())]
+        return "\n".join(lignes) + "\n"
+
+metriques = Metriques()
+
+class EcouteurCommandes(monitoring.CommandListener):
+    """Compte les commandes Mongo, globalement et pour la requête HTTP en cours"""
+
+    def started(self, event):
+        mesure = _mesure_courante.get()
+        if mesure is not None:
+            collection = event.command.get(event.command_name)
+            mesure.debut(event.request_id, event.command_name, collection if isinstance(collection, str) else None)
+
+    def succeeded(self, event):
+        self._terminer(event, echec=False)
+
+    def failed(self, event):
+        self._terminer(event, echec=True)
+
+    def _terminer(self, event, echec: bool):
+        duree_s = event.duration_micros / 1_000_000
+        metriques.observer_commande(event.command_name, duree_s, echec)
+        mesure = _mesure_courante.get()
+        if mesure is not None:
+            mesure.fin(event.request_id, event.command_name, duree_s)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[EcouteurCommandes()])
 db = client[os.environ['DB_NAME']]
 
 # ✅ Une seule instance
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Curseur-Suivant", "ETag"],
+)
+class GZipHorsFlux(GZipMiddleware):
+    """GZip sauf pour les flux d'événements, qui doivent partir message par message"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            accept = dict(scope["headers"]).get(b"accept", b"")
+            if b"text/event-stream" in accept:
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
+
+# Les listes de notes et le suivi d'une classe dépassent vite quelques dizaines de Ko
+app.add_middleware(GZipHorsFlux, minimum_size=1000)
+
+@app.middleware("http")
+async def mesurer_requete(request: Request, call_next):
+    """Histogramme de latence par route, en-tête Server-Timing et journal des requêtes lentes"""
+    mesure = MesureRequete()
+    jeton = _mesure_courante.set(mesure)
+    debut = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _mesure_courante.reset(jeton)
+    duree_s = time.perf_counter() - debut
+    
+    route = request.scope.get("route")
+    chemin = route.path if route is not None else "non_trouvee"
+    metriques.observer_requete(request.method, chemin, duree_s, len(mesure.commandes))
+    
+    duree_mongo_ms = mesure.duree_mongo_s * 1000
+    response.headers["Server-Timing"] = (
+        f'mongo;dur={duree_mongo_ms:.1f};desc="{len(mesure.commandes)} commandes", '
+        f"app;dur={duree_s * 1000 - duree_mongo_ms:.1f}, total;dur={duree_s * 1000:.1f}"
+    )
+    
+    if SEUIL_REQUETE_LENTE_MS and duree_s * 1000 >= SEUIL_REQUETE_LENTE_MS:
+        detail = "; ".join(
+            f"{nom} {collection or ''} {duree * 1000:.1f}ms".replace("  ", " ")
+            for nom, collection, duree in mesure.commandes
+        )
+        logger.warning(
+            "Requête lente %s %s : %.1f ms dont %.1f ms Mongo (%d commandes) [%s]",
+            request.method, chemin, duree_s * 1000, duree_mongo_ms, len(mesure.commandes), detail
+        )
+    return response
+
+@app.get("/metrics")
+async def exposer_metriques():
+    return Response(metriques.exposition(), media_type="text/plain; version=0.0.4")
+
+# ========== ÉCOLES ==========
+
+# Une base partagée par plusieurs écoles : chaque document porte le school_id de son école
+ECOLE_PAR_DEFAUT = "defaut"
+MOTIF_ECOLE = r"^[A-Za-z0-9_-]{1,64}$"
+
+def ecole_de_la_requete(request: Request) -> Optional[str]:
+    """École désignée par l'en-tête X-School-Id (ou ?school_id=, seul possible pour EventSource)"""
+    ecole = request.headers.get("x-school-id") or request.query_params.get("school_id") or ECOLE_PAR_DEFAUT
+    return ecole if re.match(MOTIF_ECOLE, ecole) else None
+
+# Série et quota communs aux écoles sans classe : l'étiquette ne peut pas être un school_id
+ECOLE_INCONNUE = "(inconnue)"
+
+@app.middleware("http")
+async def quota_ecole(request: Request, call_next):
+    """Compte les requêtes de chaque école et borne celles qui sont traitées en même temps.
+
+    L'en-tête est libre : seules les écoles qui possèdent une classe ont leur série et leur quota,
+    les autres se partagent ECOLE_INCONNUE (pas de série par en-tête inventé, ni de quota contourné
+    en changeant d'en-tête).
+    """
+    ecole = ecole_de_la_requete(request) if request.url.path.startswith("/api") else None
+    if ecole is None:
+        return await call_next(request)
+    if not metriques.ecole_reconnue(ecole):
+        if await db.classes.find_one({"school_id": ecole}, {"_id": 1}):
+            metriques.reconnaitre_ecole(ecole)
+        else:
+            ecole = ECOLE_INCONNUE
+    if not metriques.entrer_ecole(ecole, REQUETES_SIMULTANEES_PAR_ECOLE):
+        return JSONResponse(
+            {"detail": "Trop de requêtes simultanées pour cette école"}, status_code=429,
+            headers={"Retry-After": "1"}
+        )
+    try:
+        return await call_next(request)
+    finally:
+        metriques.sortir_ecole(ecole)
+
+async def ecole_courante(
+    x_school_id: Optional[str] = Header(None, pattern=MOTIF_ECOLE),
+    school_id: Optional[str] = Query(None, pattern=MOTIF_ECOLE, include_in_schema=False)
+) -> str:
+    return x_school_id or school_id or ECOLE_PAR_DEFAUT
+
 
 # ========== MODELS ==========
 
@@ -46,6 +327,9 @@ class Classe(BaseModel):
     niveau: str
     annee_scolaire: str
     enseignant: str
+    school_id: str = ECOLE_PAR_DEFAUT
+    version: int = 0
+    updated_at: Optional[datetime] = None
 
 class ClasseCreate(BaseModel):
     nom: str
@@ -60,6 +344,9 @@ class Eleve(BaseModel):
     prenom: str
     classe_id: str
     date_naissance: Optional[str] = None
+    school_id: str = ECOLE_PAR_DEFAUT
+    version: int = 0
+    updated_at: Optional[datetime] = None
 
 class EleveCreate(BaseModel):
     nom: str
@@ -75,6 +362,9 @@ class Composition(BaseModel):
     date: str
     titre: str
     mois: str
+    school_id: str = ECOLE_PAR_DEFAUT
+    version: int = 0
+    updated_at: Optional[datetime] = None
 
 class CompositionCreate(BaseModel):
     classe_id: str
@@ -96,6 +386,10 @@ class Note(BaseModel):
     moyenne: float
     rang: int
     observation: str
+    school_id: str = ECOLE_PAR_DEFAUT
+    version: int = 0
+    updated_at: Optional[datetime] = None
+    rang_en_attente: bool = False
 
 class NoteCreate(BaseModel):
     composition_id: str
@@ -111,21 +405,721 @@ class NoteUpdate(BaseModel):
     dictee: float
     math: float
 
+class NoteSaisie(BaseModel):
+    eleve_id: str
+    etude_texte: float = Field(ge=0, le=50)
+    aem: float = Field(ge=0, le=50)
+    dictee: float = Field(ge=0, le=20)
+    math: float = Field(ge=0, le=50)
+
+class NotesBatch(BaseModel):
+    composition_id: str
+    notes: List[NoteSaisie]
+
+class BulletinsDemande(BaseModel):
+    classe_id: Optional[str] = None
+    annee_scolaire: Optional[str] = None
+    mois: Optional[str] = None
+
+class TravailBulletins(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    statut: str = "en_attente"
+    school_id: str = ECOLE_PAR_DEFAUT
+    classe_id: Optional[str] = None
+    annee_scolaire: Optional[str] = None
+    mois: Optional[str] = None
+    classes: int = 0
+    classes_terminees: int = 0
+    bulletins: int = 0
+    erreur: Optional[str] = None
+    cree_le: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Rafraîchi tant que le travail tourne ; sans lui, le travail passe pour interrompu
+    actif_le: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    termine_le: Optional[datetime] = None
+
+# ========== INDEX ==========
+
+# Durée pendant laquelle une clé d'idempotence rejoue la réponse de la première requête
+DUREE_IDEMPOTENCE_S = int(os.environ.get('DUREE_IDEMPOTENCE_H', '24')) * 3600
+# Durée de conservation des archives de bulletins et des travaux terminés
+DUREE_BULLETINS_S = int(os.environ.get('DUREE_BULLETINS_H', '24')) * 3600
+
+# (collection, clés, options) : toutes les routes filtrent sur ces champs. Les requêtes par id
+# d'un parent (classe_id, composition_id...) ne portent que sur une école : l'id suffit à les borner
+INDEX = [
+    ("classes", [("id", 1)], {"unique": True}),
+    ("eleves", [("id", 1)], {"unique": True}),
+    ("eleves", [("classe_id", 1)], {}),
+    ("compositions", [("id", 1)], {"unique": True}),
+    ("compositions", [("classe_id", 1), ("numero", 1)], {}),
+    ("notes", [("id", 1)], {"unique": True}),
+    ("notes", [("composition_id", 1), ("eleve_id", 1)], {"unique": True}),
+    ("notes", [("composition_id", 1), ("total", -1)], {}),
+    ("notes", [("eleve_id", 1)], {}),
+    ("statistiques", [("composition_id", 1)], {"unique": True}),
+    ("progression", [("classe_id", 1), ("eleve_id", 1)], {"unique": True}),
+    ("progression", [("classe_id", 1), ("moyenne_annuelle", -1)], {}),
+    # Requêtes sur toute une école (listes, synchronisation, classements) : l'école d'abord
+    ("classes", [("school_id", 1), ("id", 1)], {}),
+    ("eleves", [("school_id", 1), ("id", 1)], {}),
+    ("compositions", [("school_id", 1), ("id", 1)], {}),
+    ("compositions", [("school_id", 1), ("mois", 1)], {}),
+    ("notes", [("school_id", 1), ("id", 1)], {}),
+    ("classes", [("school_id", 1), ("version", 1)], {}),
+    ("eleves", [("school_id", 1), ("version", 1)], {}),
+    ("compositions", [("school_id", 1), ("version", 1)], {}),
+    ("notes", [("school_id", 1), ("version", 1)], {}),
+    ("suppressions", [("school_id", 1), ("version", 1)], {}),
+    ("travaux_bulletins", [("school_id", 1), ("id", 1)], {}),
+    ("idempotence", [("cree_le", 1)], {"expireAfterSeconds": DUREE_IDEMPOTENCE_S}),
+    ("travaux_bulletins", [("termine_le", 1)], {"expireAfterSeconds": DUREE_BULLETINS_S}),
+]
+
+# Codes Mongo IndexOptionsConflict / IndexKeySpecsConflict
+CODES_CONFLIT_INDEX = (85, 86)
+
+async def creer_index() -> List[str]:
+    """Crée les index manquants (idempotent) et retourne ceux qui ont été créés"""
+    crees = []
+    for nom_collection, cles, options in INDEX:
+        collection = db[nom_collection]
+        existants = await collection.index_information()
+        
+        for nom, info in existants.items():
+            cles_existantes = [(champ, int(sens)) for champ, sens in info['key']]
+            if cles_existantes == cles and bool(info.get('unique')) != bool(options.get('unique')):
+                raise RuntimeError(
+                    f"Index {nom_collection}.{nom} déjà défini avec des options différentes de {options}"
+                )
+        
+        try:
+            nom = await collection.create_index(cles, **options)
+        except DuplicateKeyError as exc:
+            # Données existantes en double : on démarre quand même, sans cet index
+            logger.error("Index %s %s non créé, doublons présents : %s", nom_collection, cles, exc)
+            continue
+        except OperationFailure as exc:
+            if exc.code in CODES_CONFLIT_INDEX:
+                raise RuntimeError(f"Index {nom_collection} {cles} en conflit : {exc}") from exc
+            raise
+        
+        if nom not in existants:
+            crees.append(f"{nom_collection}.{nom}")
+    
+    if crees:
+        logger.info("Index créés : %s", ", ".join(crees))
+    else:
+        logger.info("Tous les index sont déjà en place")
+    return crees
+
+# ========== PAGINATION ==========
+
+TAILLE_PAGE_MAX = 1000
+TAILLE_LOT_CURSEUR = 200
+
+class Pagination:
+    """Paramètres communs des listes : page par clé (limit + after sur l'id), flux NDJSON, chemin rapide"""
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=TAILLE_PAGE_MAX),
+        after: Optional[str] = None,
+        format: str = Query("json", pattern="^(json|ndjson)$"),
+        rapide: bool = False
+    ):
+        self.limit = limit
+        self.after = after
+        self.format = format
+        self.rapide = rapide
+
+    @property
+    def par_cle(self) -> bool:
+        return self.limit is not None or self.after is not None or self.format == "ndjson"
+
+# Champs de réponse calculés par les routes, absents des documents Mongo
+CHAMPS_NON_STOCKES = {"rang_en_attente"}
+
+def projection_modele(modele) -> dict:
+    """Projection Mongo limitée aux champs stockés du modèle"""
+    return {"_id": 0, **{champ: 1 for champ in modele.model_fields if champ not in CHAMPS_NON_STOCKES}}
+
+def reponse_json_rapide(donnees, entetes: Optional[dict] = None) -> Response:
+    """Réponse encodée par orjson sans validation Pydantic : réservée aux documents Mongo projetés"""
+    return Response(orjson.dumps(donnees), media_type="application/json", headers=entetes)
+
+async def flux_ndjson(curseur):
+    """Envoie les documents au fil de l'itération du curseur, une ligne JSON par document"""
+    async for doc in curseur:
+        yield orjson.dumps(doc) + b"\n"
+
+async def lister_documents(collection, query: dict, tri: list, page: Pagination, response: Response, modele=None):
+    """Liste une collection sans plafond : en entier, par page ou en flux"""
+    if page.par_cle:
+        # L'id unique et indexé sert de clé de pagination stable
+        if page.after is not None:
+            query = {**query, "id": {"$gt": page.after}}
+        tri = [("id", 1)]
+    
+    projection = projection_modele(modele) if page.rapide and modele is not None else {"_id": 0}
+    curseur = collection.find(query, projection)
+    if tri:
+        curseur = curseur.sort(tri)
+    if page.limit is not None:
+        curseur = curseur.limit(page.limit)
+    
+    if page.format == "ndjson":
+        return StreamingResponse(
+            flux_ndjson(curseur.batch_size(TAILLE_LOT_CURSEUR)),
+            media_type="application/x-ndjson"
+        )
+    
+    docs = await curseur.to_list(None)
+    if page.limit is not None and len(docs) == page.limit:
+        response.headers["X-Curseur-Suivant"] = docs[-1]['id']
+    if page.rapide:
+        return reponse_json_rapide(docs, {k: v for k, v in response.headers.items() if k.startswith("x-")})
+    return docs
+
+# ========== TRANSACTIONS ==========
+
+_transactions_disponibles: Optional[bool] = None
+
+async def transactions_disponibles() -> bool:
+    """Les transactions n'existent que sur un replica set ou derrière un mongos"""
+    global _transactions_disponibles
+    if _transactions_disponibles is None:
+        try:
+            hello = await db.command("hello")
+            _transactions_disponibles = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions_disponibles = False
+    return _transactions_disponibles
+
+@asynccontextmanager
+async def session_transaction():
+    """Fournit une session transactionnelle quand le déploiement le permet, sinon None"""
+    if not await transactions_disponibles():
+        yield None
+        return
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            yield session
+
+# ========== SYNCHRONISATION ==========
+
+# Chaque écriture reçoit une version du compteur de son école ; les suppressions laissent une pierre tombale
+COLLECTIONS_SYNCHRONISEES = ("classes", "eleves", "compositions", "notes")
+# Au-delà, une réservation jamais libérée est attribuée à un worker arrêté en pleine écriture
+DUREE_MAX_RESERVATION_S = int(os.environ.get('DUREE_MAX_RESERVATION_S', '60'))
+
+def date_utc(valeur: datetime) -> datetime:
+    """Mongo rend des dates naïves, en UTC"""
+    return valeur if valeur.tzinfo else valeur.replace(tzinfo=timezone.utc)
+
+def marque_version(version: int) -> dict:
+    return {"version": version, "updated_at": datetime.now(timezone.utc)}
+
+def cle_compteur(ecole: str) -> str:
+    return f"sync:{ecole}"
+
+# Dernière version vue par ce processus, par école : simple supposition, corrigée en relisant le compteur
+_versions_supposees: Dict[str, int] = {}
+
+@asynccontextmanager
+async def versions_reservees(ecole: str, nombre: int = 1):
+    """Réserve `nombre` versions consécutives du compteur de l'école et donne la première.
+
+    La réservation et sa première version sont inscrites dans le compteur, partagé par tous les
+    workers, par la même écriture que l'avancée du compteur (conditionnelle à sa valeur : une
+    supposition périmée coûte une relecture). Tant qu'elle est ouverte, /sync ne renvoie rien
+    au-delà de version_stable() : un client ne peut pas recevoir une version plus récente et
+    manquer celle-ci, écrite plus tard.
+    """
+    reservation = uuid.uuid4().hex
+    version = _versions_supposees.get(ecole, 0)
+    while True:
+        try:
+            # Compteur d'une autre valeur : l'upsert heurte l'_id existant
+            await db.compteurs.update_one(
+                {"_id": cle_compteur(ecole), "version": version},
+                {"$set": {
+                    "version": version + nombre,
+                    f"en_cours.{reservation}": {"premiere": version + 1, "debut": datetime.now(timezone.utc)}
+                }},
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            compteur = await db.compteurs.find_one({"_id": cle_compteur(ecole)}, {"version": 1})
+            version = compteur['version'] if compteur else 0
+    _versions_supposees[ecole] = version + nombre
+    try:
+        yield version + 1
+    finally:
+        await liberer_versions(ecole, reservation)
+
+async def liberer_versions(ecole: str, reservation: str):
+    await db.compteurs.update_one({"_id": cle_compteur(ecole)}, {"$unset": {f"en_cours.{reservation}": ""}})
+
+async def version_stable(ecole: str) -> Optional[int]:
+    """Plus grande version de l'école dont toutes les écritures sont terminées, quel que soit le worker.
+
+    Juste avant la première version de la plus ancienne réservation ouverte ; le compteur s'il n'y
+    en a pas. Les réservations plus anciennes que DUREE_MAX_RESERVATION_S sont levées.
+    None si aucune écriture de l'école n'a encore été versionnée.
+    """
+    compteur = await db.compteurs.find_one({"_id": cle_compteur(ecole)})
+    if compteur is None:
+        return None
+    limite = datetime.now(timezone.utc) - timedelta(seconds=DUREE_MAX_RESERVATION_S)
+    ouvertes = []
+    for reservation, detail in (compteur.get('en_cours') or {}).items():
+        if date_utc(detail['debut']) >= limite:
+            ouvertes.append(detail['premiere'])
+            continue
+        logger.warning("Réservation de versions %s expirée : worker arrêté pendant une écriture ?", reservation)
+        await liberer_versions(ecole, reservation)
+    return min(ouvertes) - 1 if ouvertes else compteur['version']
+
+def pierre_tombale(collection: str, doc_id: str, classe_id: Optional[str], ecole: str, version: int) -> dict:
+    """Suppression à transmettre aux clients ; celle d'un parent vaut pour ses enfants"""
+    return {
+        "collection": collection, "id": doc_id, "classe_id": classe_id, "school_id": ecole,
+        **marque_version(version)
+    }
+
+async def migrer_versions():
+    """Les documents antérieurs à la synchronisation reçoivent la version 0"""
+    for nom in COLLECTIONS_SYNCHRONISEES:
+        await db[nom].update_many({"version": {"$exists": False}}, {"$set": {"version": 0}})
+
+async def migrer_ecoles():
+    """Les documents antérieurs aux écoles appartiennent à l'école par défaut"""
+    for nom in (*COLLECTIONS_SYNCHRONISEES, "suppressions", "travaux_bulletins"):
+        await db[nom].update_many({"school_id": {"$exists": False}}, {"$set": {"school_id": ECOLE_PAR_DEFAUT}})
+
+async def migrer_compteurs():
+    """L'ancien compteur global devient le point de départ de chaque école : aucun jeton déjà remis ne recule"""
+    ancien = await db.compteurs.find_one({"_id": "sync"})
+    if ancien is None:
+        return
+    for ecole in await db.classes.distinct("school_id"):
+        await db.compteurs.update_one(
+            {"_id": cle_compteur(ecole)}, {"$max": {"version": ancien['version']}}, upsert=True
+        )
+    await db.compteurs.delete_one({"_id": "sync"})
+
+# ========== CACHE DES RÉPONSES ==========
+
+class CacheReponses:
+    """Corps de réponses déjà sérialisés, indexés par ETag, avec éviction LRU"""
+
+    def __init__(self, taille_max: int):
+        self.taille_max = taille_max
+        self._entrees: OrderedDict = OrderedDict()
+
+    def lire(self, etag: str) -> Optional[tuple]:
+        entree = self._entrees.get(etag)
+        if entree is not None:
+            self._entrees.move_to_end(etag)
+        return entree
+
+    def vider(self):
+        self._entrees.clear()
+
+    def ecrire(self, etag: str, corps: bytes, entetes: dict):
+        self._entrees[etag] = (corps, entetes)
+        self._entrees.move_to_end(etag)
+        while len(self._entrees) > self.taille_max:
+            self._entrees.popitem(last=False)
+
+cache_reponses = CacheReponses(taille_max=int(os.environ.get('CACHE_REPONSES_MAX', '256')))
+
+def infos_composition(comp: dict) -> dict:
+    return {
+        "classe_id": comp['classe_id'], "numero": comp['numero'], "mois": comp['mois'],
+        "school_id": comp.get('school_id', ECOLE_PAR_DEFAUT)
+    }
+
+async def infos_compositions(composition_ids: List[str]) -> Dict[str, dict]:
+    """Classe, numéro, mois et école des compositions existantes.
+
+    Relues à chaque appel : un autre worker peut les avoir modifiées ou supprimées, et un cache
+    par processus ne serait pas invalidé. Les reclassements les lisent une fois et les transmettent.
+    """
+    compositions = await db.compositions.find(
+        {"id": {"$in": composition_ids}},
+        {"_id": 0, "id": 1, "classe_id": 1, "numero": 1, "mois": 1, "school_id": 1}
+    ).to_list(None)
+    return {comp['id']: infos_composition(comp) for comp in compositions}
+
+async def verifier_composition(composition_id: str, ecole: str) -> dict:
+    """Infos de la composition si elle appartient à l'école, sinon 404"""
+    comp = await db.compositions.find_one(
+        {"id": composition_id, "school_id": ecole},
+        {"_id": 0, "classe_id": 1, "numero": 1, "mois": 1, "school_id": 1}
+    )
+    if comp is None:
+        raise HTTPException(status_code=404, detail="Composition non trouvée")
+    return infos_composition(comp)
+
+async def verifier_classe(classe_id: str, ecole: str):
+    """404 si la classe n'existe pas dans l'école"""
+    if not await db.classes.find_one({"id": classe_id, "school_id": ecole}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Classe non trouvée")
+
+def portee_ecole(ecole: str, nom: str) -> str:
+    """Portée de cache couvrant toute une école (« notes », « classements »...)"""
+    return f"ecole:{ecole}:{nom}"
+
+async def classes_des_compositions(composition_ids: List[str]) -> Dict[str, str]:
+    infos = await infos_compositions(composition_ids)
+    return {cid: info['classe_id'] for cid, info in infos.items()}
+
+async def invalider(portees: List[str]):
+    """Incrémente le compteur de version des portées modifiées (partagé entre workers via Mongo)"""
+    portees = sorted(set(portees))
+    if portees:
+        await db.versions.bulk_write(
+            [UpdateOne({"_id": portee}, {"$inc": {"v": 1}}, upsert=True) for portee in portees],
+            ordered=False
+        )
+
+async def invalider_compositions(composition_ids: List[str], infos: Optional[Dict[str, dict]] = None):
+    """Portées touchées par un changement de notes : la composition, sa classe (suivi), les classements du mois
+    et les tableaux couvrant toutes les notes"""
+    if infos is None:
+        infos = await infos_compositions(composition_ids)
+    await invalider(
+        [portee_ecole(info['school_id'], "notes") for info in infos.values()]
+        + [f"composition:{cid}" for cid in composition_ids]
+        + [f"classe:{info['classe_id']}" for info in infos.values()]
+        + [portee_ecole(info['school_id'], f"classements:{info['mois']}") for info in infos.values()]
+    )
+
+async def reponse_en_cache(request: Request, ecole: str, portees: List[str], produire, modele=None,
+                           rapide: bool = False) -> Response:
+    """Sert une lecture depuis le cache, ou 304 si le client a déjà la version courante"""
+    versions = await db.versions.find({"_id": {"$in": portees}}).to_list(None)
+    versions = {doc['_id']: doc['v'] for doc in versions}
+    # L'école fait partie de la clé : une école ne reçoit jamais une réponse produite pour une autre
+    cle = json.dumps([
+        ecole,
+        request.url.path,
+        sorted(request.query_params.multi_items()),
+        [versions.get(portee, 0) for portee in portees]
+    ])
+    etag = '"' + hashlib.sha1(cle.encode()).hexdigest() + '"'
+    
+    # no-cache : le navigateur garde la réponse mais revalide à chaque fois avec If-None-Match
+    validation = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [e.strip() for e in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=validation)
+    
+    entree = cache_reponses.lire(etag)
+    if entree is None:
+        entetes = Response()
+        donnees = await produire(entetes)
+        if isinstance(donnees, StreamingResponse):
+            # Les flux ne sont pas mis en cache
+            return donnees
+        if isinstance(donnees, Response):
+            # Déjà encodée par le chemin rapide
+            entetes, corps = donnees, donnees.body
+        elif rapide:
+            corps = orjson.dumps(donnees)
+        elif modele is not None:
+            adaptateur = TypeAdapter(modele)
+            corps = adaptateur.dump_json(adaptateur.validate_python(donnees))
+        else:
+            corps = json.dumps(jsonable_encoder(donnees), ensure_ascii=False, separators=(",", ":")).encode()
+        entree = (corps, {k: v for k, v in entetes.headers.items() if k.startswith("x-")})
+        cache_reponses.ecrire(etag, *entree)
+    
+    corps, entetes = entree
+    return Response(corps, media_type="application/json", headers={**entetes, **validation})
+
 # ========== HELPER FUNCTIONS ==========
 
-async def calculer_classement(composition_id: str):
-    """Recalcule le rang de toutes les notes d'une composition"""
-    notes = await db.notes.find({"composition_id": composition_id}, {"_id": 0}).to_list(1000)
+MATIERES = ("etude_texte", "aem", "dictee", "math")
+
+def resumer_valeurs(valeurs: List[float]) -> dict:
+    """Moyenne, minimum, maximum et médiane d'une série de notes"""
+    if not valeurs:
+        return {"moyenne": 0, "min": 0, "max": 0, "mediane": 0}
+    return {
+        "moyenne": round(statistics.fmean(valeurs), 2),
+        "min": min(valeurs),
+        "max": max(valeurs),
+        "mediane": statistics.median(valeurs)
+    }
+
+def calculer_statistiques(notes: List[dict]) -> dict:
+    """Statistiques d'une composition à partir de ses notes"""
+    effectif = len(notes)
+    moyennes = [n['moyenne'] for n in notes]
+    admis = sum(1 for m in moyennes if m >= 5.0)
     
-    # Trier par total décroissant
-    notes_triees = sorted(notes, key=lambda x: x['total'], reverse=True)
+    repartition = {"A": 0, "B": 0, "C": 0, "D": 0}
+    for moyenne in moyennes:
+        repartition[calculer_observation(moyenne)] += 1
     
-    # Mettre à jour les rangs
+    return {
+        "effectif": effectif,
+        "presents": effectif,  # Par défaut tous présents
+        "absents": 0,
+        "admis": admis,
+        "pourcentage_reussite": round((admis / effectif * 100), 2) if effectif > 0 else 0,
+        "moyenne_classe": round(statistics.fmean(moyennes), 2) if effectif > 0 else 0,
+        "matieres": {m: resumer_valeurs([n[m] for n in notes]) for m in MATIERES},
+        "repartition": repartition
+    }
+
+async def rafraichir_statistiques(composition_id: str) -> dict:
+    """Recalcule et matérialise les statistiques d'une composition à partir d'une lecture projetée de ses notes.
+
+    Médianes et extrêmes demandent toutes les valeurs : seules les colonnes utiles sont relues.
+    """
+    notes = await db.notes.find(
+        {"composition_id": composition_id}, {"_id": 0, "moyenne": 1, **{m: 1 for m in MATIERES}}
+    ).to_list(None)
+    stats = calculer_statistiques(notes)
+    await db.statistiques.replace_one(
+        {"composition_id": composition_id},
+        {"composition_id": composition_id, **stats},
+        upsert=True
+    )
+    return stats
+
+def attribuer_rangs(notes: List[dict]) -> Dict[str, int]:
+    """Attribue les rangs par total décroissant (ex-aequo : même rang, puis saut)"""
+    # L'id départage l'ordre de parcours pour que le résultat soit déterministe
+    notes_triees = sorted(notes, key=lambda x: (-x['total'], x['id']))
+
+    rangs = {}
+    rang_precedent = 0
+    total_precedent = None
     for idx, note in enumerate(notes_triees, 1):
-        await db.notes.update_one(
-            {"id": note['id']},
-            {"$set": {"rang": idx}}
-        )
+        if note['total'] != total_precedent:
+            rang_precedent = idx
+            total_precedent = note['total']
+        rangs[note['id']] = rang_precedent
+    return rangs
+
+async def ecrire_rangs(ecole: str, rangs_modifies: List[tuple]):
+    """Écrit les paires (note_id, rang) ; un changement de rang est une modification pour la synchronisation"""
+    if rangs_modifies:
+        async with versions_reservees(ecole, len(rangs_modifies)) as version:
+            await db.notes.bulk_write([
+                UpdateOne({"id": note_id}, {"$set": {"rang": rang, **marque_version(version + i)}})
+                for i, (note_id, rang) in enumerate(rangs_modifies)
+            ], ordered=False)
+
+async def reclasser_compositions(composition_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    """Recalcule rangs et statistiques de plusieurs compositions en un nombre fixe de requêtes"""
+    if not composition_ids:
+        return {}
+    notes = await db.notes.find(
+        {"composition_id": {"$in": composition_ids}},
+        {"_id": 0, "id": 1, "composition_id": 1, "eleve_id": 1, "total": 1, "moyenne": 1, "rang": 1,
+         **{m: 1 for m in MATIERES}}
+    ).to_list(None)
+    
+    notes_par_composition = {composition_id: [] for composition_id in composition_ids}
+    for note in notes:
+        notes_par_composition[note['composition_id']].append(note)
+    
+    infos = await infos_compositions(composition_ids)
+    rangs_par_composition = {}
+    rangs_modifies = defaultdict(list)
+    operations_stats = []
+    evenements = []
+    for composition_id, notes_composition in notes_par_composition.items():
+        rangs = attribuer_rangs(notes_composition)
+        rangs_par_composition[composition_id] = rangs
+        # N'écrire que les notes dont le rang a changé
+        diff = {
+            note['id']: rangs[note['id']]
+            for note in notes_composition
+            if note.get('rang') != rangs[note['id']]
+        }
+        if composition_id in infos:
+            rangs_modifies[infos[composition_id]['school_id']] += diff.items()
+        # Les notes sont déjà en mémoire : les statistiques sont matérialisées sans lecture de plus
+        stats = calculer_statistiques(notes_composition)
+        operations_stats.append(ReplaceOne(
+            {"composition_id": composition_id},
+            {"composition_id": composition_id, **stats},
+            upsert=True
+        ))
+        evenements.append({
+            "type": "classement", "composition_id": composition_id, "rangs": diff, "statistiques": stats
+        })
+    
+    for ecole, rangs_ecole in rangs_modifies.items():
+        await ecrire_rangs(ecole, rangs_ecole)
+    await db.statistiques.bulk_write(operations_stats, ordered=False)
+    await mettre_a_jour_progression(notes_par_composition, rangs_par_composition, infos)
+    await invalider_compositions(composition_ids, infos)
+    # Après les écritures : un abonné qui relit les notes voit au moins les rangs annoncés
+    await broker_classements.publier(evenements)
+    return rangs_par_composition
+
+async def calculer_classement(composition_id: str) -> Dict[str, int]:
+    """Recalcule les rangs d'une composition en un seul bulk_write et rafraîchit ses statistiques"""
+    rangs_par_composition = await reclasser_compositions([composition_id])
+    return rangs_par_composition[composition_id]
+
+async def reclasser_note(composition_id: str, note_id: str, ancienne: dict, nouvelle: dict) -> Dict[str, int]:
+    """Reclasse après la modification d'une seule note, sans relire toute la composition.
+
+    Le rang est 1 + le nombre de totaux strictement supérieurs : seules les notes dont le total
+    est compris entre l'ancien et le nouveau total de la note changent de rang. Elles sont relues
+    via l'index (composition_id, total) et leur rang est réécrit en absolu à partir du nombre
+    de notes au-dessus de la fenêtre. `ancienne` et `nouvelle` sont les valeurs de la note
+    (valeurs_note) avant et après la modification. Retourne les rangs de la fenêtre.
+    
+    Coût : la fenêtre des rangs ; les statistiques, exactes (médianes et extrêmes compris),
+    relisent les colonnes notées de la composition sans les réécrire ; la progression ne relit que
+    l'élève modifié, plus la fenêtre de son rang annuel si sa moyenne annuelle change.
+    """
+    bas, haut = sorted((ancienne['total'], nouvelle['total']))
+    au_dessus, fenetre = await asyncio.gather(
+        db.notes.count_documents({"composition_id": composition_id, "total": {"$gt": haut}}),
+        db.notes.find(
+            {"composition_id": composition_id, "total": {"$gte": bas, "$lte": haut}},
+            {"_id": 0, "id": 1, "eleve_id": 1, "total": 1, "moyenne": 1, "rang": 1}
+        ).to_list(None)
+    )
+    note = next((n for n in fenetre if n['id'] == note_id), None)
+    if note is None or note['total'] != nouvelle['total']:
+        # La note a été supprimée ou modifiée depuis : la fenêtre ne suffit plus
+        return await calculer_classement(composition_id)
+    
+    infos = await infos_compositions([composition_id])
+    if composition_id not in infos:
+        # Composition supprimée depuis : ses notes aussi
+        return {}
+    rangs = {nid: au_dessus + rang for nid, rang in attribuer_rangs(fenetre).items()}
+    diff = {n['id']: rangs[n['id']] for n in fenetre if n.get('rang') != rangs[n['id']]}
+    await ecrire_rangs(infos[composition_id]['school_id'], list(diff.items()))
+    stats = await rafraichir_statistiques(composition_id)
+    await reporter_note_progression(composition_id, infos[composition_id], note, rangs, fenetre)
+    await invalider_compositions([composition_id], infos)
+    await broker_classements.publier([{
+        "type": "classement", "composition_id": composition_id, "rangs": diff, "statistiques": stats
+    }])
+    return rangs
+
+# Un bail non libéré (worker arrêté en plein calcul) expire au bout de ce délai
+DUREE_BAIL_CLASSEMENT_S = int(os.environ.get('DUREE_BAIL_CLASSEMENT_S', '30'))
+ATTENTE_BAIL_CLASSEMENT_S = 0.02
+
+@asynccontextmanager
+async def bail_classement(composition_id: str):
+    """Bail par composition dans Mongo : un seul reclassement à la fois, tous workers confondus.
+
+    Les rangs incrémentaux sont absolus et calculés sur une fenêtre : deux calculs concurrents
+    sur des états différents laisseraient des rangs faux que rien ne recalculerait.
+    """
+    detenteur = uuid.uuid4().hex
+    while True:
+        maintenant = datetime.now(timezone.utc)
+        try:
+            # Bail libre ou expiré : on le prend ; détenu ailleurs : l'upsert heurte l'_id existant
+            await db.baux_classement.update_one(
+                {"_id": composition_id, "expire_le": {"$lt": maintenant}},
+                {"$set": {
+                    "detenteur": detenteur, "expire_le": maintenant + timedelta(seconds=DUREE_BAIL_CLASSEMENT_S)
+                }},
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            await asyncio.sleep(ATTENTE_BAIL_CLASSEMENT_S)
+    try:
+        yield
+    finally:
+        await db.baux_classement.delete_one({"_id": composition_id, "detenteur": detenteur})
+
+class PlanificateurClassement:
+    """Regroupe les reclassements demandés pour une même composition.
+
+    Les demandes reçues pendant le délai d'attente déclenchent un seul calcul, et une
+    composition n'a jamais deux calculs en cours : une demande arrivée pendant un calcul
+    en relance un autre juste après. Entre workers, bail_classement donne la même garantie.
+    
+    Une demande peut décrire la modification qui l'a causée, (note_id, ancienne, nouvelle).
+    Si c'est la seule du lot, le reclassement est incrémental ; sinon, ou si l'état des rangs
+    est incertain (écriture pendant un calcul, calcul en échec), il est complet.
+    """
+
+    def __init__(self, delai: float):
+        self.delai = delai
+        self._demandes = set()
+        self._attentes: Dict[str, List[asyncio.Future]] = {}
+        self._taches: Dict[str, asyncio.Task] = {}
+        # Modifications en attente par composition ; None impose un reclassement complet
+        self._deltas: Dict[str, Optional[List[tuple]]] = {}
+        self._en_calcul = set()
+
+    def demander(self, composition_id: str, attendre: bool = True,
+                 delta: Optional[tuple] = None) -> Optional[asyncio.Future]:
+        """Programme un reclassement ; retourne un futur des rangs si l'appelant veut l'attendre"""
+        self._demandes.add(composition_id)
+        if delta is None or composition_id in self._en_calcul:
+            self._deltas[composition_id] = None
+        else:
+            deltas = self._deltas.setdefault(composition_id, [])
+            if deltas is not None:
+                deltas.append(delta)
+        futur = None
+        if attendre:
+            futur = asyncio.get_running_loop().create_future()
+            self._attentes.setdefault(composition_id, []).append(futur)
+        if composition_id not in self._taches:
+            self._taches[composition_id] = asyncio.create_task(self._executer(composition_id))
+        return futur
+
+    async def classer(self, composition_id: str, delta: Optional[tuple] = None) -> Dict[str, int]:
+        """Rangs recalculés ; après un reclassement incrémental, seulement ceux de la fenêtre"""
+        return await self.demander(composition_id, delta=delta)
+
+    async def _executer(self, composition_id: str):
+        try:
+            while composition_id in self._demandes:
+                await asyncio.sleep(self.delai)
+                self._demandes.discard(composition_id)
+                attentes = self._attentes.pop(composition_id, [])
+                deltas = self._deltas.pop(composition_id, None)
+                self._en_calcul.add(composition_id)
+                try:
+                    async with bail_classement(composition_id):
+                        if deltas is not None and len(deltas) == 1:
+                            rangs = await reclasser_note(composition_id, *deltas[0])
+                        else:
+                            rangs = await calculer_classement(composition_id)
+                except Exception as exc:
+                    logger.exception("Échec du reclassement de la composition %s", composition_id)
+                    self._deltas[composition_id] = None
+                    for futur in attentes:
+                        if not futur.done():
+                            futur.set_exception(exc)
+                    continue
+                finally:
+                    self._en_calcul.discard(composition_id)
+                for futur in attentes:
+                    if not futur.done():
+                        futur.set_result(rangs)
+        finally:
+            self._taches.pop(composition_id, None)
+
+    async def vider(self):
+        """Attend la fin des reclassements programmés"""
+        while self._taches:
+            await asyncio.gather(*list(self._taches.values()), return_exceptions=True)
+
+planificateur = PlanificateurClassement(delai=int(os.environ.get('DELAI_CLASSEMENT_MS', '50')) / 1000)
 
 def calculer_observation(moyenne: float) -> str:
     """Détermine l'observation selon la moyenne"""
@@ -138,286 +1132,1119 @@ def calculer_observation(moyenne: float) -> str:
     else:
         return "D"
 
+def valeurs_note(note: dict) -> dict:
+    """Ce qu'une modification de note change pour les rangs et les statistiques de sa composition"""
+    return {champ: note[champ] for champ in (*MATIERES, "total", "moyenne")}
+
+def calculer_resultats(etude_texte: float, aem: float, dictee: float, math: float) -> dict:
+    """Calcule total (/170), moyenne (/10) et observation d'une note"""
+    total = etude_texte + aem + dictee + math
+    moyenne = round((total / 170) * 10, 2)
+    return {
+        "total": total,
+        "moyenne": moyenne,
+        "observation": calculer_observation(moyenne)
+    }
+
 # ========== ROUTES CLASSES ==========
 
 @api_router.post("/classes", response_model=Classe)
-async def creer_classe(classe: ClasseCreate):
-    classe_obj = Classe(**classe.model_dump())
-    doc = classe_obj.model_dump()
-    await db.classes.insert_one(doc)
+async def creer_classe(classe: ClasseCreate, ecole: str = Depends(ecole_courante)):
+    async with versions_reservees(ecole) as version:
+        classe_obj = Classe(**classe.model_dump(), school_id=ecole, **marque_version(version))
+        await db.classes.insert_one(classe_obj.model_dump())
+    metriques.reconnaitre_ecole(ecole)
     return classe_obj
 
 @api_router.get("/classes", response_model=List[Classe])
-async def lister_classes():
-    classes = await db.classes.find({}, {"_id": 0}).to_list(1000)
-    return classes
+async def lister_classes(response: Response, page: Pagination = Depends(), ecole: str = Depends(ecole_courante)):
+    return await lister_documents(db.classes, {"school_id": ecole}, [], page, response, Classe)
 
 @api_router.get("/classes/{classe_id}", response_model=Classe)
-async def obtenir_classe(classe_id: str):
-    classe = await db.classes.find_one({"id": classe_id}, {"_id": 0})
+async def obtenir_classe(classe_id: str, ecole: str = Depends(ecole_courante)):
+    classe = await db.classes.find_one({"id": classe_id, "school_id": ecole}, {"_id": 0})
     if not classe:
         raise HTTPException(status_code=404, detail="Classe non trouvée")
     return classe
 
 @api_router.put("/classes/{classe_id}", response_model=Classe)
-async def modifier_classe(classe_id: str, classe: ClasseCreate):
-    result = await db.classes.update_one(
-        {"id": classe_id},
-        {"$set": classe.model_dump()}
-    )
-    if result.matched_count == 0:
+async def modifier_classe(classe_id: str, classe: ClasseCreate, ecole: str = Depends(ecole_courante)):
+    async with versions_reservees(ecole) as version:
+        modification = {**classe.model_dump(), **marque_version(version)}
+        classe_precedente = await db.classes.find_one_and_update(
+            {"id": classe_id, "school_id": ecole},
+            {"$set": modification},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+    if classe_precedente is None:
         raise HTTPException(status_code=404, detail="Classe non trouvée")
-    classe_modifiee = await db.classes.find_one({"id": classe_id}, {"_id": 0})
-    return classe_modifiee
+    # Le nom, le niveau et l'année filtrent ou s'affichent dans les classements
+    if any(classe_precedente[champ] != getattr(classe, champ) for champ in ("nom", "niveau", "annee_scolaire")):
+        await invalider([portee_ecole(ecole, "classements")])
+    return {**classe_precedente, **modification}
 
 @api_router.delete("/classes/{classe_id}")
-async def supprimer_classe(classe_id: str):
-    result = await db.classes.delete_one({"id": classe_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Classe non trouvée")
-    # Supprimer aussi les élèves, compositions et notes associés
-    await db.eleves.delete_many({"classe_id": classe_id})
-    compositions = await db.compositions.find({"classe_id": classe_id}, {"_id": 0}).to_list(1000)
-    for comp in compositions:
-        await db.notes.delete_many({"composition_id": comp['id']})
-    await db.compositions.delete_many({"classe_id": classe_id})
-    return {"message": "Classe supprimée avec succès"}
+async def supprimer_classe(classe_id: str, ecole: str = Depends(ecole_courante)):
+    async with versions_reservees(ecole) as version, session_transaction() as session:
+        result = await db.classes.delete_one({"id": classe_id, "school_id": ecole}, session=session)
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Classe non trouvée")
+        # La pierre tombale de la classe vaut pour tout son contenu
+        await db.suppressions.insert_one(
+            pierre_tombale("classes", classe_id, classe_id, ecole, version), session=session
+        )
+        # Supprimer aussi les élèves, compositions, notes, statistiques et progressions associés
+        composition_ids = await db.compositions.distinct("id", {"classe_id": classe_id}, session=session)
+        notes = await db.notes.delete_many({"composition_id": {"$in": composition_ids}}, session=session)
+        stats = await db.statistiques.delete_many({"composition_id": {"$in": composition_ids}}, session=session)
+        compositions = await db.compositions.delete_many({"classe_id": classe_id}, session=session)
+        eleves = await db.eleves.delete_many({"classe_id": classe_id}, session=session)
+        progression = await db.progression.delete_many({"classe_id": classe_id}, session=session)
+    
+    await invalider(
+        [f"classe:{classe_id}", portee_ecole(ecole, "classements")] + [f"composition:{cid}" for cid in composition_ids]
+    )
+    return {
+        "message": "Classe supprimée avec succès",
+        "supprimes": {
+            "classes": result.deleted_count,
+            "eleves": eleves.deleted_count,
+            "compositions": compositions.deleted_count,
+            "notes": notes.deleted_count,
+            "statistiques": stats.deleted_count,
+            "progression": progression.deleted_count
+        }
+    }
 
 # ========== ROUTES ÉLÈVES ==========
 
 @api_router.post("/eleves", response_model=Eleve)
-async def creer_eleve(eleve: EleveCreate):
-    eleve_obj = Eleve(**eleve.model_dump())
-    doc = eleve_obj.model_dump()
-    await db.eleves.insert_one(doc)
+async def creer_eleve(eleve: EleveCreate, ecole: str = Depends(ecole_courante)):
+    await verifier_classe(eleve.classe_id, ecole)
+    async with versions_reservees(ecole) as version:
+        eleve_obj = Eleve(**eleve.model_dump(), school_id=ecole, **marque_version(version))
+        await db.eleves.insert_one(eleve_obj.model_dump())
+    await invalider([f"classe:{eleve_obj.classe_id}"])
     return eleve_obj
 
+# Import d'une liste d'élèves (CSV ou XLSX)
+
+TAILLE_LOT_IMPORT = 500
+SEPARATEURS_CSV = ";,\t"
+# En-têtes acceptés, comparés sans accents, casse ni soulignés
+COLONNES_IMPORT = {
+    "nom": "nom",
+    "prenom": "prenom", "prenoms": "prenom",
+    "classe id": "classe_id", "classe": "classe",
+    "date naissance": "date_naissance", "date de naissance": "date_naissance", "ne le": "date_naissance",
+}
+
+class CsvPointVirgule(csv.excel):
+    delimiter = ";"
+
+def normaliser_entete(entete) -> Optional[str]:
+    texte = unicodedata.normalize("NFKD", str(entete or "")).encode("ascii", "ignore").decode()
+    return COLONNES_IMPORT.get(" ".join(texte.replace("_", " ").lower().split()))
+
+def valeur_import(valeur) -> Optional[str]:
+    if valeur is None:
+        return None
+    if isinstance(valeur, datetime):
+        return valeur.date().isoformat()
+    if hasattr(valeur, "isoformat"):
+        return valeur.isoformat()
+    if isinstance(valeur, float) and valeur.is_integer():
+        valeur = int(valeur)
+    return str(valeur).strip() or None
+
+def lignes_csv(fichier):
+    """Lit le CSV ligne à ligne ; le séparateur est deviné sur le début du fichier"""
+    texte = io.TextIOWrapper(fichier, encoding="utf-8-sig", newline="")
+    echantillon = texte.read(4096)
+    texte.seek(0)
+    try:
+        dialecte = csv.Sniffer().sniff(echantillon, delimiters=SEPARATEURS_CSV)
+    except csv.Error:
+        dialecte = CsvPointVirgule
+    try:
+        yield from csv.reader(texte, dialecte)
+    finally:
+        texte.detach()
+
+def lignes_xlsx(fichier):
+    from openpyxl import load_workbook
+    
+    classeur = load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        yield from classeur.active.iter_rows(values_only=True)
+    finally:
+        classeur.close()
+
+def lire_import(fichier, xlsx: bool, classe_id: Optional[str]):
+    """Valide chaque ligne contre EleveCreate : (élèves valides avec leur n° de ligne, erreurs par ligne, nb de lignes)"""
+    valides, erreurs, nb_lignes = [], [], 0
+    lignes = lignes_xlsx(fichier) if xlsx else lignes_csv(fichier)
+    try:
+        entetes = [normaliser_entete(entete) for entete in next(lignes, [])]
+        if "nom" not in entetes or "prenom" not in entetes:
+            raise ValueError("Colonnes « nom » et « prenom » obligatoires")
+        if classe_id is None and "classe_id" not in entetes and "classe" not in entetes:
+            raise ValueError("Colonne « classe_id » ou « classe » obligatoire sans classe_id dans la requête")
+        
+        # La ligne 1 est l'en-tête
+        for numero, ligne in enumerate(lignes, start=2):
+            valeurs = {
+                champ: valeur_import(valeur)
+                for champ, valeur in zip(entetes, ligne)
+                if champ is not None
+            }
+            if not any(valeurs.values()):
+                continue
+            nb_lignes += 1
+            # La classe de la requête l'emporte ; sinon un nom de classe est résolu par importer_eleves
+            nom_classe = valeurs.pop("classe", None)
+            if classe_id is not None:
+                valeurs["classe_id"] = classe_id
+            elif not valeurs.get("classe_id") and nom_classe:
+                valeurs["classe_id"] = nom_classe
+            try:
+                valides.append((numero, EleveCreate(**valeurs)))
+            except ValidationError as e:
+                erreurs.append({
+                    "ligne": numero,
+                    "erreurs": [f"{'.'.join(map(str, err['loc']))} : {err['msg']}" for err in e.errors()]
+                })
+    finally:
+        lignes.close()
+    return valides, erreurs, nb_lignes
+
+def cle_eleve(eleve) -> tuple:
+    """Clé de dédoublonnage : même nom, prénom, classe et date de naissance, sans tenir compte de la casse"""
+    return (
+        eleve['nom'].strip().casefold(),
+        eleve['prenom'].strip().casefold(),
+        eleve['classe_id'],
+        eleve.get('date_naissance') or None,
+    )
+
+@api_router.post("/eleves/import")
+async def importer_eleves(fichier: UploadFile = File(...), classe_id: Optional[str] = None,
+                          ecole: str = Depends(ecole_courante)):
+    """Inscrit une liste d'élèves en lots, avec un rapport d'erreurs ligne par ligne"""
+    xlsx = (fichier.filename or "").lower().endswith(".xlsx")
+    try:
+        valides, erreurs, nb_lignes = await asyncio.to_thread(lire_import, fichier.file, xlsx, classe_id)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Fichier illisible : {e}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Fichier illisible : {type(e).__name__}")
+    
+    # Colonne classe : un id, ou le nom ou le niveau d'une seule classe de l'école
+    classes = await db.classes.find({"school_id": ecole}, {"_id": 0, "id": 1, "nom": 1, "niveau": 1}).to_list(None)
+    designations: Dict[str, set] = {}
+    for classe in classes:
+        for nom in {classe['nom'], classe['niveau']}:
+            designations.setdefault(nom.strip().casefold(), set()).add(classe['id'])
+    ids_connus = {classe['id'] for classe in classes}
+    resolues = {
+        reference: {reference} if reference in ids_connus else designations.get(reference.strip().casefold(), set())
+        for reference in {eleve.classe_id for _, eleve in valides}
+    }
+    
+    classe_ids = sorted({next(iter(ids)) for ids in resolues.values() if len(ids) == 1})
+    existants = await db.eleves.find(
+        {"classe_id": {"$in": classe_ids}, "school_id": ecole},
+        {"_id": 0, "nom": 1, "prenom": 1, "classe_id": 1, "date_naissance": 1}
+    ).to_list(None)
+    deja_vus = {cle_eleve(eleve): None for eleve in existants}
+    
+    doublons, a_inserer = [], []
+    for numero, eleve in valides:
+        ids = resolues[eleve.classe_id]
+        if not ids:
+            erreurs.append({"ligne": numero, "erreurs": [f"classe_id : classe {eleve.classe_id} inconnue"]})
+            continue
+        if len(ids) > 1:
+            erreurs.append({"ligne": numero, "erreurs": [f"classe : « {eleve.classe_id} » désigne plusieurs classes"]})
+            continue
+        eleve.classe_id = next(iter(ids))
+        doc = Eleve(**eleve.model_dump(), school_id=ecole).model_dump()
+        cle = cle_eleve(doc)
+        if cle in deja_vus:
+            origine = deja_vus[cle]
+            doublons.append({"ligne": numero, "doublon_de": f"ligne {origine}" if origine else "élève déjà inscrit"})
+            continue
+        deja_vus[cle] = numero
+        a_inserer.append((numero, doc))
+    
+    inseres = 0
+    async with versions_reservees(ecole, len(a_inserer)) as version:
+        for i, (_, doc) in enumerate(a_inserer):
+            doc.update(marque_version(version + i))
+        for debut in range(0, len(a_inserer), TAILLE_LOT_IMPORT):
+            lot = a_inserer[debut:debut + TAILLE_LOT_IMPORT]
+            try:
+                resultat = await db.eleves.insert_many([doc for _, doc in lot], ordered=False)
+                inseres += len(resultat.inserted_ids)
+            except BulkWriteError as e:
+                echecs = e.details.get("writeErrors", [])
+                inseres += len(lot) - len(echecs)
+                erreurs += [
+                    {"ligne": lot[echec['index']][0], "erreurs": [echec.get('errmsg', "insertion refusée")]}
+                    for echec in echecs
+                ]
+    
+    if inseres:
+        await invalider([f"classe:{cid}" for cid in {doc['classe_id'] for _, doc in a_inserer}])
+    
+    erreurs.sort(key=lambda erreur: erreur['ligne'])
+    return {
+        "lignes": nb_lignes,
+        "inseres": inseres,
+        "doublons": doublons,
+        "erreurs": erreurs
+    }
+
 @api_router.get("/eleves", response_model=List[Eleve])
-async def lister_eleves(classe_id: Optional[str] = None):
-    query = {"classe_id": classe_id} if classe_id else {}
-    eleves = await db.eleves.find(query, {"_id": 0}).to_list(1000)
-    return eleves
+async def lister_eleves(request: Request, response: Response, classe_id: Optional[str] = None,
+                        page: Pagination = Depends(), ecole: str = Depends(ecole_courante)):
+    if not classe_id:
+        return await lister_documents(db.eleves, {"school_id": ecole}, [], page, response, Eleve)
+    
+    async def produire(entetes):
+        await verifier_classe(classe_id, ecole)
+        return await lister_documents(db.eleves, {"classe_id": classe_id}, [], page, entetes, Eleve)
+    
+    return await reponse_en_cache(request, ecole, [f"classe:{classe_id}"], produire, List[Eleve])
 
 @api_router.get("/eleves/{eleve_id}", response_model=Eleve)
-async def obtenir_eleve(eleve_id: str):
-    eleve = await db.eleves.find_one({"id": eleve_id}, {"_id": 0})
+async def obtenir_eleve(eleve_id: str, ecole: str = Depends(ecole_courante)):
+    eleve = await db.eleves.find_one({"id": eleve_id, "school_id": ecole}, {"_id": 0})
     if not eleve:
         raise HTTPException(status_code=404, detail="Élève non trouvé")
     return eleve
 
 @api_router.put("/eleves/{eleve_id}", response_model=Eleve)
-async def modifier_eleve(eleve_id: str, eleve: EleveCreate):
-    result = await db.eleves.update_one(
-        {"id": eleve_id},
-        {"$set": eleve.model_dump()}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Élève non trouvé")
-    eleve_modifie = await db.eleves.find_one({"id": eleve_id}, {"_id": 0})
-    return eleve_modifie
+async def modifier_eleve(eleve_id: str, eleve: EleveCreate, ecole: str = Depends(ecole_courante)):
+    await verifier_classe(eleve.classe_id, ecole)
+    # L'état précédent donne l'ancienne classe, à invalider si l'élève en change
+    async with versions_reservees(ecole) as version:
+        modification = {**eleve.model_dump(), **marque_version(version)}
+        eleve_precedent = await db.eleves.find_one_and_update(
+            {"id": eleve_id, "school_id": ecole},
+            {"$set": modification},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+        if eleve_precedent is None:
+            raise HTTPException(status_code=404, detail="Élève non trouvé")
+        if eleve_precedent['classe_id'] != eleve.classe_id:
+            # Pour les clients synchronisant l'ancienne classe, l'élève en sort
+            await db.suppressions.insert_one(
+                pierre_tombale("eleves", eleve_id, eleve_precedent['classe_id'], ecole, version)
+            )
+    await invalider([
+        f"classe:{eleve_precedent['classe_id']}", f"classe:{eleve.classe_id}", portee_ecole(ecole, "classements")
+    ])
+    return {**eleve_precedent, **modification}
 
 @api_router.delete("/eleves/{eleve_id}")
-async def supprimer_eleve(eleve_id: str):
-    result = await db.eleves.delete_one({"id": eleve_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Élève non trouvé")
-    # Supprimer aussi les notes associées
-    await db.notes.delete_many({"eleve_id": eleve_id})
-    return {"message": "Élève supprimé avec succès"}
+async def supprimer_eleve(eleve_id: str, ecole: str = Depends(ecole_courante)):
+    async with versions_reservees(ecole) as version, session_transaction() as session:
+        eleve = await db.eleves.find_one_and_delete(
+            {"id": eleve_id, "school_id": ecole}, projection={"_id": 0, "classe_id": 1}, session=session
+        )
+        if eleve is None:
+            raise HTTPException(status_code=404, detail="Élève non trouvé")
+        await db.suppressions.insert_one(
+            pierre_tombale("eleves", eleve_id, eleve['classe_id'], ecole, version), session=session
+        )
+        # Supprimer aussi les notes associées
+        composition_ids = await db.notes.distinct("composition_id", {"eleve_id": eleve_id}, session=session)
+        notes = await db.notes.delete_many({"eleve_id": eleve_id}, session=session)
+    
+    # Les rangs des compositions concernées ont changé ; le planificateur évite un calcul concurrent
+    await asyncio.gather(*(planificateur.classer(composition_id) for composition_id in composition_ids))
+    await invalider([f"classe:{eleve['classe_id']}", portee_ecole(ecole, "classements")])
+    
+    return {
+        "message": "Élève supprimé avec succès",
+        "supprimes": {"eleves": 1, "notes": notes.deleted_count}
+    }
 
 # ========== ROUTES COMPOSITIONS ==========
 
 @api_router.post("/compositions", response_model=Composition)
-async def creer_composition(composition: CompositionCreate):
-    composition_obj = Composition(**composition.model_dump())
-    doc = composition_obj.model_dump()
-    await db.compositions.insert_one(doc)
+async def creer_composition(composition: CompositionCreate, ecole: str = Depends(ecole_courante)):
+    await verifier_classe(composition.classe_id, ecole)
+    async with versions_reservees(ecole) as version:
+        composition_obj = Composition(**composition.model_dump(), school_id=ecole, **marque_version(version))
+        await db.compositions.insert_one(composition_obj.model_dump())
+    await invalider([f"classe:{composition_obj.classe_id}"])
     return composition_obj
 
 @api_router.get("/compositions", response_model=List[Composition])
-async def lister_compositions(classe_id: Optional[str] = None):
-    query = {"classe_id": classe_id} if classe_id else {}
-    compositions = await db.compositions.find(query, {"_id": 0}).to_list(1000)
+async def lister_compositions(request: Request, response: Response, classe_id: Optional[str] = None,
+                              page: Pagination = Depends(), ecole: str = Depends(ecole_courante)):
     # Trier par numéro
-    compositions_triees = sorted(compositions, key=lambda x: x['numero'])
-    return compositions_triees
+    if not classe_id:
+        return await lister_documents(
+            db.compositions, {"school_id": ecole}, [("numero", 1)], page, response, Composition
+        )
+    
+    async def produire(entetes):
+        await verifier_classe(classe_id, ecole)
+        return await lister_documents(
+            db.compositions, {"classe_id": classe_id}, [("numero", 1)], page, entetes, Composition
+        )
+    
+    return await reponse_en_cache(request, ecole, [f"classe:{classe_id}"], produire, List[Composition])
 
 @api_router.get("/compositions/{composition_id}", response_model=Composition)
-async def obtenir_composition(composition_id: str):
-    composition = await db.compositions.find_one({"id": composition_id}, {"_id": 0})
+async def obtenir_composition(composition_id: str, ecole: str = Depends(ecole_courante)):
+    composition = await db.compositions.find_one({"id": composition_id, "school_id": ecole}, {"_id": 0})
     if not composition:
         raise HTTPException(status_code=404, detail="Composition non trouvée")
     return composition
 
 @api_router.put("/compositions/{composition_id}", response_model=Composition)
-async def modifier_composition(composition_id: str, composition: CompositionCreate):
-    result = await db.compositions.update_one(
-        {"id": composition_id},
-        {"$set": composition.model_dump()}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Composition non trouvée")
-    composition_modifiee = await db.compositions.find_one({"id": composition_id}, {"_id": 0})
-    return composition_modifiee
+async def modifier_composition(composition_id: str, composition: CompositionCreate,
+                               ecole: str = Depends(ecole_courante)):
+    await verifier_classe(composition.classe_id, ecole)
+    # L'état précédent donne l'ancienne classe, à invalider si la composition en change
+    async with versions_reservees(ecole) as version:
+        modification = {**composition.model_dump(), **marque_version(version)}
+        composition_precedente = await db.compositions.find_one_and_update(
+            {"id": composition_id, "school_id": ecole},
+            {"$set": modification},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+        if composition_precedente is None:
+            raise HTTPException(status_code=404, detail="Composition non trouvée")
+        if composition_precedente['classe_id'] != composition.classe_id:
+            await db.suppressions.insert_one(
+                pierre_tombale("compositions", composition_id, composition_precedente['classe_id'], ecole, version)
+            )
+    if (composition_precedente['classe_id'], composition_precedente['numero']) != (composition.classe_id, composition.numero):
+        await reconstruire_progression(sorted({composition_precedente['classe_id'], composition.classe_id}))
+    await invalider([
+        f"composition:{composition_id}",
+        f"classe:{composition_precedente['classe_id']}",
+        f"classe:{composition.classe_id}",
+        portee_ecole(ecole, "classements")
+    ])
+    return {**composition_precedente, **modification}
 
 @api_router.delete("/compositions/{composition_id}")
-async def supprimer_composition(composition_id: str):
-    result = await db.compositions.delete_one({"id": composition_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Composition non trouvée")
-    # Supprimer aussi les notes associées
-    await db.notes.delete_many({"composition_id": composition_id})
-    return {"message": "Composition supprimée avec succès"}
+async def supprimer_composition(composition_id: str, ecole: str = Depends(ecole_courante)):
+    async with versions_reservees(ecole) as version, session_transaction() as session:
+        composition = await db.compositions.find_one_and_delete(
+            {"id": composition_id, "school_id": ecole}, projection={"_id": 0, "classe_id": 1}, session=session
+        )
+        if composition is None:
+            raise HTTPException(status_code=404, detail="Composition non trouvée")
+        await db.suppressions.insert_one(
+            pierre_tombale("compositions", composition_id, composition['classe_id'], ecole, version),
+            session=session
+        )
+        # Supprimer aussi les notes et statistiques associées
+        notes = await db.notes.delete_many({"composition_id": composition_id}, session=session)
+        stats = await db.statistiques.delete_many({"composition_id": composition_id}, session=session)
+    
+    await reconstruire_progression([composition['classe_id']])
+    await invalider([
+        f"composition:{composition_id}", f"classe:{composition['classe_id']}", portee_ecole(ecole, "classements")
+    ])
+    return {
+        "message": "Composition supprimée avec succès",
+        "supprimes": {
+            "compositions": 1,
+            "notes": notes.deleted_count,
+            "statistiques": stats.deleted_count
+        }
+    }
 
 # ========== ROUTES NOTES ==========
 
 @api_router.post("/notes", response_model=Note)
-async def creer_note(note_input: NoteCreate):
-    # Calculer total et moyenne
-    total = note_input.etude_texte + note_input.aem + note_input.dictee + note_input.math
-    moyenne = round((total / 170) * 10, 2)
-    observation = calculer_observation(moyenne)
-    
-    note_obj = Note(
-        **note_input.model_dump(),
-        total=total,
-        moyenne=moyenne,
-        rang=999,  # Sera recalculé
-        observation=observation
+async def creer_note(note_input: NoteCreate, attendre_rang: bool = True, ecole: str = Depends(ecole_courante)):
+    infos = await verifier_composition(note_input.composition_id, ecole)
+    if not await db.eleves.find_one({"id": note_input.eleve_id, "classe_id": infos['classe_id']}, {"_id": 0, "id": 1}):
+        raise HTTPException(status_code=404, detail="Élève non trouvé dans la classe de cette composition")
+    # Calculer total, moyenne et observation
+    resultats = calculer_resultats(
+        note_input.etude_texte, note_input.aem, note_input.dictee, note_input.math
     )
     
-    doc = note_obj.model_dump()
-    await db.notes.insert_one(doc)
+    async with versions_reservees(ecole) as version:
+        note_obj = Note(
+            **note_input.model_dump(),
+            **resultats,
+            **marque_version(version),
+            school_id=ecole,
+            rang=999  # Sera recalculé
+        )
+        
+        doc = note_obj.model_dump()
+        try:
+            await db.notes.insert_one(doc)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=409,
+                detail="Une note existe déjà pour cet élève dans cette composition"
+            )
+    
+    # Recalculer les rangs, qui donnent directement celui de la nouvelle note
+    if not attendre_rang:
+        planificateur.demander(note_input.composition_id, attendre=False)
+        note_obj.rang_en_attente = True
+        return note_obj
+    rangs = await planificateur.classer(note_input.composition_id)
+    note_obj.rang = rangs.get(note_obj.id, note_obj.rang)
+    return note_obj
+
+@api_router.post("/notes/batch", response_model=List[Note])
+async def enregistrer_notes(batch: NotesBatch, attendre_rang: bool = True, ecole: str = Depends(ecole_courante)):
+    """Crée ou met à jour les notes de toute une composition puis reclasse une seule fois"""
+    composition = await verifier_composition(batch.composition_id, ecole)
     
-    # Recalculer les rangs
-    await calculer_classement(note_input.composition_id)
+    eleve_ids = [ligne.eleve_id for ligne in batch.notes]
+    if len(set(eleve_ids)) != len(eleve_ids):
+        raise HTTPException(status_code=400, detail="Un élève apparaît plusieurs fois dans la saisie")
+    
+    if eleve_ids:
+        # Tous les élèves doivent appartenir à la classe de la composition
+        eleves = await db.eleves.find(
+            {"id": {"$in": eleve_ids}, "classe_id": composition['classe_id']},
+            {"_id": 0, "id": 1}
+        ).to_list(None)
+        inconnus = set(eleve_ids) - {eleve['id'] for eleve in eleves}
+        if inconnus:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Élèves inconnus dans cette classe: {', '.join(sorted(inconnus))}"
+            )
+        
+        async with versions_reservees(ecole, len(batch.notes)) as version:
+            operations = [
+                UpdateOne(
+                    {"composition_id": batch.composition_id, "eleve_id": ligne.eleve_id},
+                    {
+                        "$set": {
+                            **ligne.model_dump(exclude={"eleve_id"}),
+                            **calculer_resultats(ligne.etude_texte, ligne.aem, ligne.dictee, ligne.math),
+                            **marque_version(version + i)
+                        },
+                        "$setOnInsert": {"id": str(uuid.uuid4()), "rang": 999, "school_id": ecole}
+                    },
+                    upsert=True
+                )
+                for i, ligne in enumerate(batch.notes)
+            ]
+            await db.notes.bulk_write(operations, ordered=False)
+        
+        # Un seul reclassement pour toute la saisie
+        if attendre_rang:
+            await planificateur.classer(batch.composition_id)
+        else:
+            planificateur.demander(batch.composition_id, attendre=False)
+    
+    notes = await db.notes.find(
+        {"composition_id": batch.composition_id}, {"_id": 0}
+    ).sort("rang", 1).to_list(None)
+    if eleve_ids and not attendre_rang:
+        for note in notes:
+            note['rang_en_attente'] = True
+    return notes
+
+def empreinte_requete(*parties) -> str:
+    """Empreinte de la cible et du corps : une clé réutilisée pour une autre saisie est refusée"""
+    return hashlib.sha256(orjson.dumps(parties, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+@api_router.put("/compositions/{composition_id}/eleves/{eleve_id}/note", response_model=Note)
+async def saisir_note(
+    composition_id: str,
+    eleve_id: str,
+    note_update: NoteUpdate,
+    attendre_rang: bool = True,
+    cle_idempotence: Optional[str] = Header(None, alias="Idempotency-Key", max_length=200),
+    ecole: str = Depends(ecole_courante)
+):
+    """Crée ou remplace la note d'un élève pour une composition.
+
+    Rejouer la requête ne crée jamais de doublon. Avec `Idempotency-Key`, un nouvel essai après
+    un délai dépassé renvoie la réponse de la première requête sans rien réécrire.
+    """
+    empreinte = None
+    if cle_idempotence:
+        # Deux écoles peuvent choisir la même clé
+        cle_idempotence = f"{ecole}:{cle_idempotence}"
+        empreinte = empreinte_requete(composition_id, eleve_id, note_update.model_dump())
+        deja_traitee = await db.idempotence.find_one({"_id": cle_idempotence})
+        if deja_traitee:
+            if deja_traitee['empreinte'] != empreinte:
+                raise HTTPException(
+                    status_code=422, detail="Clé d'idempotence déjà utilisée pour une autre saisie"
+                )
+            return deja_traitee['reponse']
+    
+    infos = await verifier_composition(composition_id, ecole)
+    if not await db.eleves.find_one({"id": eleve_id, "classe_id": infos['classe_id']}, {"_id": 0, "id": 1}):
+        raise HTTPException(status_code=404, detail="Élève non trouvé dans la classe de cette composition")
+    
+    resultats = calculer_resultats(
+        note_update.etude_texte, note_update.aem, note_update.dictee, note_update.math
+    )
+    modifications = {**note_update.model_dump(), **resultats}
+    creation = {"id": str(uuid.uuid4()), "rang": 999, "school_id": ecole}
+    async with versions_reservees(ecole) as version:
+        ancienne = await db.notes.find_one_and_update(
+            {"composition_id": composition_id, "eleve_id": eleve_id},
+            {"$set": {**modifications, **marque_version(version)}, "$setOnInsert": creation},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    if ancienne is None:
+        note = {"composition_id": composition_id, "eleve_id": eleve_id, **creation, **modifications,
+                **marque_version(version)}
+        delta = None
+    else:
+        note = {**ancienne, **modifications, **marque_version(version)}
+        delta = (note['id'], valeurs_note(ancienne), valeurs_note(note))
+    
+    if attendre_rang:
+        rangs = await planificateur.classer(composition_id, delta=delta)
+        note['rang'] = rangs.get(note['id'], note['rang'])
+    else:
+        planificateur.demander(composition_id, attendre=False, delta=delta)
+        note['rang_en_attente'] = True
     
-    # Récupérer la note avec le rang mis à jour
-    note_maj = await db.notes.find_one({"id": note_obj.id}, {"_id": 0})
-    return note_maj
+    if cle_idempotence:
+        reponse = jsonable_encoder(Note(**note))
+        try:
+            await db.idempotence.insert_one({
+                "_id": cle_idempotence, "empreinte": empreinte, "reponse": reponse,
+                "cree_le": datetime.now(timezone.utc)
+            })
+        except DuplicateKeyError:
+            # Deux essais simultanés : l'upsert est le même, la première réponse enregistrée reste
+            pass
+    return note
 
 @api_router.get("/notes", response_model=List[Note])
-async def lister_notes(composition_id: Optional[str] = None, eleve_id: Optional[str] = None):
+async def lister_notes(
+    request: Request,
+    response: Response,
+    composition_id: Optional[str] = None,
+    eleve_id: Optional[str] = None,
+    page: Pagination = Depends(),
+    ecole: str = Depends(ecole_courante)
+):
     query = {}
     if composition_id:
         query["composition_id"] = composition_id
+    else:
+        query["school_id"] = ecole
     if eleve_id:
         query["eleve_id"] = eleve_id
     
-    notes = await db.notes.find(query, {"_id": 0}).to_list(1000)
     # Trier par rang
-    notes_triees = sorted(notes, key=lambda x: x['rang'])
-    return notes_triees
+    if not composition_id:
+        return await lister_documents(db.notes, query, [("rang", 1)], page, response, Note)
+    
+    async def produire(entetes):
+        await verifier_composition(composition_id, ecole)
+        return await lister_documents(db.notes, query, [("rang", 1)], page, entetes, Note)
+    
+    return await reponse_en_cache(request, ecole, [f"composition:{composition_id}"], produire, List[Note])
 
 @api_router.get("/notes/{note_id}", response_model=Note)
-async def obtenir_note(note_id: str):
-    note = await db.notes.find_one({"id": note_id}, {"_id": 0})
+async def obtenir_note(note_id: str, ecole: str = Depends(ecole_courante)):
+    note = await db.notes.find_one({"id": note_id, "school_id": ecole}, {"_id": 0})
     if not note:
         raise HTTPException(status_code=404, detail="Note non trouvée")
     return note
 
 @api_router.put("/notes/{note_id}", response_model=Note)
-async def modifier_note(note_id: str, note_update: NoteUpdate):
-    # Recalculer total et moyenne
-    total = note_update.etude_texte + note_update.aem + note_update.dictee + note_update.math
-    moyenne = round((total / 170) * 10, 2)
-    observation = calculer_observation(moyenne)
-    
-    result = await db.notes.update_one(
-        {"id": note_id},
-        {"$set": {
-            **note_update.model_dump(),
-            "total": total,
-            "moyenne": moyenne,
-            "observation": observation
-        }}
+async def modifier_note(note_id: str, note_update: NoteUpdate, attendre_rang: bool = True,
+                        ecole: str = Depends(ecole_courante)):
+    # Recalculer total, moyenne et observation
+    resultats = calculer_resultats(
+        note_update.etude_texte, note_update.aem, note_update.dictee, note_update.math
     )
     
-    if result.matched_count == 0:
+    modifications = {**note_update.model_dump(), **resultats}
+    async with versions_reservees(ecole) as version:
+        # L'ancienne note délimite la fenêtre des rangs à réécrire et donne la différence des statistiques
+        ancienne = await db.notes.find_one_and_update(
+            {"id": note_id, "school_id": ecole},
+            {"$set": {**modifications, **marque_version(version)}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+    if ancienne is None:
         raise HTTPException(status_code=404, detail="Note non trouvée")
+    note_modifiee = {**ancienne, **modifications, **marque_version(version)}
+    delta = (note_id, valeurs_note(ancienne), valeurs_note(note_modifiee))
     
-    # Récupérer composition_id pour recalculer les rangs
-    note = await db.notes.find_one({"id": note_id}, {"_id": 0})
-    await calculer_classement(note['composition_id'])
-    
-    note_modifiee = await db.notes.find_one({"id": note_id}, {"_id": 0})
+    # Le reclassement fournit le nouveau rang sans relire la note
+    if not attendre_rang:
+        planificateur.demander(note_modifiee['composition_id'], attendre=False, delta=delta)
+        note_modifiee['rang_en_attente'] = True
+        return note_modifiee
+    rangs = await planificateur.classer(note_modifiee['composition_id'], delta=delta)
+    note_modifiee['rang'] = rangs.get(note_id, note_modifiee['rang'])
     return note_modifiee
 
 @api_router.delete("/notes/{note_id}")
-async def supprimer_note(note_id: str):
-    note = await db.notes.find_one({"id": note_id}, {"_id": 0})
-    if not note:
-        raise HTTPException(status_code=404, detail="Note non trouvée")
-    
-    composition_id = note['composition_id']
-    await db.notes.delete_one({"id": note_id})
+async def supprimer_note(note_id: str, attendre_rang: bool = True, ecole: str = Depends(ecole_courante)):
+    async with versions_reservees(ecole) as version:
+        note = await db.notes.find_one_and_delete(
+            {"id": note_id, "school_id": ecole}, projection={"_id": 0, "composition_id": 1}
+        )
+        if not note:
+            raise HTTPException(status_code=404, detail="Note non trouvée")
+        composition_id = note['composition_id']
+        classe_id = (await classes_des_compositions([composition_id])).get(composition_id)
+        await db.suppressions.insert_one(pierre_tombale("notes", note_id, classe_id, ecole, version))
     
     # Recalculer les rangs
-    await calculer_classement(composition_id)
+    if attendre_rang:
+        await planificateur.classer(composition_id)
+    else:
+        planificateur.demander(composition_id, attendre=False)
     
-    return {"message": "Note supprimée avec succès"}
+    return {"message": "Note supprimée avec succès", "rang_en_attente": not attendre_rang}
 
 # ========== STATISTIQUES ==========
 
+async def lire_statistiques(composition_id: str) -> dict:
+    """Lit les statistiques matérialisées à chaque reclassement de la composition"""
+    stats = await db.statistiques.find_one(
+        {"composition_id": composition_id}, {"_id": 0, "composition_id": 0}
+    )
+    if stats is None:
+        # Composition sans statistiques matérialisées (données antérieures) : on les construit
+        stats = await rafraichir_statistiques(composition_id)
+    
+    return stats
+
 @api_router.get("/statistiques/{composition_id}")
-async def obtenir_statistiques(composition_id: str):
-    notes = await db.notes.find({"composition_id": composition_id}, {"_id": 0}).to_list(1000)
+async def obtenir_statistiques(request: Request, composition_id: str, ecole: str = Depends(ecole_courante)):
+    async def produire(entetes):
+        await verifier_composition(composition_id, ecole)
+        return await lire_statistiques(composition_id)
     
-    effectif = len(notes)
-    presents = effectif  # Par défaut tous présents
-    absents = 0
-    admis = sum(1 for n in notes if n['moyenne'] >= 5.0)
-    pourcentage_reussite = round((admis / effectif * 100), 2) if effectif > 0 else 0
+    return await reponse_en_cache(request, ecole, [f"composition:{composition_id}"], produire)
+
+# ========== DISTRIBUTIONS (NUMPY) ==========
+
+# Colonnes de la matrice des notes et note maximale de chacune
+COLONNES_NOTES = (*MATIERES, "total", "moyenne")
+BAREMES = np.array([50, 50, 20, 50, 170, 10], dtype=float)
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+NB_CLASSES_HISTOGRAMME = 10
+
+def matrice_notes(notes: List[dict]) -> np.ndarray:
+    """Notes en colonnes (etude_texte, aem, dictee, math, total, moyenne), une ligne par élève"""
+    return np.fromiter(
+        chain.from_iterable((note[colonne] for colonne in COLONNES_NOTES) for note in notes),
+        dtype=float, count=len(notes) * len(COLONNES_NOTES)
+    ).reshape(len(notes), len(COLONNES_NOTES))
+
+def arrondir(valeurs: np.ndarray) -> list:
+    """Arrondi JSON : les NaN (écart-type ou corrélation indéfinis) deviennent null"""
+    return [None if np.isnan(v) else round(float(v), 2) for v in np.atleast_1d(valeurs)]
+
+def analyser_notes(matrice: np.ndarray) -> dict:
+    """Distribution complète des notes : histogrammes, quantiles, écarts-types, corrélations, réussite"""
+    effectif = len(matrice)
+    if effectif == 0:
+        return {"effectif": 0, "colonnes": {}, "correlations": {}}
+    
+    moyennes = matrice.mean(axis=0)
+    ecarts_types = matrice.std(axis=0)
+    minimums, maximums = matrice.min(axis=0), matrice.max(axis=0)
+    quantiles = np.quantile(matrice, QUANTILES, axis=0)
+    # Réussite : au moins la moitié des points, comme admis (moyenne >= 5)
+    reussite = (matrice >= BAREMES / 2).mean(axis=0) * 100
+    # Classes de largeur fixe sur chaque barème : une seule passe pour toutes les colonnes. Une note
+    # hors barème (les routes unitaires ne bornent pas la saisie) tombe dans la classe extrême la plus proche
+    indices = np.clip(
+        np.floor(matrice / BAREMES * NB_CLASSES_HISTOGRAMME), 0, NB_CLASSES_HISTOGRAMME - 1
+    ).astype(int)
+    histogrammes = np.stack([
+        np.bincount(indices[:, j], minlength=NB_CLASSES_HISTOGRAMME) for j in range(len(COLONNES_NOTES))
+    ])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlations = np.corrcoef(matrice[:, :len(MATIERES)], rowvar=False) if effectif > 1 \
+            else np.full((len(MATIERES), len(MATIERES)), np.nan)
     
+    colonnes = {}
+    for j, colonne in enumerate(COLONNES_NOTES):
+        colonnes[colonne] = {
+            "moyenne": arrondir(moyennes[j])[0],
+            "ecart_type": arrondir(ecarts_types[j])[0],
+            "min": float(minimums[j]),
+            "max": float(maximums[j]),
+            "quantiles": dict(zip((f"q{int(q * 100)}" for q in QUANTILES), arrondir(quantiles[:, j]))),
+            "taux_reussite": arrondir(reussite[j])[0],
+            "histogramme": {
+                "bornes": arrondir(np.linspace(0, BAREMES[j], NB_CLASSES_HISTOGRAMME + 1)),
+                "effectifs": histogrammes[j].tolist()
+            }
+        }
     return {
         "effectif": effectif,
-        "presents": presents,
-        "absents": absents,
-        "admis": admis,
-        "pourcentage_reussite": pourcentage_reussite
+        "colonnes": colonnes,
+        "correlations": {
+            matiere: dict(zip(MATIERES, arrondir(correlations[i])))
+            for i, matiere in enumerate(MATIERES)
+        }
     }
 
-# ========== SUIVI SUR 8 MOIS ==========
+def resumer_par_groupe(matrice: np.ndarray, groupes: np.ndarray) -> Dict[str, dict]:
+    """Effectif, moyenne, écart-type, médiane et réussite de la moyenne /10 pour chaque groupe, sans boucle par note"""
+    if len(matrice) == 0:
+        return {}
+    cles, codes = np.unique(groupes, return_inverse=True)
+    moyenne = matrice[:, COLONNES_NOTES.index("moyenne")]
+    effectifs = np.bincount(codes)
+    sommes = np.bincount(codes, weights=moyenne)
+    carres = np.bincount(codes, weights=moyenne ** 2)
+    admis = np.bincount(codes, weights=moyenne >= 5)
+    moyennes = sommes / effectifs
+    ecarts_types = np.sqrt(np.maximum(carres / effectifs - moyennes ** 2, 0))
+    
+    # Médianes : tri par (groupe, moyenne), puis les éléments du milieu de chaque tranche
+    triees = moyenne[np.lexsort((moyenne, codes))]
+    debuts = np.concatenate(([0], np.cumsum(effectifs)[:-1]))
+    medianes = (triees[debuts + (effectifs - 1) // 2] + triees[debuts + effectifs // 2]) / 2
+    
+    return {
+        str(cle): {
+            "effectif": int(effectif),
+            "moyenne": round(float(m), 2),
+            "ecart_type": round(float(e), 2),
+            "mediane": round(float(med), 2),
+            "taux_reussite": round(float(a / effectif * 100), 2)
+        }
+        for cle, effectif, m, e, med, a in zip(cles, effectifs, moyennes, ecarts_types, medianes, admis)
+    }
 
-@api_router.get("/suivi/{classe_id}/{eleve_id}")
-async def obtenir_suivi_eleve(classe_id: str, eleve_id: str):
-    """Obtient le suivi d'un élève sur toutes les compositions de la classe"""
-    compositions = await db.compositions.find({"classe_id": classe_id}, {"_id": 0}).to_list(1000)
-    compositions_triees = sorted(compositions, key=lambda x: x['numero'])
-    
-    suivi = []
-    for comp in compositions_triees:
-        note = await db.notes.find_one(
-            {"composition_id": comp['id'], "eleve_id": eleve_id},
-            {"_id": 0}
+async def charger_notes_compositions(composition_ids: List[str]) -> List[dict]:
+    return await db.notes.find(
+        {"composition_id": {"$in": composition_ids}},
+        {"_id": 0, "composition_id": 1, **{colonne: 1 for colonne in COLONNES_NOTES}}
+    ).to_list(None)
+
+async def compositions_filtrees(ecole: str, niveau: Optional[str] = None, annee_scolaire: Optional[str] = None,
+                                mois: Optional[str] = None) -> tuple:
+    """Classes et compositions de l'école retenues par les filtres (niveau en préfixe, comme pour les classements)"""
+    filtre_classes = {"school_id": ecole}
+    if niveau:
+        filtre_classes["niveau"] = {"$regex": f"^{re.escape(niveau)}", "$options": "i"}
+    if annee_scolaire:
+        filtre_classes["annee_scolaire"] = annee_scolaire
+    classes = await db.classes.find(filtre_classes, {"_id": 0}).to_list(None)
+    filtre_compositions = {"classe_id": {"$in": [classe['id'] for classe in classes]}}
+    if mois:
+        filtre_compositions["mois"] = mois
+    compositions = await db.compositions.find(filtre_compositions, {"_id": 0}).sort("numero", 1).to_list(None)
+    return classes, compositions
+
+@api_router.get("/statistiques/{composition_id}/distribution")
+async def obtenir_distribution(request: Request, composition_id: str, ecole: str = Depends(ecole_courante)):
+    async def produire(entetes):
+        await verifier_composition(composition_id, ecole)
+        notes = await charger_notes_compositions([composition_id])
+        return analyser_notes(matrice_notes(notes))
+    
+    return await reponse_en_cache(request, ecole, [f"composition:{composition_id}"], produire)
+
+@api_router.get("/niveaux/{niveau}/distribution")
+async def obtenir_distribution_niveau(
+    request: Request, niveau: str, annee_scolaire: Optional[str] = None, mois: Optional[str] = None,
+    ecole: str = Depends(ecole_courante)
+):
+    """Distribution des notes de toutes les classes d'un niveau, avec le résumé de chaque classe"""
+    async def produire(entetes):
+        classes, compositions = await compositions_filtrees(ecole, niveau, annee_scolaire, mois)
+        notes = await charger_notes_compositions([comp['id'] for comp in compositions])
+        matrice = matrice_notes(notes)
+        classe_de = {comp['id']: comp['classe_id'] for comp in compositions}
+        noms = {classe['id']: classe['nom'] for classe in classes}
+        par_classe = resumer_par_groupe(matrice, np.array([classe_de[note['composition_id']] for note in notes]))
+        return {
+            **analyser_notes(matrice),
+            "par_classe": [{"classe_id": cid, "nom": noms[cid], **resume} for cid, resume in par_classe.items()]
+        }
+    
+    return await reponse_en_cache(
+        request, ecole, [portee_ecole(ecole, "notes"), portee_ecole(ecole, "classements")], produire
+    )
+
+@api_router.get("/tableau-de-bord")
+async def obtenir_tableau_de_bord(request: Request, annee_scolaire: Optional[str] = None,
+                                  ecole: str = Depends(ecole_courante)):
+    """Bilan de l'année : toutes les notes, puis un résumé par niveau, par mois et par composition"""
+    async def produire(entetes):
+        classes, compositions = await compositions_filtrees(ecole, annee_scolaire=annee_scolaire)
+        notes = await charger_notes_compositions([comp['id'] for comp in compositions])
+        matrice = matrice_notes(notes)
+        
+        classes_par_id = {classe['id']: classe for classe in classes}
+        compositions_par_id = {comp['id']: comp for comp in compositions}
+        composition_de = np.array([note['composition_id'] for note in notes])
+        par_composition = resumer_par_groupe(matrice, composition_de)
+        niveau_de = {cid: classes_par_id[comp['classe_id']]['niveau'] for cid, comp in compositions_par_id.items()}
+        mois_de = {cid: comp['mois'] for cid, comp in compositions_par_id.items()}
+        
+        return {
+            "global": analyser_notes(matrice),
+            "par_niveau": resumer_par_groupe(matrice, np.array([niveau_de[cid] for cid in composition_de])),
+            "par_mois": resumer_par_groupe(matrice, np.array([mois_de[cid] for cid in composition_de])),
+            "par_composition": [
+                {
+                    "composition_id": cid,
+                    "classe": classes_par_id[comp['classe_id']]['nom'],
+                    "numero": comp['numero'],
+                    "mois": comp['mois'],
+                    **par_composition[cid]
+                }
+                for cid, comp in compositions_par_id.items()
+                if cid in par_composition
+            ]
+        }
+    
+    return await reponse_en_cache(
+        request, ecole, [portee_ecole(ecole, "notes"), portee_ecole(ecole, "classements")], produire
+    )
+
+# ========== RAPPORTS ==========
+
+@api_router.get("/rapports/{composition_id}")
+async def obtenir_rapport(composition_id: str, ecole: str = Depends(ecole_courante)):
+    """Rassemble en une requête tout ce qu'affiche la fiche de rapport d'une composition"""
+    composition = await db.compositions.find_one({"id": composition_id, "school_id": ecole}, {"_id": 0})
+    if not composition:
+        raise HTTPException(status_code=404, detail="Composition non trouvée")
+    
+    classe, eleves, notes, stats = await asyncio.gather(
+        db.classes.find_one({"id": composition['classe_id']}, {"_id": 0}),
+        db.eleves.find(
+            {"classe_id": composition['classe_id']}, {"_id": 0, "id": 1, "nom": 1, "prenom": 1}
+        ).to_list(None),
+        db.notes.find({"composition_id": composition_id}, {"_id": 0}).sort("rang", 1).to_list(None),
+        lire_statistiques(composition_id)
+    )
+    if not classe:
+        raise HTTPException(status_code=404, detail="Classe non trouvée")
+    
+    # Joindre le nom de l'élève à chaque note (les notes d'élèves supprimés sont ignorées)
+    eleves_par_id = {eleve['id']: eleve for eleve in eleves}
+    notes_jointes = [
+        {**note, "eleve": eleves_par_id[note['eleve_id']]}
+        for note in notes
+        if note['eleve_id'] in eleves_par_id
+    ]
+    
+    return {
+        "composition": composition,
+        "classe": classe,
+        "notes": notes_jointes,
+        "statistiques": stats
+    }
+
+# ========== PROGRESSION ANNUELLE ==========
+
+def resumer_progression(doc: dict):
+    """Moyenne annuelle (sur les compositions passées) et tendance entre les deux dernières"""
+    moyennes = [
+        slot['moyenne']
+        for slot in sorted(doc['compositions'].values(), key=lambda slot: slot['numero'])
+    ]
+    doc['nb_compositions'] = len(moyennes)
+    doc['moyenne_annuelle'] = round(sum(moyennes) / len(moyennes), 2) if moyennes else None
+    doc['tendance'] = round(moyennes[-1] - moyennes[-2], 2) if len(moyennes) >= 2 else None
+
+def attribuer_rangs_annuels(docs: List[dict]):
+    """Même règle d'ex-aequo que attribuer_rangs, sur la moyenne annuelle"""
+    docs_tries = sorted(docs, key=lambda doc: (-doc['moyenne_annuelle'], doc['eleve_id']))
+    rang_precedent = 0
+    moyenne_precedente = None
+    for idx, doc in enumerate(docs_tries, 1):
+        if doc['moyenne_annuelle'] != moyenne_precedente:
+            rang_precedent = idx
+            moyenne_precedente = doc['moyenne_annuelle']
+        doc['rang_annuel'] = rang_precedent
+
+async def mettre_a_jour_progression(notes_par_composition: Dict[str, List[dict]],
+                                    rangs_par_composition: Dict[str, Dict[str, int]],
+                                    infos: Dict[str, dict], reconstruire: bool = False, partiel: bool = False):
+    """Reporte les moyennes et rangs des compositions reclassées dans la progression des élèves.
+
+    Seules les progressions des classes concernées sont relues (une par élève) : le coût ne
+    dépend pas du nombre de compositions de l'année. `partiel` : seules les notes données ont
+    changé, les autres notes des compositions gardent leur place.
+    """
+    classe_ids = sorted({infos[cid]['classe_id'] for cid in notes_par_composition if cid in infos})
+    if not classe_ids:
+        return
+    existants = [] if reconstruire else await db.progression.find(
+        {"classe_id": {"$in": classe_ids}}, {"_id": 0}
+    ).to_list(None)
+    avant = {(doc['classe_id'], doc['eleve_id']): doc for doc in existants}
+    docs = {cle: {**doc, "compositions": dict(doc['compositions'])} for cle, doc in avant.items()}
+    
+    for composition_id, notes in notes_par_composition.items():
+        info = infos.get(composition_id)
+        if info is None:
+            continue
+        if not partiel:
+            for doc in docs.values():
+                if doc['classe_id'] == info['classe_id']:
+                    doc['compositions'].pop(composition_id, None)
+        rangs = rangs_par_composition[composition_id]
+        for note in notes:
+            doc = docs.setdefault(
+                (info['classe_id'], note['eleve_id']),
+                {"classe_id": info['classe_id'], "eleve_id": note['eleve_id'], "compositions": {}}
+            )
+            doc['compositions'][composition_id] = {
+                "id": note['id'], "numero": info['numero'], "moyenne": note['moyenne'], "rang": rangs[note['id']]
+            }
+    
+    par_classe: Dict[str, List[dict]] = {}
+    for doc in docs.values():
+        resumer_progression(doc)
+        if doc['nb_compositions']:
+            par_classe.setdefault(doc['classe_id'], []).append(doc)
+    for docs_classe in par_classe.values():
+        attribuer_rangs_annuels(docs_classe)
+    
+    operations = []
+    for cle, doc in docs.items():
+        filtre = {"classe_id": doc['classe_id'], "eleve_id": doc['eleve_id']}
+        if not doc['nb_compositions']:
+            # Plus aucune note (élève ou composition supprimés) : la progression disparaît
+            if cle in avant:
+                operations.append(DeleteOne(filtre))
+        elif avant.get(cle) != doc:
+            operations.append(ReplaceOne(filtre, doc, upsert=True))
+    if operations:
+        await db.progression.bulk_write(operations, ordered=False)
+
+async def reporter_note_progression(composition_id: str, info: dict, note: dict, rangs: Dict[str, int],
+                                    fenetre: List[dict]):
+    """Reporte dans la progression un reclassement incrémental (une seule note modifiée).
+
+    Les notes de la fenêtre dont seul le rang a changé sont mises à jour sans lecture. Seule la
+    progression de l'élève modifié est relue ; si sa moyenne annuelle change, les rangs annuels
+    sont réécrits sur la fenêtre entre l'ancienne et la nouvelle moyenne, comme dans reclasser_note.
+    """
+    classe_id = info['classe_id']
+    doc = await db.progression.find_one({"classe_id": classe_id, "eleve_id": note['eleve_id']}, {"_id": 0})
+    if doc is None or composition_id not in doc['compositions']:
+        # Progression absente ou incomplète : mise à jour générale des notes touchées
+        changees = [n for n in fenetre if n['id'] == note['id'] or n.get('rang') != rangs[n['id']]]
+        await mettre_a_jour_progression(
+            {composition_id: changees}, {composition_id: rangs}, {composition_id: info}, partiel=True
         )
-        suivi.append({
-            "composition": comp,
-            "note": note
-        })
+        return
+    
+    emplacement = f"compositions.{composition_id}"
+    operations = [
+        UpdateOne(
+            {"classe_id": classe_id, "eleve_id": n['eleve_id'], emplacement: {"$exists": True}},
+            {"$set": {f"{emplacement}.rang": rangs[n['id']]}}
+        )
+        for n in fenetre
+        if n['id'] != note['id'] and n.get('rang') != rangs[n['id']]
+    ]
     
-    return suivi
+    ancienne_moyenne = doc['moyenne_annuelle']
+    doc['compositions'][composition_id] = {
+        "id": note['id'], "numero": info['numero'], "moyenne": note['moyenne'], "rang": rangs[note['id']]
+    }
+    resumer_progression(doc)
+    modification = {
+        emplacement: doc['compositions'][composition_id],
+        **{champ: doc[champ] for champ in ("nb_compositions", "moyenne_annuelle", "tendance")}
+    }
+    if doc['moyenne_annuelle'] != ancienne_moyenne:
+        bas, haut = sorted((ancienne_moyenne, doc['moyenne_annuelle']))
+        au_dessus, voisins = await asyncio.gather(
+            db.progression.count_documents({"classe_id": classe_id, "moyenne_annuelle": {"$gt": haut}}),
+            db.progression.find(
+                {"classe_id": classe_id, "moyenne_annuelle": {"$gte": bas, "$lte": haut}},
+                {"_id": 0, "eleve_id": 1, "moyenne_annuelle": 1, "rang_annuel": 1}
+            ).to_list(None)
+        )
+        rangs_precedents = {v['eleve_id']: v.get('rang_annuel') for v in voisins}
+        classement = [
+            {"eleve_id": v['eleve_id'], "moyenne_annuelle": v['moyenne_annuelle']}
+            for v in voisins if v['eleve_id'] != note['eleve_id']
+        ] + [{"eleve_id": note['eleve_id'], "moyenne_annuelle": doc['moyenne_annuelle']}]
+        attribuer_rangs_annuels(classement)
+        for voisin in classement:
+            rang = au_dessus + voisin['rang_annuel']
+            if voisin['eleve_id'] == note['eleve_id']:
+                modification['rang_annuel'] = rang
+            elif rangs_precedents.get(voisin['eleve_id']) != rang:
+                operations.append(UpdateOne(
+                    {"classe_id": classe_id, "eleve_id": voisin['eleve_id']}, {"$set": {"rang_annuel": rang}}
+                ))
+    operations.append(UpdateOne({"classe_id": classe_id, "eleve_id": note['eleve_id']}, {"$set": modification}))
+    await db.progression.bulk_write(operations, ordered=False)
 
-@api_router.get("/suivi/{classe_id}")
-async def obtenir_suivi_classe(classe_id: str):
-    """Obtient le suivi de tous les élèves de la classe"""
-    eleves = await db.eleves.find({"classe_id": classe_id}, {"_id": 0}).to_list(1000)
-    compositions = await db.compositions.find({"classe_id": classe_id}, {"_id": 0}).to_list(1000)
-    compositions_triees = sorted(compositions, key=lambda x: x['numero'])
+async def reconstruire_progression(classe_ids: List[str]):
+    """Recalcule entièrement la progression de classes (numéro ou classe d'une composition modifiés, données anciennes)"""
+    compositions = await db.compositions.find(
+        {"classe_id": {"$in": classe_ids}}, {"_id": 0, "id": 1, "classe_id": 1, "numero": 1}
+    ).to_list(None)
+    infos = {comp['id']: {"classe_id": comp['classe_id'], "numero": comp['numero']} for comp in compositions}
+    notes = await db.notes.find(
+        {"composition_id": {"$in": list(infos)}},
+        {"_id": 0, "id": 1, "composition_id": 1, "eleve_id": 1, "moyenne": 1, "rang": 1}
+    ).to_list(None)
     
+    notes_par_composition = {cid: [] for cid in infos}
+    for note in notes:
+        notes_par_composition[note['composition_id']].append(note)
+    rangs_par_composition = {
+        cid: {note['id']: note['rang'] for note in notes_composition}
+        for cid, notes_composition in notes_par_composition.items()
+    }
+    await db.progression.delete_many({"classe_id": {"$in": classe_ids}})
+    await mettre_a_jour_progression(notes_par_composition, rangs_par_composition, infos, reconstruire=True)
+
+async def charger_progression_classe(classe_id: str) -> dict:
+    """Suivi de la classe : notes complètes jointes en une requête, bilan annuel lu dans la progression matérialisée"""
+    eleves, compositions_triees, progressions = await asyncio.gather(
+        db.eleves.find({"classe_id": classe_id}, {"_id": 0}).sort([("nom", 1), ("prenom", 1)]).to_list(None),
+        db.compositions.find({"classe_id": classe_id}, {"_id": 0}).sort("numero", 1).to_list(None),
+        db.progression.find({"classe_id": classe_id}, {"_id": 0}).to_list(None)
+    )
+    notes = await charger_notes_par_composition([comp['id'] for comp in compositions_triees])
+    # Données antérieures à la progression : on la construit une fois
+    if notes and not progressions:
+        await reconstruire_progression([classe_id])
+        progressions = await db.progression.find({"classe_id": classe_id}, {"_id": 0}).to_list(None)
+    
+    progression_par_eleve = {doc['eleve_id']: doc for doc in progressions}
     suivi_classe = []
     for eleve in eleves:
-        notes_eleve = []
-        for comp in compositions_triees:
-            note = await db.notes.find_one(
-                {"composition_id": comp['id'], "eleve_id": eleve['id']},
-                {"_id": 0}
-            )
-            notes_eleve.append(note)
-        
+        progression = progression_par_eleve.get(eleve['id'], {})
         suivi_classe.append({
             "eleve": eleve,
-            "notes": notes_eleve
+            "notes": [notes.get((comp['id'], eleve['id'])) for comp in compositions_triees],
+            "moyenne_annuelle": progression.get('moyenne_annuelle'),
+            "rang_annuel": progression.get('rang_annuel'),
+            "tendance": progression.get('tendance')
         })
     
     return {
@@ -425,6 +2252,807 @@ async def obtenir_suivi_classe(classe_id: str):
         "suivi": suivi_classe
     }
 
+# ========== CLASSEMENTS ENTRE CLASSES ==========
+
+NB_PREMIERS_MAX = 20
+# Mongo antérieur à 5.0 (ou mongomock) : pas de $setWindowFields, les rangs sont calculés en Python
+_fenetres_disponibles: Optional[bool] = None
+# Code rendu par mongod pour une étape d'agrégation inconnue
+ETAPE_INCONNUE = 40324
+
+def etapes_notes_du_mois(ecole: str, mois: str, niveau: Optional[str], annee_scolaire: Optional[str]) -> List[dict]:
+    """Une ligne par note des compositions du mois de l'école, jointe à sa classe et son élève"""
+    filtre_classe = {}
+    if niveau:
+        # « CE1 » retient CE1 A, CE1 B...
+        filtre_classe["classe.niveau"] = {"$regex": f"^{re.escape(niveau)}", "$options": "i"}
+    if annee_scolaire:
+        filtre_classe["classe.annee_scolaire"] = annee_scolaire
+    return [
+        {"$match": {"school_id": ecole, "mois": mois}},
+        {"$lookup": {"from": "classes", "localField": "classe_id", "foreignField": "id", "as": "classe"}},
+        {"$unwind": "$classe"},
+        *([{"$match": filtre_classe}] if filtre_classe else []),
+        {"$lookup": {"from": "notes", "localField": "id", "foreignField": "composition_id", "as": "note"}},
+        {"$unwind": "$note"},
+        {"$lookup": {"from": "eleves", "localField": "note.eleve_id", "foreignField": "id", "as": "eleve"}},
+        {"$unwind": "$eleve"},
+        {"$project": {
+            "_id": 0,
+            "eleve": {"id": "$eleve.id", "nom": "$eleve.nom", "prenom": "$eleve.prenom"},
+            "classe": {"id": "$classe.id", "nom": "$classe.nom", "niveau": "$classe.niveau"},
+            "annee_scolaire": "$classe.annee_scolaire",
+            "composition_id": "$id",
+            "rang_classe": "$note.rang",
+            **{champ: f"$note.{champ}" for champ in (*MATIERES, "total", "moyenne", "observation")},
+        }},
+    ]
+
+def etapes_classement(limite: int, fenetres: bool) -> List[dict]:
+    if not fenetres:
+        return [{"$sort": {"annee_scolaire": 1, "total": -1, "eleve.nom": 1}}]
+    return [
+        # Un même mois peut exister sur plusieurs années : chaque année est classée à part
+        {"$setWindowFields": {
+            "partitionBy": "$annee_scolaire",
+            "sortBy": {"total": -1},
+            "output": {
+                "rang_general": {"$rank": {}},
+                "effectif": {"$count": {}, "window": {"documents": ["unbounded", "unbounded"]}},
+            },
+        }},
+        # Rang centile : 100 pour le premier, 0 pour le dernier, ex-aequo au même centile
+        {"$set": {"percentile": {"$cond": [
+            {"$gt": ["$effectif", 1]},
+            {"$round": [
+                {"$multiply": [100, {"$divide": [
+                    {"$subtract": ["$effectif", "$rang_general"]}, {"$subtract": ["$effectif", 1]}
+                ]}]}, 1
+            ]},
+            100
+        ]}}},
+        {"$sort": {"annee_scolaire": 1, "rang_general": 1, "eleve.nom": 1}},
+        {"$limit": limite},
+    ]
+
+def classer_en_python(lignes: List[dict], limite: int) -> List[dict]:
+    """Équivalent de etapes_classement pour un serveur sans $setWindowFields (lignes triées par année puis total)"""
+    par_annee: Dict[str, List[dict]] = {}
+    for ligne in lignes:
+        par_annee.setdefault(ligne['annee_scolaire'], []).append(ligne)
+    for lignes_annee in par_annee.values():
+        effectif = len(lignes_annee)
+        rang_precedent, total_precedent = 0, None
+        for idx, ligne in enumerate(lignes_annee, 1):
+            if ligne['total'] != total_precedent:
+                rang_precedent, total_precedent = idx, ligne['total']
+            ligne['rang_general'] = rang_precedent
+            ligne['effectif'] = effectif
+            ligne['percentile'] = round(100 * (effectif - rang_precedent) / (effectif - 1), 1) if effectif > 1 else 100
+    return lignes[:limite]
+
+async def calculer_classement_general(ecole: str, mois: str, niveau: Optional[str], annee_scolaire: Optional[str],
+                                      limite: int, nb_premiers: int) -> dict:
+    """Classement, centiles et premiers par matière calculés par Mongo en une agrégation"""
+    global _fenetres_disponibles
+    
+    def pipeline(fenetres: bool) -> List[dict]:
+        return etapes_notes_du_mois(ecole, mois, niveau, annee_scolaire) + [{"$facet": {
+            "effectif": [{"$count": "n"}],
+            "classement": etapes_classement(limite, fenetres),
+            **{
+                matiere: [{"$sort": {matiere: -1, "total": -1, "eleve.nom": 1}}, {"$limit": nb_premiers}]
+                for matiere in MATIERES
+            },
+        }}]
+    
+    resultat = None
+    if _fenetres_disponibles is not False:
+        try:
+            (resultat,) = await db.compositions.aggregate(pipeline(True)).to_list(None)
+            _fenetres_disponibles = True
+        except (OperationFailure, NotImplementedError) as exc:
+            # Seule une étape inconnue désigne un serveur trop ancien ; les autres échecs remontent
+            if isinstance(exc, OperationFailure) and exc.code != ETAPE_INCONNUE:
+                raise
+            logger.info("$setWindowFields indisponible : rangs entre classes calculés en Python")
+            _fenetres_disponibles = False
+    if resultat is None:
+        (resultat,) = await db.compositions.aggregate(pipeline(False)).to_list(None)
+        resultat['classement'] = classer_en_python(resultat['classement'], limite)
+    
+    return {
+        "filtres": {"mois": mois, "niveau": niveau, "annee_scolaire": annee_scolaire},
+        "effectif": resultat['effectif'][0]['n'] if resultat['effectif'] else 0,
+        "classement": resultat['classement'],
+        "premiers_par_matiere": {matiere: resultat[matiere] for matiere in MATIERES}
+    }
+
+@api_router.get("/classements")
+async def obtenir_classement_general(
+    request: Request,
+    mois: str,
+    niveau: Optional[str] = None,
+    annee_scolaire: Optional[str] = None,
+    limite: int = Query(100, ge=1, le=TAILLE_PAGE_MAX),
+    premiers: int = Query(3, ge=1, le=NB_PREMIERS_MAX),
+    ecole: str = Depends(ecole_courante)
+):
+    """Rangs de tous les élèves d'un mois, toutes classes de l'école confondues (ou d'un même niveau)"""
+    return await reponse_en_cache(
+        request, ecole, [portee_ecole(ecole, "classements"), portee_ecole(ecole, f"classements:{mois}")],
+        lambda entetes: calculer_classement_general(ecole, mois, niveau, annee_scolaire, limite, premiers)
+    )
+
+# ========== SUIVI SUR 8 MOIS ==========
+
+async def charger_notes_par_composition(composition_ids: List[str], eleve_ids: Optional[List[str]] = None) -> Dict[tuple, dict]:
+    """Charge en une requête les notes des compositions, indexées par (composition_id, eleve_id)"""
+    if not composition_ids:
+        return {}
+    query = {"composition_id": {"$in": composition_ids}}
+    if eleve_ids is not None:
+        query["eleve_id"] = {"$in": eleve_ids}
+    
+    notes = await db.notes.find(query, {"_id": 0}).to_list(None)
+    notes_par_cle = {}
+    for note in notes:
+        notes_par_cle.setdefault((note['composition_id'], note['eleve_id']), note)
+    return notes_par_cle
+
+@api_router.get("/suivi/{classe_id}/{eleve_id}")
+async def obtenir_suivi_eleve(classe_id: str, eleve_id: str, ecole: str = Depends(ecole_courante)):
+    """Obtient le suivi d'un élève sur toutes les compositions de la classe"""
+    await verifier_classe(classe_id, ecole)
+    compositions_triees = await db.compositions.find(
+        {"classe_id": classe_id}, {"_id": 0}
+    ).sort("numero", 1).to_list(None)
+    
+    notes = await charger_notes_par_composition(
+        [comp['id'] for comp in compositions_triees], [eleve_id]
+    )
+    
+    return [
+        {
+            "composition": comp,
+            "note": notes.get((comp['id'], eleve_id))
+        }
+        for comp in compositions_triees
+    ]
+
+async def charger_suivi_classe(classe_id: str) -> dict:
+    """Obtient le suivi de tous les élèves de la classe"""
+    eleves, compositions_triees = await asyncio.gather(
+        db.eleves.find({"classe_id": classe_id}, {"_id": 0}).to_list(None),
+        db.compositions.find({"classe_id": classe_id}, {"_id": 0}).sort("numero", 1).to_list(None)
+    )
+    
+    notes = await charger_notes_par_composition([comp['id'] for comp in compositions_triees])
+    
+    suivi_classe = [
+        {
+            "eleve": eleve,
+            "notes": [notes.get((comp['id'], eleve['id'])) for comp in compositions_triees]
+        }
+        for eleve in eleves
+    ]
+    
+    return {
+        "compositions": compositions_triees,
+        "suivi": suivi_classe
+    }
+
+@api_router.get("/suivi/{classe_id}")
+async def obtenir_suivi_classe(request: Request, classe_id: str, rapide: bool = False,
+                              ecole: str = Depends(ecole_courante)):
+    async def produire(entetes):
+        await verifier_classe(classe_id, ecole)
+        return await charger_progression_classe(classe_id)
+    
+    return await reponse_en_cache(request, ecole, [f"classe:{classe_id}"], produire, rapide=rapide)
+
+# ========== EXPORT CSV / XLSX ==========
+
+COLONNES_EXPORT = [
+    ("Classe", "classe_nom"), ("Niveau", "niveau"), ("Année scolaire", "annee_scolaire"),
+    ("N° composition", "numero"), ("Composition", "titre"), ("Mois", "mois"), ("Date", "date"),
+    ("Nom", "nom"), ("Prénom", "prenom"),
+    ("Étude de texte", "etude_texte"), ("AEM", "aem"), ("Dictée", "dictee"), ("Math", "math"),
+    ("Total", "total"), ("Moyenne", "moyenne"), ("Rang", "rang"), ("Observation", "observation"),
+]
+LIGNES_PAR_ENVOI = 200
+TAILLE_MORCEAU_FICHIER = 64 * 1024
+
+def curseur_export(filtre_compositions: dict, filtre_classes: Optional[dict] = None):
+    """Un seul curseur d'agrégation : une ligne par note, jointe à sa composition, sa classe et son élève"""
+    pipeline = [{"$match": filtre_compositions}]
+    pipeline += [
+        {"$lookup": {"from": "classes", "localField": "classe_id", "foreignField": "id", "as": "classe"}},
+        {"$unwind": "$classe"},
+    ]
+    if filtre_classes:
+        pipeline.append({"$match": {f"classe.{champ}": valeur for champ, valeur in filtre_classes.items()}})
+    pipeline += [
+        {"$lookup": {"from": "notes", "localField": "id", "foreignField": "composition_id", "as": "note"}},
+        {"$unwind": "$note"},
+        {"$lookup": {"from": "eleves", "localField": "note.eleve_id", "foreignField": "id", "as": "eleve"}},
+        {"$unwind": "$eleve"},
+        {"$sort": {"classe.nom": 1, "classe.id": 1, "numero": 1, "note.rang": 1, "eleve.nom": 1}},
+        {"$project": {
+            "_id": 0,
+            "classe_nom": "$classe.nom", "niveau": "$classe.niveau", "annee_scolaire": "$classe.annee_scolaire",
+            "numero": 1, "titre": 1, "mois": 1, "date": 1,
+            "nom": "$eleve.nom", "prenom": "$eleve.prenom",
+            **{champ: f"$note.{champ}" for champ in (*MATIERES, "total", "moyenne", "rang", "observation")},
+        }},
+    ]
+    # Le tri d'une école entière peut dépasser la limite mémoire du serveur Mongo
+    return db.compositions.aggregate(pipeline, allowDiskUse=True)
+
+def valeurs_export(ligne: dict) -> list:
+    return [ligne.get(champ) for _, champ in COLONNES_EXPORT]
+
+async def flux_csv(curseur):
+    """Écrit le CSV au fil du curseur, par paquets de lignes, sans construire le fichier en mémoire"""
+    tampon = io.StringIO()
+    # Séparateur « ; » et BOM : le CSV s'ouvre directement dans un Excel configuré en français
+    ecrivain = csv.writer(tampon, delimiter=";")
+    tampon.write("\ufeff")
+    ecrivain.writerow([titre for titre, _ in COLONNES_EXPORT])
+    nb_lignes = 0
+    async for ligne in curseur:
+        ecrivain.writerow(valeurs_export(ligne))
+        nb_lignes += 1
+        if nb_lignes % LIGNES_PAR_ENVOI == 0:
+            yield tampon.getvalue().encode("utf-8")
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue().encode("utf-8")
+
+async def fichier_xlsx(curseur):
+    """Classeur openpyxl en écriture seule : les lignes partent sur disque au fil du curseur"""
+    from openpyxl import Workbook
+    
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet("Résultats")
+    feuille.append([titre for titre, _ in COLONNES_EXPORT])
+    async for ligne in curseur:
+        feuille.append(valeurs_export(ligne))
+    
+    fichier = tempfile.SpooledTemporaryFile(max_size=TAILLE_MORCEAU_FICHIER * 16)
+    await asyncio.to_thread(classeur.save, fichier)
+    fichier.seek(0)
+    return fichier
+
+async def lire_fichier(fichier):
+    try:
+        while morceau := fichier.read(TAILLE_MORCEAU_FICHIER):
+            yield morceau
+    finally:
+        fichier.close()
+
+async def reponse_export(curseur, format: str, nom_fichier: str):
+    if format == "xlsx":
+        fichier = await fichier_xlsx(curseur)
+        return StreamingResponse(
+            lire_fichier(fichier),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f'attachment; filename="{nom_fichier}.xlsx"'}
+        )
+    return StreamingResponse(
+        flux_csv(curseur),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{nom_fichier}.csv"'}
+    )
+
+def nom_fichier_export(*parties: str) -> str:
+    return "-".join("".join(c if c.isalnum() else "_" for c in partie) for partie in parties if partie)
+
+@api_router.get("/export/classes/{classe_id}")
+async def exporter_classe(classe_id: str, format: str = Query("csv", pattern="^(csv|xlsx)$"),
+                          ecole: str = Depends(ecole_courante)):
+    """Résultats de toutes les compositions d'une classe"""
+    classe = await db.classes.find_one(
+        {"id": classe_id, "school_id": ecole}, {"_id": 0, "nom": 1, "annee_scolaire": 1}
+    )
+    if not classe:
+        raise HTTPException(status_code=404, detail="Classe non trouvée")
+    
+    return await reponse_export(
+        curseur_export({"classe_id": classe_id}), format,
+        nom_fichier_export("resultats", classe['nom'], classe['annee_scolaire'])
+    )
+
+@api_router.get("/export/ecole")
+async def exporter_ecole(
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    annee_scolaire: Optional[str] = None,
+    ecole: str = Depends(ecole_courante)
+):
+    """Résultats de toutes les classes de l'école, éventuellement pour une seule année scolaire"""
+    filtre_classes = {"annee_scolaire": annee_scolaire} if annee_scolaire else None
+    return await reponse_export(
+        curseur_export({"school_id": ecole}, filtre_classes), format,
+        nom_fichier_export("resultats", "ecole", ecole, annee_scolaire)
+    )
+
+# ========== BULLETINS PDF ==========
+
+DOSSIER_BULLETINS = Path(os.environ.get('DOSSIER_BULLETINS', ROOT_DIR / 'bulletins'))
+PROCESSUS_BULLETINS = int(os.environ.get('PROCESSUS_BULLETINS', os.cpu_count() or 1))
+BAREME = (("etude_texte", "Étude de texte", 50), ("aem", "AEM", 50), ("dictee", "Dictée", 20), ("math", "Mathématiques", 50))
+
+# Un travail dont le battement est plus ancien a été interrompu (arrêt ou plantage du worker)
+DELAI_ABANDON_BULLETINS_S = int(os.environ.get('DELAI_ABANDON_BULLETINS_S', '120'))
+
+_pool_bulletins: Optional[ProcessPoolExecutor] = None
+# Référence forte vers les travaux lancés, sinon la boucle peut les ramasser en cours de route
+_travaux_en_cours = set()
+
+def pool_bulletins() -> ProcessPoolExecutor:
+    global _pool_bulletins
+    if _pool_bulletins is None:
+        # spawn : un fork copierait un processus où tournent déjà les threads de Motor (interblocages)
+        _pool_bulletins = ProcessPoolExecutor(
+            max_workers=PROCESSUS_BULLETINS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool_bulletins
+
+def filtre_travaux_abandonnes() -> dict:
+    limite = datetime.now(timezone.utc) - timedelta(seconds=DELAI_ABANDON_BULLETINS_S)
+    # Les travaux antérieurs au battement n'ont pas de actif_le
+    return {
+        "statut": {"$in": ["en_attente", "en_cours"]},
+        "$or": [{"actif_le": {"$lt": limite}}, {"actif_le": {"$exists": False}}]
+    }
+
+def marque_abandon() -> dict:
+    return {"statut": "echec", "erreur": "Travail interrompu par un arrêt du serveur",
+            "termine_le": datetime.now(timezone.utc)}
+
+async def abandonner_bulletins_interrompus():
+    """Au démarrage : les travaux restés en cours sans battement récent ne reprendront jamais"""
+    resultat = await db.travaux_bulletins.update_many(filtre_travaux_abandonnes(), {"$set": marque_abandon()})
+    if resultat.modified_count:
+        logger.warning("%d travaux de bulletins interrompus marqués en échec", resultat.modified_count)
+
+def purger_fichiers_bulletins() -> int:
+    """Supprime les archives (et archives partielles) plus anciennes que DUREE_BULLETINS_S"""
+    if not DOSSIER_BULLETINS.exists():
+        return 0
+    limite = time.time() - DUREE_BULLETINS_S
+    supprimes = 0
+    for fichier in DOSSIER_BULLETINS.glob("bulletins-*"):
+        try:
+            if fichier.stat().st_mtime < limite:
+                fichier.unlink()
+                supprimes += 1
+        except FileNotFoundError:
+            # Déjà supprimée par un autre worker
+            pass
+    return supprimes
+
+def texte_rang(rang: int, ex_aequo: bool) -> str:
+    return f"{rang}{'er' if rang == 1 else 'e'}{' ex æquo' if ex_aequo else ''}"
+
+def dessiner_bulletin(pdf, classe: dict, composition: dict, eleve: dict, note: Optional[dict],
+                      effectif: int, ex_aequo: bool, historique: List[tuple]):
+    largeur, hauteur = pdf._pagesize
+    y = hauteur - 60
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawCentredString(largeur / 2, y, f"BULLETIN DE NOTES - {composition['mois'].upper()}")
+    pdf.setFont("Helvetica", 11)
+    y -= 30
+    pdf.drawString(50, y, f"Classe : {classe['nom']} ({classe['niveau']})")
+    pdf.drawRightString(largeur - 50, y, f"Année scolaire : {classe['annee_scolaire']}")
+    y -= 18
+    pdf.drawString(50, y, f"Enseignant(e) : {classe['enseignant']}")
+    pdf.drawRightString(largeur - 50, y, f"{composition['titre']} du {composition['date']}")
+    y -= 30
+    pdf.setFont("Helvetica-Bold", 13)
+    pdf.drawString(50, y, f"{eleve['nom']} {eleve['prenom']}")
+    if eleve.get('date_naissance'):
+        pdf.setFont("Helvetica", 11)
+        pdf.drawRightString(largeur - 50, y, f"Né(e) le {eleve['date_naissance']}")
+    
+    y -= 35
+    pdf.setFont("Helvetica-Bold", 11)
+    pdf.drawString(60, y, "Matière")
+    pdf.drawRightString(330, y, "Note")
+    pdf.drawRightString(400, y, "Sur")
+    pdf.line(50, y - 6, largeur - 50, y - 6)
+    pdf.setFont("Helvetica", 11)
+    for champ, libelle, bareme in BAREME:
+        y -= 22
+        pdf.drawString(60, y, libelle)
+        pdf.drawRightString(330, y, f"{note[champ]:g}" if note else "-")
+        pdf.drawRightString(400, y, str(bareme))
+    y -= 10
+    pdf.line(50, y, largeur - 50, y)
+    
+    y -= 24
+    pdf.setFont("Helvetica-Bold", 11)
+    if note:
+        pdf.drawString(60, y, f"Total : {note['total']:g} / 170")
+        pdf.drawString(250, y, f"Moyenne : {note['moyenne']:.2f} / 10")
+        y -= 20
+        pdf.drawString(60, y, f"Rang : {texte_rang(note['rang'], ex_aequo)} sur {effectif}")
+        pdf.drawString(250, y, f"Observation : {note['observation']}")
+    else:
+        pdf.drawString(60, y, "Absent(e) à cette composition")
+    
+    y -= 40
+    pdf.setFont("Helvetica-Bold", 11)
+    pdf.drawString(60, y, "Compositions de l'année")
+    pdf.setFont("Helvetica", 10)
+    for mois, moyenne, rang in historique:
+        y -= 16
+        pdf.drawString(70, y, mois)
+        pdf.drawRightString(300, y, f"{moyenne:.2f} / 10" if moyenne is not None else "absent(e)")
+        pdf.drawRightString(400, y, f"rang {rang}" if rang is not None else "")
+    
+    pdf.setFont("Helvetica", 10)
+    pdf.drawString(60, 90, "Signature de l'enseignant(e)")
+    pdf.drawRightString(largeur - 60, 90, "Signature des parents")
+    pdf.showPage()
+
+def rendre_bulletins_classe(classe: dict, compositions: List[dict], suivi: List[dict], indice: int) -> List[tuple]:
+    """Rend les bulletins d'une classe pour la composition d'indice donné ; exécuté dans un processus du pool"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    
+    composition = compositions[indice]
+    rangs = [ligne['notes'][indice]['rang'] for ligne in suivi if ligne['notes'][indice]]
+    repetitions = {rang: rangs.count(rang) for rang in rangs}
+    
+    fichiers = []
+    for ligne in sorted(suivi, key=lambda ligne: (ligne['eleve']['nom'], ligne['eleve']['prenom'])):
+        eleve, note = ligne['eleve'], ligne['notes'][indice]
+        historique = [
+            (comp['mois'], n['moyenne'] if n else None, n['rang'] if n else None)
+            for comp, n in zip(compositions[:indice + 1], ligne['notes'])
+        ]
+        tampon = io.BytesIO()
+        pdf = canvas.Canvas(tampon, pagesize=A4, pageCompression=1)
+        pdf.setTitle(f"Bulletin {eleve['nom']} {eleve['prenom']} - {composition['mois']}")
+        dessiner_bulletin(
+            pdf, classe, composition, eleve, note, len(rangs),
+            bool(note) and repetitions[note['rang']] > 1, historique
+        )
+        pdf.save()
+        nom = nom_fichier_export(eleve['nom'], eleve['prenom'], eleve['id'][:8])
+        fichiers.append((f"{nom_fichier_export(classe['nom'])}/{nom}.pdf", tampon.getvalue()))
+    return fichiers
+
+def indice_composition(compositions: List[dict], mois: Optional[str]) -> Optional[int]:
+    """Composition du mois demandé, ou la dernière de la classe"""
+    if not compositions:
+        return None
+    if mois is None:
+        return len(compositions) - 1
+    return next(
+        (i for i, comp in enumerate(compositions) if comp['mois'].casefold() == mois.casefold()),
+        None
+    )
+
+def chemin_bulletins(travail_id: str) -> Path:
+    return DOSSIER_BULLETINS / f"bulletins-{travail_id}.zip"
+
+async def battre(travail_id: str):
+    """Rafraîchit actif_le tant que le travail tourne, même pendant un long rendu"""
+    while True:
+        await asyncio.sleep(DELAI_ABANDON_BULLETINS_S / 4)
+        await db.travaux_bulletins.update_one(
+            {"id": travail_id}, {"$set": {"actif_le": datetime.now(timezone.utc)}}
+        )
+
+async def executer_bulletins(travail: TravailBulletins, classes: List[dict]):
+    """Charge chaque classe, confie son rendu au pool et écrit les PDF dans le zip au fil des retours"""
+    boucle = asyncio.get_running_loop()
+    await db.travaux_bulletins.update_one(
+        {"id": travail.id},
+        {"$set": {"statut": "en_cours", "classes": len(classes), "actif_le": datetime.now(timezone.utc)}}
+    )
+    chemin = chemin_bulletins(travail.id)
+    battement = asyncio.create_task(battre(travail.id))
+    try:
+        rendus = []
+        for classe in classes:
+            suivi = await charger_suivi_classe(classe['id'])
+            indice = indice_composition(suivi['compositions'], travail.mois)
+            if indice is None:
+                continue
+            rendus.append(boucle.run_in_executor(
+                pool_bulletins(), rendre_bulletins_classe, classe, suivi['compositions'], suivi['suivi'], indice
+            ))
+        await db.travaux_bulletins.update_one({"id": travail.id}, {"$set": {"classes": len(rendus)}})
+        
+        DOSSIER_BULLETINS.mkdir(parents=True, exist_ok=True)
+        partiel = chemin.with_suffix(".partiel")
+        # Les PDF sont déjà compressés : inutile de les recompresser dans l'archive
+        with zipfile.ZipFile(partiel, "w", zipfile.ZIP_STORED) as archive:
+            for rendu in asyncio.as_completed(rendus):
+                fichiers = await rendu
+                await asyncio.to_thread(lambda: [archive.writestr(nom, contenu) for nom, contenu in fichiers])
+                await db.travaux_bulletins.update_one(
+                    {"id": travail.id}, {"$inc": {"classes_terminees": 1, "bulletins": len(fichiers)}}
+                )
+        partiel.replace(chemin)
+        
+        await db.travaux_bulletins.update_one(
+            {"id": travail.id},
+            {"$set": {"statut": "termine", "termine_le": datetime.now(timezone.utc)}}
+        )
+    except Exception as e:
+        logger.exception("Échec du travail de bulletins %s", travail.id)
+        await db.travaux_bulletins.update_one(
+            {"id": travail.id},
+            {"$set": {"statut": "echec", "erreur": str(e), "termine_le": datetime.now(timezone.utc)}}
+        )
+    finally:
+        battement.cancel()
+
+@api_router.post("/bulletins", response_model=TravailBulletins, status_code=202)
+async def creer_bulletins(demande: BulletinsDemande, ecole: str = Depends(ecole_courante)):
+    """Lance la génération des bulletins d'une classe ou de l'école ; l'avancement se suit sur GET /bulletins/{id}"""
+    query = {"school_id": ecole}
+    if demande.classe_id:
+        query["id"] = demande.classe_id
+    elif demande.annee_scolaire:
+        query["annee_scolaire"] = demande.annee_scolaire
+    classes = await db.classes.find(query, {"_id": 0}).sort("nom", 1).to_list(None)
+    if demande.classe_id and not classes:
+        raise HTTPException(status_code=404, detail="Classe non trouvée")
+    
+    travail = TravailBulletins(**demande.model_dump(), school_id=ecole, classes=len(classes))
+    await db.travaux_bulletins.insert_one(travail.model_dump())
+    await asyncio.to_thread(purger_fichiers_bulletins)
+    
+    tache = asyncio.create_task(executer_bulletins(travail, classes))
+    _travaux_en_cours.add(tache)
+    tache.add_done_callback(_travaux_en_cours.discard)
+    return travail
+
+@api_router.get("/bulletins/{travail_id}", response_model=TravailBulletins)
+async def obtenir_bulletins(travail_id: str, ecole: str = Depends(ecole_courante)):
+    travail = await db.travaux_bulletins.find_one({"id": travail_id, "school_id": ecole}, {"_id": 0})
+    if not travail:
+        raise HTTPException(status_code=404, detail="Travail non trouvé")
+    limite = datetime.now(timezone.utc) - timedelta(seconds=DELAI_ABANDON_BULLETINS_S)
+    if travail['statut'] in ("en_attente", "en_cours") and date_utc(travail.get('actif_le', travail['cree_le'])) < limite:
+        # Worker arrêté depuis le démarrage des autres : le travail ne se terminera pas
+        abandon = marque_abandon()
+        await db.travaux_bulletins.update_one({"id": travail_id, **filtre_travaux_abandonnes()}, {"$set": abandon})
+        travail.update(abandon)
+    return travail
+
+@api_router.get("/bulletins/{travail_id}/zip")
+async def telecharger_bulletins(travail_id: str, ecole: str = Depends(ecole_courante)):
+    travail = await db.travaux_bulletins.find_one({"id": travail_id, "school_id": ecole}, {"_id": 0, "statut": 1})
+    if not travail:
+        raise HTTPException(status_code=404, detail="Travail non trouvé")
+    if travail['statut'] != "termine":
+        raise HTTPException(status_code=409, detail=f"Bulletins pas encore prêts ({travail['statut']})")
+    if not chemin_bulletins(travail_id).exists():
+        raise HTTPException(status_code=410, detail="Bulletins expirés : relancer la génération")
+    return FileResponse(
+        chemin_bulletins(travail_id), media_type="application/zip", filename=f"bulletins-{travail_id}.zip"
+    )
+
+# ========== SYNCHRONISATION DES CLIENTS ==========
+
+@api_router.get("/sync")
+async def synchroniser(since: Optional[int] = Query(None, ge=0), classe_id: Optional[str] = None,
+                       ecole: str = Depends(ecole_courante)):
+    """Documents créés ou modifiés et suppressions depuis le jeton `since`, pour toute l'école ou une classe.
+
+    Sans `since`, renvoie l'état complet, sans suppressions. Le client applique les suppressions avant
+    les documents (un élève qui change de classe figure dans les deux) ; supprimer une classe, un élève
+    ou une composition supprime aussi leurs notes et leurs enfants. Le jeton renvoyé sert à l'appel suivant.
+    """
+    filtre_version = {}
+    if since is not None:
+        filtre_version["$gt"] = since
+    stable = await version_stable(ecole)
+    if stable is not None:
+        # Écritures en cours, ici ou sur un autre worker : rien de plus récent que la dernière version complète
+        filtre_version["$lte"] = stable
+    filtre = {"school_id": ecole}
+    if filtre_version:
+        filtre["version"] = filtre_version
+    
+    filtres = {nom: dict(filtre) for nom in COLLECTIONS_SYNCHRONISEES}
+    filtre_suppressions = dict(filtre)
+    if classe_id:
+        await verifier_classe(classe_id, ecole)
+        composition_ids = await db.compositions.distinct("id", {"classe_id": classe_id})
+        filtres["classes"]["id"] = classe_id
+        filtres["eleves"]["classe_id"] = classe_id
+        filtres["compositions"]["classe_id"] = classe_id
+        filtres["notes"]["composition_id"] = {"$in": composition_ids}
+        filtre_suppressions["classe_id"] = classe_id
+    
+    lectures = [
+        db[nom].find(filtres[nom], {"_id": 0}).sort("version", 1).to_list(None)
+        for nom in COLLECTIONS_SYNCHRONISEES
+    ]
+    if since is not None:
+        lectures.append(
+            db.suppressions.find(filtre_suppressions, {"_id": 0}).sort("version", 1).to_list(None)
+        )
+    resultats = await asyncio.gather(*lectures)
+    
+    changements = dict(zip(COLLECTIONS_SYNCHRONISEES, resultats))
+    suppressions = resultats[len(COLLECTIONS_SYNCHRONISEES)] if since is not None else []
+    jeton = max([since or 0] + [doc['version'] for docs in resultats for doc in docs])
+    return {"jeton": jeton, **changements, "suppressions": suppressions}
+
+# ========== USAGE PAR ÉCOLE ==========
+
+@api_router.get("/ecole/usage")
+async def obtenir_usage_ecole(ecole: str = Depends(ecole_courante)):
+    """Documents stockés par l'école et ses requêtes traitées par ce processus"""
+    comptes = await asyncio.gather(*(
+        db[nom].count_documents({"school_id": ecole}) for nom in COLLECTIONS_SYNCHRONISEES
+    ))
+    return {
+        "school_id": ecole,
+        "documents": dict(zip(COLLECTIONS_SYNCHRONISEES, comptes)),
+        **metriques.requetes_ecole(ecole),
+        "requetes_simultanees_max": REQUETES_SIMULTANEES_PAR_ECOLE
+    }
+
+# ========== DIFFUSION DES CLASSEMENTS ==========
+
+ABONNES_MAX_PAR_COMPOSITION = int(os.environ.get('ABONNES_MAX_PAR_COMPOSITION', '50'))
+# Messages en attente par abonné : au-delà, le client lent repart d'une relecture complète
+FILE_ABONNE_MAX = 32
+INTERVALLE_PING_S = 15.0
+
+class DiffusionClassements:
+    """Abonnés de ce processus aux changements de rang, par composition"""
+
+    def __init__(self, abonnes_max: int, file_max: int):
+        self.abonnes_max = abonnes_max
+        self.file_max = file_max
+        self._abonnes: Dict[str, set] = {}
+
+    def abonner(self, composition_id: str) -> Optional[asyncio.Queue]:
+        """File des messages de la composition ; None si la composition a déjà trop d'abonnés"""
+        abonnes = self._abonnes.setdefault(composition_id, set())
+        if len(abonnes) >= self.abonnes_max:
+            return None
+        file = asyncio.Queue(maxsize=self.file_max)
+        abonnes.add(file)
+        return file
+
+    def desabonner(self, composition_id: str, file: asyncio.Queue):
+        abonnes = self._abonnes.get(composition_id)
+        if abonnes is None:
+            return
+        abonnes.discard(file)
+        if not abonnes:
+            del self._abonnes[composition_id]
+
+    def distribuer(self, message: dict):
+        for file in self._abonnes.get(message['composition_id'], ()):
+            try:
+                file.put_nowait(message)
+            except asyncio.QueueFull:
+                # Des diffs manquants rendraient les rangs du client faux : il recharge tout
+                while not file.empty():
+                    file.get_nowait()
+                file.put_nowait({"type": "resynchroniser", "composition_id": message['composition_id']})
+
+class BrokerMemoire:
+    """Un seul worker : les messages sont distribués directement aux abonnés locaux"""
+
+    def __init__(self, diffusion: DiffusionClassements):
+        self.diffusion = diffusion
+
+    async def demarrer(self):
+        pass
+
+    async def arreter(self):
+        pass
+
+    async def publier(self, messages: List[dict]):
+        for message in messages:
+            self.diffusion.distribuer(message)
+
+class BrokerMongo:
+    """Plusieurs workers : les messages passent par une collection plafonnée lue en continu.
+
+    Chaque worker suit la collection avec un curseur tailable et distribue à ses propres
+    abonnés, y compris les messages qu'il a publiés lui-même.
+    """
+
+    def __init__(self, diffusion: DiffusionClassements, collection: str, taille_octets: int):
+        self.diffusion = diffusion
+        self.nom_collection = collection
+        self.taille_octets = taille_octets
+        self._tache: Optional[asyncio.Task] = None
+
+    async def demarrer(self):
+        try:
+            await db.create_collection(self.nom_collection, capped=True, size=self.taille_octets)
+        except CollectionInvalid:
+            pass
+        self._tache = asyncio.create_task(self._suivre())
+
+    async def arreter(self):
+        if self._tache is not None:
+            self._tache.cancel()
+            await asyncio.gather(self._tache, return_exceptions=True)
+            self._tache = None
+
+    async def publier(self, messages: List[dict]):
+        if messages:
+            # insert_many ajoute un _id aux documents : ne pas modifier ceux de l'appelant
+            await db[self.nom_collection].insert_many([dict(message) for message in messages], ordered=False)
+
+    async def _suivre(self):
+        collection = db[self.nom_collection]
+        dernier = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        dernier_id = dernier['_id'] if dernier else None
+        while True:
+            filtre = {"_id": {"$gt": dernier_id}} if dernier_id is not None else {}
+            curseur = collection.find(filtre, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                while curseur.alive:
+                    async for message in curseur:
+                        dernier_id = message.pop('_id')
+                        self.diffusion.distribuer(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lecture de %s interrompue", self.nom_collection)
+            finally:
+                await curseur.close()
+            # Curseur mort (collection vide au départ) ou erreur : on reprend après le dernier message lu
+            await asyncio.sleep(1)
+
+diffusion_classements = DiffusionClassements(ABONNES_MAX_PAR_COMPOSITION, FILE_ABONNE_MAX)
+if os.environ.get('BROKER_CLASSEMENTS', 'memoire') == 'mongo':
+    broker_classements = BrokerMongo(diffusion_classements, "evenements_classement", 16 * 1024 * 1024)
+else:
+    broker_classements = BrokerMemoire(diffusion_classements)
+
+def evenement_sse(message: dict) -> bytes:
+    return b"event: " + message['type'].encode() + b"\ndata: " + orjson.dumps(message) + b"\n\n"
+
+async def flux_evenements(composition_id: str, file: asyncio.Queue, request: Request):
+    """Messages de la composition au format text/event-stream, jusqu'à la déconnexion du client"""
+    try:
+        yield b"retry: 3000\n\n"
+        while not await request.is_disconnected():
+            try:
+                message = await asyncio.wait_for(file.get(), timeout=INTERVALLE_PING_S)
+            except asyncio.TimeoutError:
+                # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                yield b": ping\n\n"
+                continue
+            yield evenement_sse(message)
+    finally:
+        diffusion_classements.desabonner(composition_id, file)
+
+@api_router.get("/compositions/{composition_id}/evenements")
+async def suivre_classement(composition_id: str, request: Request, ecole: str = Depends(ecole_courante)):
+    """Flux SSE des rangs modifiés et des statistiques après chaque reclassement de la composition.
+
+    `statistiques` n'est nul que si elles n'étaient pas matérialisées : elles sont recalculées à la lecture.
+    Un message `resynchroniser` signale que des changements ont été perdus : le client relit les notes.
+    """
+    await verifier_composition(composition_id, ecole)
+    file = diffusion_classements.abonner(composition_id)
+    if file is None:
+        raise HTTPException(status_code=503, detail="Trop d'abonnés pour cette composition")
+    return StreamingResponse(
+        flux_evenements(composition_id, file, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ========== ROOT ==========
 
 @api_router.get("/")
@@ -451,6 +3079,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_index():
+    await creer_index()
+    await migrer_versions()
+    await migrer_ecoles()
+    await migrer_compteurs()
+    await abandonner_bulletins_interrompus()
+    await asyncio.to_thread(purger_fichiers_bulletins)
+    await broker_classements.demarrer()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await planificateur.vider()
+    await broker_classements.arreter()
+    if _pool_bulletins is not None:
+        _pool_bulletins.shutdown(cancel_futures=True)
     client.close()
@@ -0,0 +1,80 @@
+"""Micro-benchmark : sérialisation d'une liste de notes, chemin Pydantic contre chemin rapide orjson.
+
+    python benchmarks/bench_serialisation.py [--repetitions 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "gestion_scolaire_bench")
+
+import orjson  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+import server  # noqa: E402
+
+
+def generer_notes(nombre):
+    """Documents tels que lus dans Mongo avec la projection du modèle Note"""
+    notes = []
+    for i in range(nombre):
+        valeurs = {"etude_texte": 10 + i % 40, "aem": 5 + i % 45, "dictee": i % 20, "math": 20 + i % 30}
+        notes.append({
+            "id": str(uuid.uuid4()),
+            "composition_id": str(uuid.uuid4()),
+            "eleve_id": str(uuid.uuid4()),
+            **{k: float(v) for k, v in valeurs.items()},
+            **server.calculer_resultats(*map(float, valeurs.values())),
+            "rang": i + 1,
+        })
+    return notes
+
+
+def chemin_pydantic(notes, adaptateur):
+    """Ce que fait FastAPI avec response_model=List[Note] : validation, encodage, json.dumps"""
+    valide = adaptateur.validate_python(notes)
+    return json.dumps(jsonable_encoder(adaptateur.dump_python(valide, mode="json")), ensure_ascii=False).encode()
+
+
+def chemin_rapide(notes, adaptateur):
+    return orjson.dumps(notes)
+
+
+def mesurer(fonction, notes, adaptateur, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction(notes, adaptateur)
+        durees.append(time.perf_counter() - debut)
+    durees.sort()
+    return durees[len(durees) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repetitions", type=int, default=20)
+    args = parser.parse_args()
+
+    adaptateur = TypeAdapter(List[server.Note])
+    print(f"{'notes':>7} {'pydantic (ms)':>14} {'rapide (ms)':>12} {'gain':>6}")
+    for nombre in (1_000, 10_000):
+        notes = generer_notes(nombre)
+        assert orjson.loads(chemin_rapide(notes, adaptateur)) == [
+            {k: v for k, v in n.items() if k != "rang_en_attente"}
+            for n in json.loads(chemin_pydantic(notes, adaptateur))
+        ]
+        lent = mesurer(chemin_pydantic, notes, adaptateur, args.repetitions)
+        rapide = mesurer(chemin_rapide, notes, adaptateur, args.repetitions)
+        print(f"{nombre:>7} {lent:>14.2f} {rapide:>12.2f} {lent / rapide:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Banc de charge local : l'application FastAPI tourne dans le processus (transport ASGI)
+sur une base Mongo locale, mongomock-motor par défaut ou un mongod jetable via --mongo-url.
+
+    python benchmarks/charge.py                      # compare à la référence enregistrée
+    python benchmarks/charge.py --enregistrer        # enregistre une nouvelle référence
+    python benchmarks/charge.py --classes 5 --mongo-url mongodb://localhost:27017
+    python benchmarks/charge.py --tolerance 0.5      # p95 aussi, sur la machine de la référence
+
+Chaque scénario mesure la latence (p50/p95/p99) et le nombre d'allers-retours Mongo par
+requête. Le programme sort en erreur si un scénario fait plus d'allers-retours que la
+référence. La latence dépend de la machine : elle n'est comparée qu'à titre indicatif, sauf
+avec --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RACINE))
+sys.path.insert(0, str(RACINE / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "gestion_scolaire_bench")
+
+import logging  # noqa: E402
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+from tests.compteur_mongo import CompteurDB  # noqa: E402
+
+REFERENCES = Path(__file__).resolve().parent / "references"
+MOIS = ["Octobre", "Novembre", "Décembre", "Janvier", "Février", "Mars", "Avril", "Mai"]
+
+
+def centile(valeurs, p):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))]
+
+
+def ligne_note(eleve_id):
+    return {
+        "eleve_id": eleve_id,
+        "etude_texte": round(random.uniform(5, 50), 2),
+        "aem": round(random.uniform(5, 50), 2),
+        "dictee": round(random.uniform(0, 20), 2),
+        "math": round(random.uniform(5, 50), 2),
+    }
+
+
+async def peupler(db, nb_classes, nb_eleves, nb_compositions):
+    """Une école réaliste : classes × élèves × compositions, toutes les notes saisies"""
+    ecole = []
+    for c in range(nb_classes):
+        classe = {"id": str(uuid.uuid4()), "nom": "EPP BENCH", "niveau": f"CE{c % 2 + 1} {chr(65 + c)}",
+                  "annee_scolaire": "2024-2025", "enseignant": f"Enseignant {c}",
+                  "school_id": server.ECOLE_PAR_DEFAUT}
+        eleves = [{"id": str(uuid.uuid4()), "nom": f"NOM{i}", "prenom": f"Prenom{i}",
+                   "classe_id": classe["id"], "date_naissance": None,
+                   "school_id": server.ECOLE_PAR_DEFAUT} for i in range(nb_eleves)]
+        compositions = [{"id": str(uuid.uuid4()), "classe_id": classe["id"], "numero": n + 1,
+                         "date": "2024-10-15", "titre": f"Composition {n + 1}", "mois": MOIS[n % len(MOIS)],
+                         "school_id": server.ECOLE_PAR_DEFAUT}
+                        for n in range(nb_compositions)]
+        notes = []
+        for composition in compositions:
+            for eleve in eleves:
+                ligne = ligne_note(eleve["id"])
+                notes.append({
+                    "id": str(uuid.uuid4()), "composition_id": composition["id"], "eleve_id": eleve["id"],
+                    **{k: v for k, v in ligne.items() if k != "eleve_id"},
+                    **server.calculer_resultats(ligne["etude_texte"], ligne["aem"], ligne["dictee"], ligne["math"]),
+                    "rang": 999, "school_id": server.ECOLE_PAR_DEFAUT,
+                })
+        await db.classes.insert_one(classe)
+        await db.eleves.insert_many(eleves)
+        await db.compositions.insert_many(compositions)
+        await db.notes.insert_many(notes)
+        await server.reclasser_compositions([comp["id"] for comp in compositions])
+        ecole.append((classe, eleves, compositions))
+    return ecole
+
+
+async def scenario(client, db, iterations, preparer):
+    """preparer(i) retourne (méthode, url, corps) ; seule la requête elle-même est mesurée"""
+    durees, allers_retours = [], []
+    for i in range(iterations):
+        methode, url, corps = await preparer(i)
+        db.remettre_a_zero()
+        debut = time.perf_counter()
+        reponse = await client.request(methode, url, json=corps)
+        durees.append((time.perf_counter() - debut) * 1000)
+        reponse.raise_for_status()
+        allers_retours.append(db.allers_retours)
+    return {
+        "p50_ms": round(centile(durees, 50), 3),
+        "p95_ms": round(centile(durees, 95), 3),
+        "p99_ms": round(centile(durees, 99), 3),
+        "allers_retours": round(sum(allers_retours) / len(allers_retours), 2),
+    }
+
+
+async def executer(args):
+    random.seed(args.graine)
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client_mongo = AsyncIOMotorClient(args.mongo_url)
+        nom_base = f"bench_{uuid.uuid4().hex[:8]}"
+        base = client_mongo[nom_base]
+    else:
+        import mongomock_motor
+        client_mongo = None
+        base = mongomock_motor.AsyncMongoMockClient()["bench"]
+
+    db = CompteurDB(base)
+    server.db = db
+    server.planificateur = server.PlanificateurClassement(delai=0)
+    try:
+        await server.creer_index()
+        ecole = await peupler(db, args.classes, args.eleves, args.compositions)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            resultats = {}
+
+            def tirer():
+                return random.choice(ecole)
+
+            async def saisie_note(i):
+                _, _, compositions = tirer()
+                composition = random.choice(compositions)
+                note = await db.notes.find_one({"composition_id": composition["id"]}, {"_id": 0, "id": 1})
+                ligne = ligne_note(None)
+                del ligne["eleve_id"]
+                return "PUT", f"/api/notes/{note['id']}", ligne
+
+            async def saisie_lot(i):
+                _, eleves, compositions = tirer()
+                return "POST", "/api/notes/batch", {
+                    "composition_id": random.choice(compositions)["id"],
+                    "notes": [ligne_note(eleve["id"]) for eleve in eleves],
+                }
+
+            async def suivi(i):
+                # Cache vidé : mesure le calcul complet du suivi
+                server.cache_reponses.vider()
+                return "GET", f"/api/suivi/{tirer()[0]['id']}", None
+
+            async def suivi_cache(i):
+                return "GET", f"/api/suivi/{ecole[0][0]['id']}", None
+
+            async def statistiques(i):
+                server.cache_reponses.vider()
+                return "GET", f"/api/statistiques/{random.choice(tirer()[2])['id']}", None
+
+            async def tableau_de_bord(i):
+                # Toutes les notes de l'école, à chaque itération
+                server.cache_reponses.vider()
+                return "GET", "/api/tableau-de-bord", None
+
+            for nom, preparer in [("saisie_note", saisie_note), ("saisie_lot", saisie_lot), ("suivi", suivi),
+                                  ("suivi_cache", suivi_cache), ("statistiques", statistiques),
+                                  ("tableau_de_bord", tableau_de_bord)]:
+                resultats[nom] = await scenario(client, db, args.iterations, preparer)
+    finally:
+        if client_mongo is not None:
+            await client_mongo.drop_database(nom_base)
+            client_mongo.close()
+
+    return {
+        "moteur": "mongod" if args.mongo_url else "mongomock",
+        "ecole": {"classes": args.classes, "eleves": args.eleves, "compositions": args.compositions},
+        "iterations": args.iterations,
+        "scenarios": resultats,
+    }
+
+
+def comparer(resultat, reference, tolerance=None):
+    """Régressions et écarts indicatifs : plus d'allers-retours Mongo est toujours une régression,
+    un p95 au-delà de la tolérance seulement si elle est donnée"""
+    regressions, ecarts = [], []
+    for nom, mesure in resultat["scenarios"].items():
+        ref = reference["scenarios"].get(nom)
+        if ref is None:
+            continue
+        if mesure["allers_retours"] > ref["allers_retours"]:
+            regressions.append(f"{nom}: {mesure['allers_retours']} allers-retours (référence {ref['allers_retours']})")
+        ecart = f"{nom}: p95 {mesure['p95_ms']} ms (référence {ref['p95_ms']} ms)"
+        if tolerance is not None and mesure["p95_ms"] > ref["p95_ms"] * (1 + tolerance):
+            regressions.append(ecart)
+        else:
+            ecarts.append(ecart)
+    return regressions, ecarts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--classes", type=int, default=2)
+    parser.add_argument("--eleves", type=int, default=60)
+    parser.add_argument("--compositions", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--mongo-url", help="mongod jetable ; une base temporaire y est créée puis supprimée")
+    parser.add_argument("--tolerance", type=float,
+                        help="hausse de p95 tolérée (0.5 = +50 %%) ; sans elle, la latence n'est qu'indicative")
+    parser.add_argument("--enregistrer", action="store_true", help="enregistre le résultat comme référence")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    resultat = asyncio.run(executer(args))
+    print(json.dumps(resultat, indent=2, ensure_ascii=False))
+
+    fichier = REFERENCES / f"charge_{resultat['moteur']}_{args.classes}x{args.eleves}x{args.compositions}.json"
+    if args.enregistrer:
+        REFERENCES.mkdir(exist_ok=True)
+        fichier.write_text(json.dumps(resultat, indent=2, ensure_ascii=False) + "\n")
+        print(f"Référence enregistrée : {fichier}")
+        return
+    if not fichier.exists():
+        print(f"Pas de référence {fichier.name} : relancer avec --enregistrer")
+        return
+
+    regressions, ecarts = comparer(resultat, json.loads(fichier.read_text()), args.tolerance)
+    for ecart in ecarts:
+        print(f"latence {ecart}")
+    for regression in regressions:
+        print(f"RÉGRESSION {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
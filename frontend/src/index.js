@@ -1,8 +1,14 @@
 import React from "react";
 import ReactDOM from "react-dom/client";
+import axios from "axios";
 import "@/index.css";
 import App from "@/App";
 
+// École servie par ce déploiement ; sans en-tête, le serveur utilise l'école par défaut
+if (process.env.REACT_APP_SCHOOL_ID) {
+  axios.defaults.headers.common["X-School-Id"] = process.env.REACT_APP_SCHOOL_ID;
+}
+
 const root = ReactDOM.createRoot(document.getElementById("root"));
 root.render(
   <React.StrictMode>
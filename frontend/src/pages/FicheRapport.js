@@ -16,7 +16,6 @@ const FicheRapport = () => {
   const [composition, setComposition] = useState(null);
   const [classe, setClasse] = useState(null);
   const [notes, setNotes] = useState([]);
-  const [eleves, setEleves] = useState({});
   const [statistiques, setStatistiques] = useState(null);
 
   useEffect(() => {
@@ -25,25 +24,12 @@ const FicheRapport = () => {
 
   const chargerDonnees = async () => {
     try {
-      const compoRes = await axios.get(`${API}/compositions/${compositionId}`);
-      const compo = compoRes.data;
-      setComposition(compo);
-
-      const classeRes = await axios.get(`${API}/classes/${compo.classe_id}`);
-      setClasse(classeRes.data);
-
-      const notesRes = await axios.get(`${API}/notes?composition_id=${compositionId}`);
-      setNotes(notesRes.data);
-
-      const elevesRes = await axios.get(`${API}/eleves?classe_id=${compo.classe_id}`);
-      const elevesMap = {};
-      elevesRes.data.forEach(eleve => {
-        elevesMap[eleve.id] = eleve;
-      });
-      setEleves(elevesMap);
-
-      const statsRes = await axios.get(`${API}/statistiques/${compositionId}`);
-      setStatistiques(statsRes.data);
+      // Le serveur renvoie composition, classe, notes classées (avec nom de l'élève) et statistiques
+      const res = await axios.get(`${API}/rapports/${compositionId}`);
+      setComposition(res.data.composition);
+      setClasse(res.data.classe);
+      setNotes(res.data.notes);
+      setStatistiques(res.data.statistiques);
     } catch (error) {
       console.error('Erreur:', error);
       toast.error('Erreur lors du chargement');
@@ -110,8 +96,7 @@ const FicheRapport = () => {
               </TableHeader>
               <TableBody>
                 {notes.map((note) => {
-                  const eleve = eleves[note.eleve_id];
-                  if (!eleve) return null;
+                  const eleve = note.eleve;
                   return (
                     <TableRow key={note.id} data-testid={`rapport-row-${note.id}`}>
                       <TableCell style={{ border: '1px solid #ddd', textAlign: 'center', fontWeight: 'bold' }}>{note.rang}e</TableCell>
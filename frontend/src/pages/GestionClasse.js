@@ -9,7 +9,7 @@ import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@/components/ui/table';
 import { toast } from 'sonner';
-import { ArrowLeft, Plus, Users, FileText, Trash2, Edit, ClipboardList, BarChart } from 'lucide-react';
+import { ArrowLeft, Plus, Users, FileText, Trash2, Edit, ClipboardList, BarChart, Upload } from 'lucide-react';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -100,6 +100,28 @@ const GestionClasse = () => {
     }
   };
 
+  const handleImportEleves = async (e) => {
+    const fichier = e.target.files[0];
+    e.target.value = '';
+    if (!fichier) return;
+    const formData = new FormData();
+    formData.append('fichier', fichier);
+    try {
+      const { data } = await axios.post(`${API}/eleves/import?classe_id=${classeId}`, formData);
+      toast.success(`${data.inseres} élève(s) importé(s)`);
+      if (data.doublons.length > 0) {
+        toast.warning(`${data.doublons.length} doublon(s) ignoré(s)`);
+      }
+      if (data.erreurs.length > 0) {
+        const lignes = data.erreurs.slice(0, 5).map((erreur) => erreur.ligne).join(', ');
+        toast.error(`${data.erreurs.length} ligne(s) rejetée(s) : ${lignes}${data.erreurs.length > 5 ? '…' : ''}`);
+      }
+      chargerDonnees();
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Erreur lors de l\'import');
+    }
+  };
+
   const handleDeleteEleve = async (eleveId) => {
     if (window.confirm('Supprimer cet élève ?')) {
       try {
@@ -209,6 +231,18 @@ const GestionClasse = () => {
             <CardHeader>
               <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
                 <CardTitle>Liste des élèves</CardTitle>
+                <div style={{ display: 'flex', gap: '8px' }}>
+                <input
+                  id="import-eleves"
+                  type="file"
+                  accept=".csv,.xlsx"
+                  style={{ display: 'none' }}
+                  onChange={handleImportEleves}
+                />
+                <Button variant="outline" onClick={() => document.getElementById('import-eleves').click()} data-testid="btn-importer-eleves">
+                  <Upload size={20} style={{ marginRight: '8px' }} />
+                  Importer (CSV/XLSX)
+                </Button>
                 <Dialog open={openEleveDialog} onOpenChange={(open) => { setOpenEleveDialog(open); if (!open) resetEleveForm(); }}>
                   <DialogTrigger asChild>
                     <Button data-testid="btn-ajouter-eleve">
@@ -260,6 +294,7 @@ const GestionClasse = () => {
                     </form>
                   </DialogContent>
                 </Dialog>
+                </div>
               </div>
             </CardHeader>
             <CardContent>
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { useParams, useNavigate } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
@@ -19,43 +19,128 @@ const SaisieNotes = () => {
   const [eleves, setEleves] = useState([]);
   const [notes, setNotes] = useState({});
   const [notesExistantes, setNotesExistantes] = useState({});
+  // Rang de chaque note (par id), tenu à jour par le flux d'événements du serveur
+  const [rangs, setRangs] = useState({});
 
   useEffect(() => {
     chargerDonnees();
   }, [compositionId]);
 
+  // Jeton de synchronisation : après le premier chargement, seuls les changements sont demandés
+  const jeton = useRef(null);
+  const synchroniserRef = useRef(null);
+
+  // Rangs recalculés après les saisies des autres enseignants, sans relire les notes
+  useEffect(() => {
+    // EventSource n'envoie pas d'en-têtes : l'école passe dans l'URL
+    const ecole = process.env.REACT_APP_SCHOOL_ID;
+    const source = new EventSource(
+      `${API}/compositions/${compositionId}/evenements${ecole ? `?school_id=${encodeURIComponent(ecole)}` : ''}`
+    );
+    source.addEventListener('classement', (event) => {
+      const message = JSON.parse(event.data);
+      setRangs(prev => ({ ...prev, ...message.rangs }));
+    });
+    // Des messages ont été perdus : on repart des changements depuis le dernier jeton
+    source.addEventListener('resynchroniser', () => synchroniserRef.current());
+    return () => source.close();
+  }, [compositionId]);
+
+  const valeursNote = (note) => ({
+    etude_texte: note.etude_texte,
+    aem: note.aem,
+    dictee: note.dictee,
+    math: note.math
+  });
+
   const chargerDonnees = async () => {
     try {
       const compoRes = await axios.get(`${API}/compositions/${compositionId}`);
       const compo = compoRes.data;
-      setComposition(compo);
-
-      const classeRes = await axios.get(`${API}/classes/${compo.classe_id}`);
-      setClasse(classeRes.data);
 
-      const elevesRes = await axios.get(`${API}/eleves?classe_id=${compo.classe_id}`);
-      setEleves(elevesRes.data);
+      // Classe, élèves et notes en une seule requête
+      const { data } = await axios.get(`${API}/sync`, { params: { classe_id: compo.classe_id } });
+      jeton.current = data.jeton;
+      setComposition(compo);
+      setClasse(data.classes[0] || null);
+      setEleves(data.eleves);
 
-      const notesRes = await axios.get(`${API}/notes?composition_id=${compositionId}`);
       const notesMap = {};
       const notesExistMap = {};
-      notesRes.data.forEach(note => {
-        notesMap[note.eleve_id] = {
-          etude_texte: note.etude_texte,
-          aem: note.aem,
-          dictee: note.dictee,
-          math: note.math
-        };
-        notesExistMap[note.eleve_id] = note.id;
-      });
+      const rangsMap = {};
+      data.notes
+        .filter(note => note.composition_id === compositionId)
+        .forEach(note => {
+          notesMap[note.eleve_id] = valeursNote(note);
+          notesExistMap[note.eleve_id] = note.id;
+          rangsMap[note.id] = note.rang;
+        });
       setNotes(notesMap);
       setNotesExistantes(notesExistMap);
+      setRangs(rangsMap);
     } catch (error) {
       console.error('Erreur:', error);
       toast.error('Erreur lors du chargement');
     }
   };
 
+  const synchroniser = async (eleveEnregistre) => {
+    if (jeton.current === null) {
+      return chargerDonnees();
+    }
+    try {
+      const { data } = await axios.get(`${API}/sync`, {
+        params: { classe_id: composition.classe_id, since: jeton.current }
+      });
+      jeton.current = data.jeton;
+
+      const supprimes = new Set(data.suppressions.map(s => `${s.collection}:${s.id}`));
+      if (supprimes.has(`classes:${composition.classe_id}`) || supprimes.has(`compositions:${compositionId}`)) {
+        toast.error('Cette composition a été supprimée');
+        navigate('/');
+        return;
+      }
+      if (data.classes.length > 0) {
+        setClasse(data.classes[0]);
+      }
+
+      // Les suppressions s'appliquent avant les documents reçus
+      setEleves(prev => {
+        const parId = new Map(prev.filter(e => !supprimes.has(`eleves:${e.id}`)).map(e => [e.id, e]));
+        data.eleves.forEach(eleve => parId.set(eleve.id, eleve));
+        return [...parId.values()];
+      });
+
+      const notesRecues = data.notes.filter(note => note.composition_id === compositionId);
+      setNotesExistantes(prev => {
+        const suivant = Object.fromEntries(
+          Object.entries(prev).filter(
+            ([eleveId, noteId]) => !supprimes.has(`notes:${noteId}`) && !supprimes.has(`eleves:${eleveId}`)
+          )
+        );
+        notesRecues.forEach(note => { suivant[note.eleve_id] = note.id; });
+        return suivant;
+      });
+      setRangs(prev => {
+        const suivant = { ...prev };
+        notesRecues.forEach(note => { suivant[note.id] = note.rang; });
+        return suivant;
+      });
+      // Ne pas écraser les saisies en cours des autres élèves (leur rang a pu changer)
+      setNotes(prev => {
+        const suivant = { ...prev };
+        notesRecues
+          .filter(note => !(note.eleve_id in prev) || note.eleve_id === eleveEnregistre)
+          .forEach(note => { suivant[note.eleve_id] = valeursNote(note); });
+        return suivant;
+      });
+    } catch (error) {
+      console.error('Erreur:', error);
+      chargerDonnees();
+    }
+  };
+  synchroniserRef.current = synchroniser;
+
   const handleNoteChange = (eleveId, matiere, valeur) => {
     setNotes(prev => ({
       ...prev,
@@ -80,20 +165,23 @@ const SaisieNotes = () => {
     }
 
     try {
-      const data = {
-        composition_id: compositionId,
-        eleve_id: eleveId,
-        ...noteData
-      };
-
-      if (notesExistantes[eleveId]) {
-        await axios.put(`${API}/notes/${notesExistantes[eleveId]}`, noteData);
-        toast.success('Notes modifiées');
-      } else {
-        await axios.post(`${API}/notes`, data);
-        toast.success('Notes enregistrées');
+      // Création ou modification : même requête, rejouable sans doublon grâce à la clé
+      const url = `${API}/compositions/${compositionId}/eleves/${eleveId}/note`;
+      const config = { headers: { 'Idempotency-Key': crypto.randomUUID() }, timeout: 15000 };
+      let res;
+      for (let essai = 1; ; essai++) {
+        try {
+          res = await axios.put(url, valeursNote(noteData), config);
+          break;
+        } catch (error) {
+          // Pas de réponse (délai dépassé, réseau) : la note a pu être écrite, on rejoue avec la même clé
+          if (error.response || essai === 3) throw error;
+        }
       }
-      chargerDonnees();
+      setNotesExistantes(prev => ({ ...prev, [eleveId]: res.data.id }));
+      setRangs(prev => ({ ...prev, [res.data.id]: res.data.rang }));
+      toast.success('Notes enregistrées');
+      synchroniser(eleveId);
     } catch (error) {
       console.error('Erreur:', error);
       toast.error('Erreur lors de l\'enregistrement');
@@ -101,7 +189,7 @@ const SaisieNotes = () => {
   };
 
   const handleEnregistrerTout = async () => {
-    let succes = 0;
+    const lignes = [];
     let erreurs = 0;
 
     for (const eleveId of Object.keys(notes)) {
@@ -110,29 +198,37 @@ const SaisieNotes = () => {
         erreurs++;
         continue;
       }
+      lignes.push({
+        eleve_id: eleveId,
+        etude_texte: noteData.etude_texte || 0,
+        aem: noteData.aem || 0,
+        dictee: noteData.dictee || 0,
+        math: noteData.math || 0
+      });
+    }
 
+    if (lignes.length > 0) {
       try {
-        const data = {
+        // Une seule requête pour toute la classe, le serveur renvoie les notes classées
+        const res = await axios.post(`${API}/notes/batch`, {
           composition_id: compositionId,
-          eleve_id: eleveId,
-          ...noteData
-        };
-
-        if (notesExistantes[eleveId]) {
-          await axios.put(`${API}/notes/${notesExistantes[eleveId]}`, noteData);
-        } else {
-          await axios.post(`${API}/notes`, data);
-        }
-        succes++;
+          notes: lignes
+        });
+        const notesExistMap = {};
+        const rangsMap = {};
+        res.data.forEach(note => {
+          notesExistMap[note.eleve_id] = note.id;
+          rangsMap[note.id] = note.rang;
+        });
+        setNotesExistantes(notesExistMap);
+        setRangs(prev => ({ ...prev, ...rangsMap }));
+        toast.success(`${lignes.length} notes enregistrées`);
       } catch (error) {
-        erreurs++;
+        console.error('Erreur:', error);
+        erreurs += lignes.length;
       }
     }
 
-    if (succes > 0) {
-      toast.success(`${succes} notes enregistrées`);
-      chargerDonnees();
-    }
     if (erreurs > 0) {
       toast.error(`${erreurs} erreurs`);
     }
@@ -182,6 +278,7 @@ const SaisieNotes = () => {
                     <TableHead className="text-center">AEM<br/><span className="text-xs text-gray-500">/50</span></TableHead>
                     <TableHead className="text-center">Dictée<br/><span className="text-xs text-gray-500">/20</span></TableHead>
                     <TableHead className="text-center">Math<br/><span className="text-xs text-gray-500">/50</span></TableHead>
+                    <TableHead className="text-center">Rang</TableHead>
                     <TableHead className="text-center">Actions</TableHead>
                   </TableRow>
                 </TableHeader>
@@ -239,6 +336,9 @@ const SaisieNotes = () => {
                             className="text-center"
                           />
                         </TableCell>
+                        <TableCell className="text-center" data-testid={`rang-${eleve.id}`}>
+                          {rangs[notesExistantes[eleve.id]] ?? '-'}
+                        </TableCell>
                         <TableCell className="text-center">
                           <Button
                             size="sm"
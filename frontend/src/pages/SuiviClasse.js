@@ -113,11 +113,11 @@ const SuiviClasse = () => {
                       const eleve = item.eleve;
                       const notes = item.notes;
                       
-                      // Calculer la moyenne générale
-                      const moyennes = notes.filter(n => n !== null).map(n => n.moyenne);
-                      const moyenneGenerale = moyennes.length > 0
-                        ? (moyennes.reduce((a, b) => a + b, 0) / moyennes.length).toFixed(2)
+                      // Moyenne générale, rang annuel et tendance calculés par le serveur
+                      const moyenneGenerale = item.moyenne_annuelle !== null
+                        ? item.moyenne_annuelle.toFixed(2)
                         : '-';
+                      const tendance = item.tendance === null ? '' : item.tendance > 0 ? '▲' : item.tendance < 0 ? '▼' : '=';
 
                       return (
                         <TableRow key={eleve.id} data-testid={`suivi-row-${eleve.id}`}>
@@ -137,7 +137,10 @@ const SuiviClasse = () => {
                             </TableCell>
                           ))}
                           <TableCell style={{ border: '1px solid #ddd', textAlign: 'center', fontWeight: 'bold', fontSize: '16px', color: '#2563eb', background: '#f0f9ff' }}>
-                            {moyenneGenerale}
+                            {moyenneGenerale} {tendance}
+                            {item.rang_annuel !== null && (
+                              <div style={{ fontSize: '11px', fontWeight: 'normal', color: '#666' }}>Rang: {item.rang_annuel}e</div>
+                            )}
                           </TableCell>
                         </TableRow>
                       );
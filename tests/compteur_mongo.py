@@ -0,0 +1,60 @@
+"""Proxy de base Mongo qui enregistre chaque aller-retour vers le serveur"""
+
+# Méthodes de collection qui coûtent un aller-retour réseau
+OPERATIONS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_replace",
+    "find_one_and_delete", "insert_one", "insert_many", "update_one",
+    "update_many", "replace_one", "delete_one", "delete_many", "bulk_write",
+    "aggregate", "count_documents", "estimated_document_count", "distinct",
+    "create_index", "create_indexes", "index_information", "drop",
+}
+
+
+class CompteurCollection:
+    def __init__(self, collection, journal):
+        self._collection = collection
+        self._journal = journal
+
+    def __getattr__(self, nom):
+        attribut = getattr(self._collection, nom)
+        if nom not in OPERATIONS:
+            return attribut
+
+        def appel(*args, **kwargs):
+            self._journal.append((self._collection.name, nom, args, kwargs))
+            return attribut(*args, **kwargs)
+
+        return appel
+
+
+class CompteurDB:
+    """Enveloppe une base (motor ou mongomock-motor) et journalise les opérations"""
+
+    def __init__(self, base):
+        self._base = base
+        self.journal = []
+
+    def __getattr__(self, nom):
+        if nom.startswith("_"):
+            raise AttributeError(nom)
+        return CompteurCollection(getattr(self._base, nom), self.journal)
+
+    def __getitem__(self, nom):
+        return CompteurCollection(self._base[nom], self.journal)
+
+    async def command(self, *args, **kwargs):
+        self.journal.append((None, "command", args, kwargs))
+        return await self._base.command(*args, **kwargs)
+
+    @property
+    def allers_retours(self):
+        return len(self.journal)
+
+    def operations(self, collection=None, nom=None):
+        return [
+            (c, n, a, k) for (c, n, a, k) in self.journal
+            if (collection is None or c == collection) and (nom is None or n == nom)
+        ]
+
+    def remettre_a_zero(self):
+        self.journal.clear()
@@ -0,0 +1,72 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from tests.compteur_mongo import CompteurDB
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "gestion_scolaire_test")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def serveur(monkeypatch):
+    """Module server.py branché sur une base mongomock vierge qui compte les allers-retours"""
+    pytest.importorskip("fastapi")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    base = mongomock_motor.AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    monkeypatch.setattr(server, "db", CompteurDB(base))
+    # Un planificateur par test : ses tâches appartiennent à la boucle du test
+    monkeypatch.setattr(server, "planificateur", server.PlanificateurClassement(delai=0))
+    monkeypatch.setattr(server, "cache_reponses", server.CacheReponses(taille_max=64))
+    monkeypatch.setattr(server, "_versions_supposees", {})
+    monkeypatch.setattr(server, "metriques", server.Metriques())
+    diffusion = server.DiffusionClassements(abonnes_max=2, file_max=4)
+    monkeypatch.setattr(server, "diffusion_classements", diffusion)
+    monkeypatch.setattr(server, "broker_classements", server.BrokerMemoire(diffusion))
+    return server
+
+
+@pytest.fixture
+async def client(serveur):
+    httpx = pytest.importorskip("httpx")
+    transport = httpx.ASGITransport(app=serveur.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
+
+
+@pytest.fixture
+def creer_classe(client):
+    """Fabrique une classe avec ses élèves et ses compositions via l'API"""
+
+    async def creer(nb_eleves=3, nb_compositions=1):
+        classe = (await client.post("/api/classes", json={
+            "nom": "EPP TEST", "niveau": "CE1 A", "annee_scolaire": "2024-2025", "enseignant": "Mme TEST",
+        })).json()
+        eleves = [
+            (await client.post("/api/eleves", json={
+                "nom": f"NOM{i}", "prenom": f"Prenom{i}", "classe_id": classe["id"],
+            })).json()
+            for i in range(nb_eleves)
+        ]
+        compositions = [
+            (await client.post("/api/compositions", json={
+                "classe_id": classe["id"], "numero": numero, "date": "2024-10-15",
+                "titre": f"Composition {numero}", "mois": "Octobre",
+            })).json()
+            for numero in range(1, nb_compositions + 1)
+        ]
+        return classe, eleves, compositions
+
+    return creer
@@ -0,0 +1,91 @@
+"""Nombre de requêtes Mongo par route d'écriture.
+
+Chaque réservation de versions compte deux allers-retours : l'incrément du compteur et sa libération.
+Chaque reclassement en compte deux de plus : la prise et la libération du bail de la composition.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+NOTE = {"etude_texte": 30, "aem": 30, "dictee": 12, "math": 30}
+
+
+@pytest.fixture
+async def donnees(client, creer_classe):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=3)
+    notes = (await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [{"eleve_id": eleve["id"], **NOTE, "math": 10 * i} for i, eleve in enumerate(eleves)],
+    })).json()
+    return classe, eleves, composition, notes
+
+
+async def _mesurer(serveur, requete):
+    serveur.db.remettre_a_zero()
+    reponse = await requete
+    assert reponse.status_code == 200, reponse.text
+    return serveur.db.allers_retours, reponse.json()
+
+
+async def test_modifier_classe(client, serveur, donnees):
+    classe = donnees[0]
+    allers_retours, classe_modifiee = await _mesurer(serveur, client.put(
+        f"/api/classes/{classe['id']}", json={**classe, "enseignant": "M. NOUVEAU"}))
+    # Version de synchronisation (réservée puis libérée) et find_one_and_update
+    assert allers_retours == 3
+    assert classe_modifiee["enseignant"] == "M. NOUVEAU"
+
+
+async def test_modifier_eleve(client, serveur, donnees):
+    eleve = donnees[1][0]
+    allers_retours, eleve_modifie = await _mesurer(serveur, client.put(
+        f"/api/eleves/{eleve['id']}", json={**eleve, "prenom": "Awa"}))
+    # Classe cible relue (pas de cache par processus), version, find_one_and_update puis invalidation
+    assert allers_retours == 5
+    assert eleve_modifie["prenom"] == "Awa"
+
+
+async def test_modifier_composition(client, serveur, donnees):
+    composition = donnees[2]
+    allers_retours, composition_modifiee = await _mesurer(serveur, client.put(
+        f"/api/compositions/{composition['id']}", json={**composition, "mois": "Novembre"}))
+    # Classe cible relue, version, find_one_and_update puis invalidation
+    assert allers_retours == 5
+    assert composition_modifiee["mois"] == "Novembre"
+
+
+async def test_modifier_note(client, serveur, donnees):
+    derniere = donnees[3][-1]
+    allers_retours, note = await _mesurer(serveur, client.put(
+        f"/api/notes/{derniere['id']}", json={**NOTE, "math": 50}))
+    # Version et find_one_and_update, puis reclassement incrémental : comptage et lecture de la fenêtre,
+    # version et écriture des rangs, lecture des colonnes notées et écriture des statistiques, infos de
+    # la composition, progression de l'élève, comptage et lecture de la fenêtre des rangs annuels,
+    # écriture de la progression, versions du cache
+    assert allers_retours == 18
+    assert note["rang"] == 1
+
+
+async def test_creer_note(client, serveur, donnees):
+    classe, _, composition, _ = donnees
+    eleve = (await client.post("/api/eleves", json={"nom": "NOUVEL", "prenom": "Eleve", "classe_id": classe["id"]})).json()
+    allers_retours, note = await _mesurer(serveur, client.post(
+        "/api/notes", json={"composition_id": composition["id"], "eleve_id": eleve["id"], **NOTE, "math": 50}))
+    # Les infos de la composition sont relues par la vérification puis par le reclassement ;
+    # l'élève est cherché dans la classe de la composition
+    assert allers_retours == 16
+    assert note["rang"] == 1
+
+
+async def test_supprimer_note(client, serveur, donnees):
+    premiere = donnees[3][0]
+    allers_retours, _ = await _mesurer(serveur, client.delete(f"/api/notes/{premiere['id']}"))
+    # La pierre tombale (et la classe de la composition qu'elle porte) s'ajoute à la suppression
+    assert allers_retours == 16
+
+
+async def test_modifier_introuvable(client):
+    assert (await client.put("/api/notes/inconnue", json=NOTE)).status_code == 404
+    reponse = await client.put("/api/classes/inconnue", json={
+        "nom": "X", "niveau": "CE1", "annee_scolaire": "2024-2025", "enseignant": "Y"})
+    assert reponse.status_code == 404
@@ -0,0 +1,110 @@
+import asyncio
+import io
+import zipfile
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def pool(serveur, monkeypatch, tmp_path):
+    pytest.importorskip("reportlab")
+    monkeypatch.setattr(serveur, "DOSSIER_BULLETINS", tmp_path)
+    monkeypatch.setattr(serveur, "PROCESSUS_BULLETINS", 2)
+    monkeypatch.setattr(serveur, "_pool_bulletins", None)
+    pool = serveur.pool_bulletins()
+    yield pool
+    pool.shutdown()
+
+
+async def _attendre(client, travail_id):
+    for _ in range(200):
+        travail = (await client.get(f"/api/bulletins/{travail_id}")).json()
+        if travail["statut"] in ("termine", "echec"):
+            return travail
+        await asyncio.sleep(0.05)
+    raise AssertionError("travail de bulletins non terminé")
+
+
+async def test_bulletins_ecole(client, pool, creer_classe):
+    for _ in range(2):
+        _, eleves, compositions = await creer_classe(nb_eleves=3, nb_compositions=2)
+        for composition in compositions:
+            await client.post("/api/notes/batch", json={
+                "composition_id": composition["id"],
+                # Le dernier élève est absent ; les deux autres sont ex æquo
+                "notes": [
+                    {"eleve_id": eleve["id"], "etude_texte": 40, "aem": 40, "dictee": 15, "math": 40}
+                    for eleve in eleves[:2]
+                ],
+            })
+
+    response = await client.post("/api/bulletins", json={})
+    assert response.status_code == 202
+    travail = await _attendre(client, response.json()["id"])
+
+    assert travail["statut"] == "termine"
+    assert (travail["classes"], travail["classes_terminees"], travail["bulletins"]) == (2, 2, 6)
+
+    archive = zipfile.ZipFile(io.BytesIO((await client.get(f"/api/bulletins/{travail['id']}/zip")).content))
+    noms = archive.namelist()
+    assert len(noms) == 6
+    assert all(nom.startswith("EPP_TEST/NOM") and nom.endswith(".pdf") for nom in noms)
+    assert archive.read(noms[0]).startswith(b"%PDF")
+
+
+async def test_bulletins_mois_sans_composition(client, pool, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=2)
+
+    response = await client.post("/api/bulletins", json={"classe_id": classe["id"], "mois": "Juin"})
+    travail = await _attendre(client, response.json()["id"])
+
+    assert (travail["statut"], travail["classes"], travail["bulletins"]) == ("termine", 0, 0)
+
+
+async def test_bulletins_pas_prets_ou_inconnus(client, serveur):
+    assert (await client.post("/api/bulletins", json={"classe_id": "inconnue"})).status_code == 404
+    assert (await client.get("/api/bulletins/inconnu")).status_code == 404
+
+    travail = serveur.TravailBulletins()
+    await serveur.db.travaux_bulletins.insert_one(travail.model_dump())
+    assert (await client.get(f"/api/bulletins/{travail.id}/zip")).status_code == 409
+
+
+async def test_pool_sans_fork(pool):
+    # Le processus parent a déjà des threads (Motor) : pas de fork
+    assert pool._mp_context.get_start_method() == "spawn"
+
+
+async def test_travaux_interrompus_en_echec(client, serveur):
+    ancien = datetime.now(timezone.utc) - timedelta(seconds=serveur.DELAI_ABANDON_BULLETINS_S + 1)
+    interrompus = [serveur.TravailBulletins(statut="en_cours", actif_le=ancien) for _ in range(2)]
+    actif = serveur.TravailBulletins(statut="en_cours")
+    await serveur.db.travaux_bulletins.insert_many([t.model_dump() for t in (*interrompus, actif)])
+
+    # Au démarrage, puis à la lecture pour ceux d'un worker arrêté plus tard
+    await serveur.abandonner_bulletins_interrompus()
+    assert (await client.get(f"/api/bulletins/{interrompus[0].id}")).json()["statut"] == "echec"
+    assert (await client.get(f"/api/bulletins/{actif.id}")).json()["statut"] == "en_cours"
+
+    await serveur.db.travaux_bulletins.update_one({"id": actif.id}, {"$set": {"actif_le": ancien}})
+    assert (await client.get(f"/api/bulletins/{actif.id}")).json()["statut"] == "echec"
+
+
+async def test_archives_expirees(client, serveur, monkeypatch, tmp_path):
+    monkeypatch.setattr(serveur, "DOSSIER_BULLETINS", tmp_path)
+    travail = serveur.TravailBulletins(statut="termine")
+    await serveur.db.travaux_bulletins.insert_one(travail.model_dump())
+    archive, recente = serveur.chemin_bulletins(travail.id), serveur.chemin_bulletins("recente")
+    archive.write_bytes(b"zip")
+    recente.write_bytes(b"zip")
+    vieux = time.time() - serveur.DUREE_BULLETINS_S - 1
+    os.utime(archive, (vieux, vieux))
+
+    assert serveur.purger_fichiers_bulletins() == 1
+    assert recente.exists()
+    assert (await client.get(f"/api/bulletins/{travail.id}/zip")).status_code == 410
@@ -0,0 +1,101 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+NOTE = {"etude_texte": 30, "aem": 30, "dictee": 12, "math": 30}
+
+
+async def _saisir(client, eleves, composition):
+    return (await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [{"eleve_id": eleve["id"], **NOTE, "math": 10 * i} for i, eleve in enumerate(eleves)],
+    })).json()
+
+
+@pytest.mark.parametrize("route", [
+    "/api/eleves?classe_id={classe}",
+    "/api/compositions?classe_id={classe}",
+    "/api/notes?composition_id={composition}",
+    "/api/suivi/{classe}",
+    "/api/statistiques/{composition}",
+])
+async def test_get_conditionnel(client, serveur, creer_classe, route):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=2)
+    await _saisir(client, eleves, composition)
+    url = route.format(classe=classe["id"], composition=composition["id"])
+
+    premiere = await client.get(url)
+    etag = premiere.headers["ETag"]
+
+    serveur.db.remettre_a_zero()
+    seconde = await client.get(url, headers={"If-None-Match": etag})
+    assert seconde.status_code == 304
+    # Seule la lecture des versions atteint Mongo
+    assert serveur.db.allers_retours == 1
+
+    serveur.db.remettre_a_zero()
+    depuis_cache = await client.get(url)
+    assert depuis_cache.json() == premiere.json()
+    assert serveur.db.allers_retours == 1
+
+
+async def test_invalidation_par_les_notes(client, creer_classe):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=2)
+    notes = await _saisir(client, eleves, composition)
+    url = f"/api/suivi/{classe['id']}"
+    etag = (await client.get(url)).headers["ETag"]
+    etag_notes = (await client.get(f"/api/notes?composition_id={composition['id']}")).headers["ETag"]
+
+    modifiee = (await client.put(f"/api/notes/{notes[-1]['id']}", json={**NOTE, "math": 0})).json()
+
+    reponse = await client.get(url, headers={"If-None-Match": etag})
+    assert reponse.status_code == 200
+    note = next(n for ligne in reponse.json()["suivi"] for n in ligne["notes"] if n["id"] == notes[-1]["id"])
+    assert note["moyenne"] == modifiee["moyenne"] and note["rang"] == 2
+    reponse = await client.get(f"/api/notes?composition_id={composition['id']}", headers={"If-None-Match": etag_notes})
+    assert reponse.status_code == 200
+
+
+async def test_invalidation_par_les_eleves(client, creer_classe):
+    classe, eleves, _ = await creer_classe(nb_eleves=2)
+    autre, _, _ = await creer_classe(nb_eleves=0, nb_compositions=0)
+    url = f"/api/eleves?classe_id={classe['id']}"
+    assert len((await client.get(url)).json()) == 2
+
+    await client.post("/api/eleves", json={"nom": "NOUVEL", "prenom": "Eleve", "classe_id": classe["id"]})
+    assert len((await client.get(url)).json()) == 3
+
+    await client.put(f"/api/eleves/{eleves[0]['id']}", json={**eleves[0], "classe_id": autre["id"]})
+    assert len((await client.get(url)).json()) == 2
+
+    await client.delete(f"/api/eleves/{eleves[1]['id']}")
+    assert len((await client.get(url)).json()) == 1
+
+
+async def test_cache_borne(serveur):
+    cache = serveur.CacheReponses(taille_max=2)
+    for etag in ("a", "b", "c"):
+        cache.ecrire(etag, b"{}", {})
+    assert cache.lire("a") is None
+    assert cache.lire("c") == (b"{}", {})
+
+
+async def test_composition_changee_par_un_autre_worker(client, serveur, creer_classe):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=2)
+    notes = await _saisir(client, eleves, composition)
+    url = "/api/classements?mois=Novembre"
+    await client.get(f"/api/notes?composition_id={composition['id']}")
+
+    # Un autre worker change le mois de la composition : ce processus n'en sait rien
+    await serveur.db.compositions.update_one({"id": composition["id"]}, {"$set": {"mois": "Novembre"}})
+    await serveur.invalider([serveur.portee_ecole(serveur.ECOLE_PAR_DEFAUT, "classements:Novembre")])
+    avant = await client.get(url)
+    await client.put(f"/api/notes/{notes[0]['id']}", json={**NOTE, "math": 50})
+    # La modification de note invalide le classement du nouveau mois
+    apres = await client.get(url)
+    assert apres.headers["ETag"] != avant.headers["ETag"]
+
+    # Puis la supprime : plus aucune note ne peut y être rattachée
+    await serveur.db.compositions.delete_one({"id": composition["id"]})
+    reponse = await client.post("/api/notes", json={"composition_id": composition["id"], "eleve_id": eleves[0]["id"], **NOTE})
+    assert reponse.status_code == 404
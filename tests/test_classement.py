@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+from hypothesis import HealthCheck, given, settings, strategies as st
+
+from tests.compteur_mongo import CompteurDB
+
+pytestmark = pytest.mark.anyio
+
+
+def _note(id, total, rang=999):
+    return {
+        "id": id, "composition_id": "c1", "eleve_id": f"e{id}", "etude_texte": total / 4, "aem": total / 4,
+        "dictee": total / 4, "math": total / 4, "total": total, "moyenne": round(total / 17, 2), "rang": rang,
+    }
+
+
+def test_attribuer_rangs_ex_aequo(serveur):
+    notes = [_note("b", 120), _note("a", 150), _note("d", 120), _note("c", 90)]
+    assert serveur.attribuer_rangs(notes) == {"a": 1, "b": 2, "d": 2, "c": 4}
+
+
+def test_attribuer_rangs_deterministe(serveur):
+    notes = [_note(str(i), 100) for i in range(5)]
+    assert serveur.attribuer_rangs(notes) == serveur.attribuer_rangs(list(reversed(notes)))
+
+
+async def test_calculer_classement_n_ecrit_que_les_rangs_modifies(serveur):
+    await serveur.db.compositions.insert_one({"id": "c1", "classe_id": "k1", "numero": 1, "mois": "Octobre"})
+    await serveur.db.notes.insert_many([
+        _note("a", 150, rang=1), _note("b", 120, rang=2), _note("c", 90, rang=7),
+    ])
+    serveur.db.remettre_a_zero()
+    rangs = await serveur.calculer_classement("c1")
+
+    assert rangs == {"a": 1, "b": 2, "c": 3}
+    ecritures = serveur.db.operations("notes", "bulk_write")
+    assert len(serveur.db.operations("notes")) == 2
+    assert len(ecritures) == 1
+    _, _, (operations,), kwargs = ecritures[0]
+    assert kwargs == {"ordered": False}
+    assert [op._filter for op in operations] == [{"id": "c"}]
+    note_c = await serveur.db.notes.find_one({"id": "c"})
+    assert note_c["rang"] == 3
+
+
+async def test_calculer_classement_materialise_les_statistiques(serveur):
+    await serveur.db.notes.insert_many([_note("a", 150), _note("b", 120), _note("c", 51)])
+    await serveur.calculer_classement("c1")
+
+    serveur.db.remettre_a_zero()
+    stats = await serveur.lire_statistiques("c1")
+
+    assert serveur.db.allers_retours == 1
+    assert stats["effectif"] == 3 and stats["admis"] == 2
+    assert stats["repartition"] == {"A": 1, "B": 1, "C": 0, "D": 1}
+    assert stats["matieres"]["math"] == {"moyenne": 26.75, "min": 12.75, "max": 37.5, "mediane": 30.0}
+    assert stats["moyenne_classe"] == round((8.82 + 7.06 + 3.0) / 3, 2)
+
+
+# Peu de totaux possibles : beaucoup d'ex aequo, aux bornes des fenêtres comme à l'intérieur
+TOTAUX = st.sampled_from([float(t) for t in range(0, 171, 10)])
+
+
+def _modifier(note, total):
+    """Nouvelle version de la note pour un total donné, comme la calculerait le serveur"""
+    return {**note, **{m: total / 4 for m in ("etude_texte", "aem", "dictee", "math")},
+            "total": total, "moyenne": round(total / 17, 2)}
+
+
+@settings(max_examples=60, deadline=None, suppress_health_check=[HealthCheck.function_scoped_fixture])
+@given(
+    totaux=st.lists(TOTAUX, min_size=1, max_size=25),
+    modifications=st.lists(st.tuples(st.integers(min_value=0), TOTAUX), min_size=1, max_size=5),
+)
+def test_reclasser_note_equivaut_au_calcul_complet(serveur, monkeypatch, totaux, modifications):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(serveur, "db", CompteurDB(mongomock_motor.AsyncMongoMockClient()["proprietes"]))
+
+    async def scenario():
+        # Une seconde composition fixe : la moyenne annuelle n'est pas la moyenne de c1
+        await serveur.db.compositions.insert_many([
+            {"id": f"c{n}", "classe_id": "k1", "numero": n, "mois": "Octobre"} for n in (1, 2)
+        ])
+        notes = [_note(f"n{i:02d}", total) for i, total in enumerate(totaux)]
+        await serveur.db.notes.insert_many(notes)
+        await serveur.db.notes.insert_many([
+            {**_note(f"m{i:02d}", total), "composition_id": "c2", "eleve_id": note["eleve_id"]}
+            for i, (note, total) in enumerate(zip(notes, reversed(totaux)))
+        ])
+        await serveur.reclasser_compositions(["c1", "c2"])
+
+        for index, nouveau_total in modifications:
+            position = index % len(notes)
+            ancienne, notes[position] = notes[position], _modifier(notes[position], nouveau_total)
+            note = notes[position]
+            await serveur.db.notes.update_one({"id": note["id"]}, {"$set": serveur.valeurs_note(note)})
+            fenetre = await serveur.reclasser_note(
+                "c1", note["id"], serveur.valeurs_note(ancienne), serveur.valeurs_note(note)
+            )
+
+            attendus = serveur.attribuer_rangs(notes)
+            assert fenetre[note["id"]] == attendus[note["id"]]
+            stockes = await serveur.db.notes.find({"composition_id": "c1"}, {"_id": 0, "id": 1, "rang": 1}).to_list(None)
+            assert {n["id"]: n["rang"] for n in stockes} == attendus
+
+            # Statistiques exactes, médianes et extrêmes compris
+            assert await serveur.lire_statistiques("c1") == serveur.calculer_statistiques(notes)
+
+            # Progression et rangs annuels identiques à une reconstruction complète
+            progression = await serveur.db.progression.find({}, {"_id": 0}).sort("eleve_id", 1).to_list(None)
+            await serveur.reconstruire_progression(["k1"])
+            assert progression == await serveur.db.progression.find({}, {"_id": 0}).sort("eleve_id", 1).to_list(None)
+
+    asyncio.run(scenario())
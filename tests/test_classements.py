@@ -0,0 +1,133 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def ecole(client):
+    """Deux classes de CE1 et une de CE2, chacune avec une composition d'Octobre"""
+
+    async def classe(nom, niveau, maths):
+        classe = (await client.post("/api/classes", json={
+            "nom": nom, "niveau": niveau, "annee_scolaire": "2024-2025", "enseignant": "Mme TEST",
+        })).json()
+        composition = (await client.post("/api/compositions", json={
+            "classe_id": classe["id"], "numero": 1, "date": "2024-10-15", "titre": "Composition 1", "mois": "Octobre",
+        })).json()
+        eleves = [
+            (await client.post("/api/eleves", json={
+                "nom": f"{nom}-{i}", "prenom": "Prenom", "classe_id": classe["id"],
+            })).json()
+            for i in range(len(maths))
+        ]
+        notes = (await client.post("/api/notes/batch", json={
+            "composition_id": composition["id"],
+            "notes": [
+                {"eleve_id": eleve["id"], "etude_texte": 30, "aem": 30, "dictee": 10, "math": math}
+                for eleve, math in zip(eleves, maths)
+            ],
+        })).json()
+        return classe, notes
+
+    return [
+        await classe("CE1 A", "CE1 A", [50, 20]),
+        await classe("CE1 B", "CE1 B", [40, 20, 10]),
+        await classe("CE2 A", "CE2", [45]),
+    ]
+
+
+async def test_classement_entre_classes_d_un_niveau(client, ecole):
+    resultat = (await client.get("/api/classements", params={"mois": "Octobre", "niveau": "ce1"})).json()
+
+    assert resultat["effectif"] == 5
+    lignes = [
+        (ligne["classe"]["nom"], ligne["total"], ligne["rang_classe"], ligne["rang_general"], ligne["percentile"])
+        for ligne in resultat["classement"]
+    ]
+    assert lignes == [
+        ("CE1 A", 120, 1, 1, 100.0),
+        ("CE1 B", 110, 1, 2, 75.0),
+        ("CE1 A", 90, 2, 3, 50.0),
+        ("CE1 B", 90, 2, 3, 50.0),
+        ("CE1 B", 80, 3, 5, 0.0),
+    ]
+    assert [ligne["math"] for ligne in resultat["premiers_par_matiere"]["math"]] == [50, 40, 20]
+
+
+async def test_classement_de_l_ecole(client, ecole):
+    resultat = (await client.get("/api/classements", params={"mois": "Octobre", "limite": 2, "premiers": 1})).json()
+
+    assert resultat["effectif"] == 6
+    assert [(ligne["classe"]["nom"], ligne["total"], ligne["rang_general"]) for ligne in resultat["classement"]] == [
+        ("CE1 A", 120, 1), ("CE2 A", 115, 2),
+    ]
+    assert resultat["premiers_par_matiere"]["math"][0]["classe"]["nom"] == "CE1 A"
+
+    vide = (await client.get("/api/classements", params={"mois": "Juin"})).json()
+    assert vide["effectif"] == 0 and vide["classement"] == []
+
+
+async def test_classement_en_cache_jusqu_a_une_note_du_mois(client, serveur, ecole):
+    params = {"mois": "Octobre", "niveau": "CE1"}
+    etag = (await client.get("/api/classements", params=params)).headers["ETag"]
+
+    serveur.db.remettre_a_zero()
+    reponse = await client.get("/api/classements", params=params, headers={"If-None-Match": etag})
+    assert reponse.status_code == 304
+
+    _, notes = ecole[0]
+    await client.put(f"/api/notes/{notes[1]['id']}", json={"etude_texte": 50, "aem": 50, "dictee": 20, "math": 50})
+    reponse = await client.get("/api/classements", params=params, headers={"If-None-Match": etag})
+    assert reponse.status_code == 200
+    assert reponse.json()["classement"][0]["total"] == 170
+
+
+async def test_pipeline_des_fenetres(client, serveur, ecole, monkeypatch):
+    monkeypatch.setattr(serveur, "_fenetres_disponibles", None)
+    serveur.db.remettre_a_zero()
+    await client.get("/api/classements", params={"mois": "Octobre", "limite": 7})
+
+    # mongomock refuse $setWindowFields : premier essai avec fenêtres, puis repli en Python
+    avec, sans = serveur.db.operations("compositions", "aggregate")
+    facette = avec[2][0][-1]["$facet"]
+    fenetres, centile, tri, limite = facette["classement"]
+    assert fenetres == {"$setWindowFields": {
+        "partitionBy": "$annee_scolaire",
+        "sortBy": {"total": -1},
+        "output": {
+            "rang_general": {"$rank": {}},
+            "effectif": {"$count": {}, "window": {"documents": ["unbounded", "unbounded"]}},
+        },
+    }}
+    assert list(centile["$set"]) == ["percentile"]
+    assert tri == {"$sort": {"annee_scolaire": 1, "rang_general": 1, "eleve.nom": 1}}
+    assert limite == {"$limit": 7}
+    assert sans[2][0][-1]["$facet"]["classement"] == [{"$sort": {"annee_scolaire": 1, "total": -1, "eleve.nom": 1}}]
+    assert serveur._fenetres_disponibles is False
+
+
+async def test_seule_une_etape_inconnue_desactive_les_fenetres(serveur, monkeypatch):
+    erreurs = [serveur.OperationFailure("délai dépassé", code=50)]
+
+    class Curseur:
+        async def to_list(self, longueur):
+            if erreurs:
+                raise erreurs.pop()
+            return [{"effectif": [], "classement": [], **{m: [] for m in serveur.MATIERES}}]
+
+    class Compositions:
+        def aggregate(self, pipeline):
+            return Curseur()
+
+    monkeypatch.setattr(serveur, "db", type("Base", (), {"compositions": Compositions()})())
+    monkeypatch.setattr(serveur, "_fenetres_disponibles", None)
+    arguments = ("ecole", "Octobre", None, None, 10, 3)
+
+    # Échec passager : l'erreur remonte, les fenêtres restent tentées
+    with pytest.raises(serveur.OperationFailure):
+        await serveur.calculer_classement_general(*arguments)
+    assert serveur._fenetres_disponibles is None
+
+    erreurs.append(serveur.OperationFailure("Unrecognized pipeline stage name", code=serveur.ETAPE_INCONNUE))
+    await serveur.calculer_classement_general(*arguments)
+    assert serveur._fenetres_disponibles is False
@@ -0,0 +1,91 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+pytestmark = pytest.mark.anyio
+
+
+async def _saisir(client, composition, eleves, lignes):
+    await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [
+            {"eleve_id": eleve["id"], **dict(zip(("etude_texte", "aem", "dictee", "math"), ligne))}
+            for eleve, ligne in zip(eleves, lignes)
+        ],
+    })
+
+
+async def test_analyser_notes_correspond_au_calcul_direct(serveur):
+    notes = [
+        {"etude_texte": e, "aem": a, "dictee": d, "math": m, "total": e + a + d + m, "moyenne": round((e + a + d + m) / 17, 2)}
+        for e, a, d, m in [(50, 40, 20, 45), (10, 30, 5, 20), (30, 30, 10, 30), (25, 0, 12, 50)]
+    ]
+    analyse = serveur.analyser_notes(serveur.matrice_notes(notes))
+
+    math = [n["math"] for n in notes]
+    assert analyse["effectif"] == 4
+    assert analyse["colonnes"]["math"]["ecart_type"] == round(float(np.std(math)), 2)
+    assert analyse["colonnes"]["math"]["quantiles"]["q50"] == round(float(np.median(math)), 2)
+    assert analyse["colonnes"]["math"]["taux_reussite"] == 75.0
+    assert analyse["colonnes"]["dictee"]["histogramme"]["effectifs"] == [0, 0, 1, 0, 0, 1, 1, 0, 0, 1]
+    assert analyse["colonnes"]["moyenne"]["taux_reussite"] == 75.0
+    assert analyse["correlations"]["math"]["math"] == 1.0
+    assert analyse["correlations"]["etude_texte"]["dictee"] == round(
+        float(np.corrcoef([50, 10, 30, 25], [20, 5, 10, 12])[0, 1]), 2)
+
+
+async def test_resumer_par_groupe(serveur):
+    moyennes = [8.0, 4.0, 6.0, 3.0, 5.0]
+    matrice = np.zeros((5, 6))
+    matrice[:, 5] = moyennes
+    resume = serveur.resumer_par_groupe(matrice, np.array(["b", "a", "b", "a", "b"]))
+
+    assert resume["a"] == {"effectif": 2, "moyenne": 3.5, "ecart_type": 0.5, "mediane": 3.5, "taux_reussite": 0.0}
+    assert resume["b"]["mediane"] == 6.0
+    assert resume["b"]["ecart_type"] == round(float(np.std([8.0, 6.0, 5.0])), 2)
+    assert resume["b"]["taux_reussite"] == 100.0
+
+
+async def test_distribution_composition(client, creer_classe):
+    _, eleves, (composition,) = await creer_classe(nb_eleves=3)
+    await _saisir(client, composition, eleves, [(50, 50, 20, 50), (10, 10, 4, 10), (25, 25, 10, 25)])
+
+    distribution = (await client.get(f"/api/statistiques/{composition['id']}/distribution")).json()
+
+    assert distribution["effectif"] == 3
+    assert distribution["colonnes"]["total"]["max"] == 170
+    assert sum(distribution["colonnes"]["total"]["histogramme"]["effectifs"]) == 3
+    assert (await client.get("/api/statistiques/inconnue/distribution")).status_code == 404
+
+
+async def test_distribution_niveau_et_tableau_de_bord(client, serveur, creer_classe):
+    for lignes in ([(50, 50, 20, 50), (10, 10, 4, 10)], [(25, 25, 10, 25)]):
+        _, eleves, (composition,) = await creer_classe(nb_eleves=len(lignes))
+        await _saisir(client, composition, eleves, lignes)
+
+    niveau = (await client.get("/api/niveaux/CE1/distribution", params={"mois": "Octobre"})).json()
+    assert niveau["effectif"] == 3
+    assert sorted(classe["effectif"] for classe in niveau["par_classe"]) == [1, 2]
+    assert (await client.get("/api/niveaux/CM2/distribution")).json()["effectif"] == 0
+
+    serveur.db.remettre_a_zero()
+    tableau = (await client.get("/api/tableau-de-bord", params={"annee_scolaire": "2024-2025"})).json()
+    # Versions, classes, compositions puis une seule lecture des notes
+    assert serveur.db.allers_retours == 4
+    assert tableau["global"]["effectif"] == 3
+    assert tableau["par_niveau"]["CE1 A"]["effectif"] == 3
+    assert tableau["par_mois"]["Octobre"]["mediane"] == 5.0
+    assert sorted(c["effectif"] for c in tableau["par_composition"]) == [1, 2]
+
+
+async def test_notes_hors_bareme(client, serveur, creer_classe):
+    _, eleves, (composition,) = await creer_classe(nb_eleves=2)
+    # La saisie unitaire ne borne pas les notes : la distribution reste calculable
+    saisie = {"etude_texte": -10, "aem": 20, "dictee": 10, "math": 60}
+    reponse = await client.post("/api/notes", json={"composition_id": composition["id"], "eleve_id": eleves[0]["id"], **saisie})
+    assert reponse.status_code == 200
+    await _saisir(client, composition, eleves[1:], [(30, 30, 10, 30)])
+    distribution = (await client.get(f"/api/statistiques/{composition['id']}/distribution")).json()
+
+    assert distribution["colonnes"]["etude_texte"]["histogramme"]["effectifs"][0] == 1
+    assert distribution["colonnes"]["math"]["histogramme"]["effectifs"][-1] == 1
@@ -0,0 +1,101 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+A = {"X-School-Id": "ecole-a"}
+B = {"X-School-Id": "ecole-b"}
+NOTE = {"etude_texte": 30, "aem": 30, "dictee": 12, "math": 30}
+
+
+async def _classe(client, entetes, nb_eleves=2):
+    classe = (await client.post("/api/classes", headers=entetes, json={
+        "nom": "CP1", "niveau": "CP1 A", "annee_scolaire": "2024-2025", "enseignant": "Mme X",
+    })).json()
+    eleves = [
+        (await client.post("/api/eleves", headers=entetes, json={
+            "nom": f"NOM{i}", "prenom": "P", "classe_id": classe["id"],
+        })).json()
+        for i in range(nb_eleves)
+    ]
+    composition = (await client.post("/api/compositions", headers=entetes, json={
+        "classe_id": classe["id"], "numero": 1, "date": "2024-10-15", "titre": "C1", "mois": "Octobre",
+    })).json()
+    await client.post("/api/notes/batch", headers=entetes, json={
+        "composition_id": composition["id"], "notes": [{"eleve_id": e["id"], **NOTE} for e in eleves],
+    })
+    return classe, eleves, composition
+
+
+async def test_ecoles_isolees(client):
+    classe, eleves, composition = await _classe(client, A)
+    await _classe(client, B, nb_eleves=1)
+    assert classe["school_id"] == "ecole-a"
+
+    assert [c["id"] for c in (await client.get("/api/classes", headers=A)).json()] == [classe["id"]]
+    assert len((await client.get("/api/eleves", headers=B)).json()) == 1
+    assert len((await client.get("/api/notes", headers=B)).json()) == 1
+    assert len((await client.get("/api/sync", headers=B)).json()["notes"]) == 1
+    classement = (await client.get("/api/classements", params={"mois": "Octobre"}, headers=B)).json()
+    assert classement["effectif"] == 1
+
+    # Les documents d'une autre école n'existent pas, même lus par id ou déjà en cache
+    assert (await client.get(f"/api/suivi/{classe['id']}", headers=A)).status_code == 200
+    for url in (
+        f"/api/classes/{classe['id']}", f"/api/suivi/{classe['id']}", f"/api/eleves?classe_id={classe['id']}",
+        f"/api/statistiques/{composition['id']}", f"/api/notes?composition_id={composition['id']}",
+        f"/api/rapports/{composition['id']}", f"/api/compositions/{composition['id']}/evenements",
+    ):
+        assert (await client.get(url, headers=B)).status_code == 404, url
+    assert (await client.put(f"/api/eleves/{eleves[0]['id']}", headers=B, json=eleves[0])).status_code == 404
+    reponse = await client.post("/api/eleves", headers=B, json={"nom": "N", "prenom": "P", "classe_id": classe["id"]})
+    assert reponse.status_code == 404
+
+
+async def test_ecole_par_defaut_et_en_tete_invalide(client):
+    classe, _, _ = await _classe(client, {}, nb_eleves=1)
+    assert classe["school_id"] == "defaut"
+    assert (await client.get("/api/classes", headers={"X-School-Id": "defaut"})).json()[0]["id"] == classe["id"]
+    assert (await client.get("/api/classes", headers={"X-School-Id": "a b"})).status_code == 422
+
+
+async def test_usage_et_quota(client, serveur, monkeypatch):
+    monkeypatch.setattr(serveur, "metriques", serveur.Metriques())
+    await _classe(client, A)
+
+    usage = (await client.get("/api/ecole/usage", headers=A)).json()
+    assert usage["documents"] == {"classes": 1, "eleves": 2, "compositions": 1, "notes": 2}
+    # Deux élèves, composition, saisie et cette requête : la création de la classe, reçue quand
+    # l'école n'en avait pas encore, est comptée avec les écoles inconnues
+    assert (usage["requetes"], usage["refusees"], usage["en_cours"]) == (5, 0, 1)
+
+    monkeypatch.setattr(serveur, "REQUETES_SIMULTANEES_PAR_ECOLE", 0)
+    reponse = await client.get("/api/classes", headers=A)
+    assert reponse.status_code == 429 and reponse.headers["retry-after"] == "1"
+    assert 'requetes_ecole_refusees_total{ecole="ecole-a"} 1' in serveur.metriques.exposition()
+
+
+async def test_ecoles_inventees_partagent_une_serie(client, serveur, monkeypatch):
+    monkeypatch.setattr(serveur, "metriques", serveur.Metriques())
+    for i in range(5):
+        assert (await client.get("/api/classes", headers={"X-School-Id": f"inventee-{i}"})).status_code == 200
+    exposition = serveur.metriques.exposition()
+    assert "inventee" not in exposition
+    assert f'requetes_ecole_total{{ecole="{serveur.ECOLE_INCONNUE}"}} 5' in exposition
+
+    # Changer d'en-tête ne donne pas un nouveau quota
+    monkeypatch.setattr(serveur, "REQUETES_SIMULTANEES_PAR_ECOLE", 0)
+    assert (await client.get("/api/classes", headers={"X-School-Id": "inventee-6"})).status_code == 429
+
+    # Une école qui possède une classe a sa propre série, même sur un autre worker
+    await serveur.db.classes.insert_one({"id": "k", "school_id": "ecole-c", "nom": "X"})
+    monkeypatch.setattr(serveur, "REQUETES_SIMULTANEES_PAR_ECOLE", 32)
+    await client.get("/api/ecole/usage", headers={"X-School-Id": "ecole-c"})
+    assert 'requetes_ecole_total{ecole="ecole-c"} 1' in serveur.metriques.exposition()
+
+
+async def test_migration_vers_l_ecole_par_defaut(serveur):
+    await serveur.db.classes.insert_one({"id": "ancienne", "nom": "X"})
+    await serveur.db.suppressions.insert_one({"collection": "eleves", "id": "e1", "version": 3})
+    await serveur.migrer_ecoles()
+    assert (await serveur.db.classes.find_one({"id": "ancienne"}))["school_id"] == "defaut"
+    assert (await serveur.db.suppressions.find_one({"id": "e1"}))["school_id"] == "defaut"
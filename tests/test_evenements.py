@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+NOTE = {"etude_texte": 30, "aem": 30, "dictee": 12, "math": 30}
+
+
+class RequeteFactice:
+    """Request minimal pour flux_evenements : le client se déconnecte à la demande"""
+
+    def __init__(self):
+        self.deconnecte = False
+
+    async def is_disconnected(self):
+        return self.deconnecte
+
+
+async def test_diff_des_rangs_publie_apres_reclassement(client, serveur, creer_classe):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=3)
+    notes = (await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [{"eleve_id": eleve["id"], **NOTE, "math": 10 * i} for i, eleve in enumerate(eleves)],
+    })).json()
+    file = serveur.diffusion_classements.abonner(composition["id"])
+
+    # Le dernier passe premier : tous les rangs changent
+    derniere = next(note for note in notes if note["rang"] == 3)
+    await client.put(f"/api/notes/{derniere['id']}", json={**NOTE, "math": 50})
+    message = file.get_nowait()
+    assert message["type"] == "classement" and message["composition_id"] == composition["id"]
+    assert message["rangs"] == {
+        note["id"]: (1 if note["id"] == derniere["id"] else note["rang"] + 1) for note in notes
+    }
+    # Reclassement incrémental : statistiques recalculées, extrêmes compris
+    assert message["statistiques"]["effectif"] == 3
+    assert message["statistiques"]["matieres"]["math"] == {"moyenne": 26.67, "min": 10, "max": 50, "mediane": 20}
+
+    # Changement sans effet sur l'ordre : diff vide
+    await client.put(f"/api/notes/{derniere['id']}", json={**NOTE, "math": 49})
+    assert file.get_nowait()["rangs"] == {}
+
+    # Reclassement complet : statistiques jointes
+    await client.delete(f"/api/notes/{derniere['id']}")
+    message = file.get_nowait()
+    assert message["rangs"] == {note["id"]: note["rang"] for note in notes if note["id"] != derniere["id"]}
+    assert message["statistiques"]["effectif"] == 2
+
+
+async def test_client_lent_resynchronise(serveur):
+    diffusion = serveur.DiffusionClassements(abonnes_max=1, file_max=2)
+    file = diffusion.abonner("c1")
+    assert diffusion.abonner("c1") is None
+    for i in range(3):
+        diffusion.distribuer({"type": "classement", "composition_id": "c1", "rangs": {"n": i}})
+    diffusion.distribuer({"type": "classement", "composition_id": "c2", "rangs": {}})
+    assert file.get_nowait() == {"type": "resynchroniser", "composition_id": "c1"}
+    assert file.empty()
+
+    diffusion.desabonner("c1", file)
+    assert diffusion.abonner("c1") is not None
+
+
+async def test_flux_sse(serveur):
+    file = serveur.diffusion_classements.abonner("c1")
+    requete = RequeteFactice()
+    flux = serveur.flux_evenements("c1", file, requete)
+    assert await flux.__anext__() == b"retry: 3000\n\n"
+
+    await serveur.broker_classements.publier([{"type": "classement", "composition_id": "c1", "rangs": {"n1": 2}}])
+    assert await flux.__anext__() == (
+        b'event: classement\ndata: {"type":"classement","composition_id":"c1","rangs":{"n1":2}}\n\n'
+    )
+
+    requete.deconnecte = True
+    serveur.diffusion_classements.distribuer({"type": "classement", "composition_id": "c1", "rangs": {}})
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(flux.__anext__(), timeout=1)
+    assert serveur.diffusion_classements.abonner("c1") is not None
+
+
+async def test_abonnement_refuse(client, serveur, creer_classe):
+    assert (await client.get("/api/compositions/inconnue/evenements")).status_code == 404
+
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=1)
+    for _ in range(2):
+        serveur.diffusion_classements.abonner(composition["id"])
+    reponse = await client.get(f"/api/compositions/{composition['id']}/evenements")
+    assert reponse.status_code == 503
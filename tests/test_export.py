@@ -0,0 +1,66 @@
+import csv
+import io
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _saisir(client, eleves, composition):
+    await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [
+            {"eleve_id": eleve["id"], "etude_texte": 10 * (i + 1), "aem": 20, "dictee": 10, "math": 20}
+            for i, eleve in enumerate(eleves)
+        ],
+    })
+
+
+def _lignes_csv(response):
+    return list(csv.reader(io.StringIO(response.content.decode("utf-8-sig")), delimiter=";"))
+
+
+async def test_export_csv_classe(client, serveur, creer_classe):
+    classe, eleves, compositions = await creer_classe(nb_eleves=3, nb_compositions=2)
+    for composition in compositions:
+        await _saisir(client, eleves, composition)
+
+    serveur.db.remettre_a_zero()
+    response = await client.get(f"/api/export/classes/{classe['id']}")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/csv")
+    assert 'filename="resultats-EPP_TEST-2024_2025.csv"' in response.headers["Content-Disposition"]
+    # Une lecture de la classe, puis un seul curseur d'agrégation
+    assert len(serveur.db.operations("compositions", "aggregate")) == 1
+    assert serveur.db.allers_retours == 2
+
+    entete, *lignes = _lignes_csv(response)
+    assert entete[:3] == ["Classe", "Niveau", "Année scolaire"]
+    assert len(lignes) == 6
+    # Triées par composition puis par rang
+    assert [(ligne[3], ligne[15]) for ligne in lignes] == [
+        ("1", "1"), ("1", "2"), ("1", "3"), ("2", "1"), ("2", "2"), ("2", "3"),
+    ]
+    assert lignes[0][7:9] == ["NOM2", "Prenom2"]
+
+
+async def test_export_xlsx_ecole(client, creer_classe):
+    openpyxl = pytest.importorskip("openpyxl")
+    for _ in range(2):
+        _, eleves, (composition,) = await creer_classe(nb_eleves=2)
+        await _saisir(client, eleves, composition)
+
+    response = await client.get("/api/export/ecole?format=xlsx&annee_scolaire=2024-2025")
+    assert response.status_code == 200
+
+    feuille = openpyxl.load_workbook(io.BytesIO(response.content)).active
+    lignes = list(feuille.values)
+    assert lignes[0][0] == "Classe"
+    assert len(lignes) == 5
+
+    vide = await client.get("/api/export/ecole?annee_scolaire=1999-2000")
+    assert len(_lignes_csv(vide)) == 1
+
+
+async def test_export_classe_inconnue(client, serveur):
+    assert (await client.get("/api/export/classes/inconnue")).status_code == 404
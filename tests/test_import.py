@@ -0,0 +1,95 @@
+import io
+import time
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def _envoyer(client, contenu, nom="eleves.csv", **params):
+    return client.post("/api/eleves/import", params=params, files={"fichier": (nom, contenu)})
+
+
+async def test_import_csv_avec_doublons_et_erreurs(client, serveur, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=1, nb_compositions=0)
+    contenu = (
+        "Nom;Prénom;Date de naissance\n"
+        "KONE;Awa;2016-03-02\n"
+        "nom0;PRENOM0;\n"          # déjà inscrit (casse différente)
+        "TRAORE;Issa;\n"
+        ";Moussa;\n"               # nom manquant
+        "kone;awa;2016-03-02\n"    # doublon de la ligne 2
+        ";;\n"                     # ligne vide ignorée
+    ).encode("utf-8")
+
+    rapport = (await _envoyer(client, contenu, classe_id=classe["id"])).json()
+
+    assert rapport["lignes"] == 5
+    assert rapport["inseres"] == 2
+    assert rapport["doublons"] == [
+        {"ligne": 3, "doublon_de": "élève déjà inscrit"},
+        {"ligne": 6, "doublon_de": "ligne 2"},
+    ]
+    assert [erreur["ligne"] for erreur in rapport["erreurs"]] == [5]
+
+    eleves = (await client.get(f"/api/eleves?classe_id={classe['id']}")).json()
+    assert sorted(eleve["nom"] for eleve in eleves) == ["KONE", "NOM0", "TRAORE"]
+
+
+async def test_import_xlsx_plusieurs_classes(client, creer_classe):
+    openpyxl = pytest.importorskip("openpyxl")
+    classe, _, _ = await creer_classe(nb_eleves=0, nb_compositions=0)
+    classeur = openpyxl.Workbook()
+    feuille = classeur.active
+    feuille.append(["nom", "prenom", "classe_id"])
+    feuille.append(["SANOGO", "Fatou", classe["id"]])
+    feuille.append(["DIARRA", "Ali", "inconnue"])
+    tampon = io.BytesIO()
+    classeur.save(tampon)
+
+    rapport = (await _envoyer(client, tampon.getvalue(), nom="liste.xlsx")).json()
+
+    assert rapport["inseres"] == 1
+    assert rapport["erreurs"] == [{"ligne": 3, "erreurs": ["classe_id : classe inconnue inconnue"]}]
+
+
+async def test_import_deux_mille_lignes(client, serveur, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=0, nb_compositions=0)
+    contenu = "nom,prenom\n" + "".join(f"NOM{i},Prenom{i}\n" for i in range(2000))
+
+    serveur.db.remettre_a_zero()
+    debut = time.perf_counter()
+    rapport = (await _envoyer(client, contenu.encode(), classe_id=classe["id"])).json()
+    duree = time.perf_counter() - debut
+
+    assert rapport["inseres"] == 2000
+    assert len(serveur.db.operations("eleves", "insert_many")) == 4
+    assert duree < 5
+
+
+async def test_import_colonne_classe(client, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=0, nb_compositions=0)
+    contenu = "Nom;Prénom;Classe\nKONE;Awa;CE1 A\nTRAORE;Issa;ce1 a\nDIARRA;Ali;CM2\n".encode()
+
+    # La classe de la requête l'emporte sur la colonne
+    rapport = (await _envoyer(client, contenu, classe_id=classe["id"])).json()
+    assert rapport["inseres"] == 3 and rapport["erreurs"] == []
+
+    # Sans classe dans la requête, le nom de la classe est résolu dans l'école
+    await client.delete(f"/api/classes/{classe['id']}")
+    classe, _, _ = await creer_classe(nb_eleves=0, nb_compositions=0)
+    rapport = (await _envoyer(client, contenu)).json()
+    assert rapport["inseres"] == 2
+    assert rapport["erreurs"] == [{"ligne": 4, "erreurs": ["classe_id : classe CM2 inconnue"]}]
+    eleves = (await client.get(f"/api/eleves?classe_id={classe['id']}")).json()
+    assert sorted(eleve["nom"] for eleve in eleves) == ["KONE", "TRAORE"]
+
+    # Deux classes de même niveau : le nom ne suffit plus
+    await creer_classe(nb_eleves=0, nb_compositions=0)
+    rapport = (await _envoyer(client, "nom;prenom;classe\nSANOGO;Fatou;CE1 A\n".encode())).json()
+    assert rapport["erreurs"] == [{"ligne": 2, "erreurs": ["classe : « CE1 A » désigne plusieurs classes"]}]
+
+
+async def test_import_sans_colonnes_obligatoires(client, serveur):
+    response = await _envoyer(client, b"a;b\n1;2\n", classe_id="x")
+    assert response.status_code == 400
@@ -0,0 +1,45 @@
+import logging
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_creer_index_idempotent(serveur):
+    crees = await serveur.creer_index()
+
+    assert "notes.composition_id_1_eleve_id_1" in crees
+    assert "notes.composition_id_1_total_-1" in crees
+    assert len(crees) == len(serveur.INDEX)
+    infos = await serveur.db.notes.index_information()
+    assert infos["composition_id_1_eleve_id_1"]["unique"]
+
+    assert await serveur.creer_index() == []
+
+
+async def test_creer_index_refuse_une_definition_conflictuelle(serveur):
+    await serveur.db.classes.create_index([("id", 1)])
+
+    with pytest.raises(RuntimeError):
+        await serveur.creer_index()
+
+
+async def test_creer_index_tolere_les_doublons(serveur, caplog):
+    note = {"composition_id": "c1", "eleve_id": "e1", "total": 10}
+    await serveur.db.notes.insert_many([dict(note, id="n1"), dict(note, id="n2")])
+
+    with caplog.at_level(logging.ERROR):
+        crees = await serveur.creer_index()
+
+    assert "notes.composition_id_1_eleve_id_1" not in crees
+    assert "doublons" in caplog.text
+
+
+async def test_creer_note_en_double(client, serveur, creer_classe):
+    await serveur.creer_index()
+    _, (eleve,), (composition,) = await creer_classe(nb_eleves=1)
+    note = {"composition_id": composition["id"], "eleve_id": eleve["id"],
+            "etude_texte": 20, "aem": 20, "dictee": 10, "math": 20}
+
+    assert (await client.post("/api/notes", json=note)).status_code == 200
+    assert (await client.post("/api/notes", json=note)).status_code == 409
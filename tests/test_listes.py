@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _inserer_eleves(serveur, nombre, classe_id="c1"):
+    await serveur.db.classes.insert_one({"id": classe_id, "nom": classe_id, "school_id": "defaut"})
+    await serveur.db.eleves.insert_many([
+        {"id": f"e{i:05d}", "nom": f"NOM{i}", "prenom": "P", "classe_id": classe_id, "date_naissance": None,
+         "school_id": "defaut"}
+        for i in range(nombre)
+    ])
+
+
+async def test_liste_sans_plafond(client, serveur):
+    await _inserer_eleves(serveur, 1100)
+
+    eleves = (await client.get("/api/eleves", params={"classe_id": "c1"})).json()
+
+    assert len(eleves) == 1100
+
+
+async def test_pagination_par_cle(client, serveur):
+    await _inserer_eleves(serveur, 7)
+    await _inserer_eleves(serveur, 3, classe_id="c2")
+
+    ids, params = [], {"classe_id": "c1", "limit": 3}
+    while True:
+        reponse = await client.get("/api/eleves", params=params)
+        ids += [eleve["id"] for eleve in reponse.json()]
+        if "X-Curseur-Suivant" not in reponse.headers:
+            break
+        params["after"] = reponse.headers["X-Curseur-Suivant"]
+
+    assert ids == [f"e{i:05d}" for i in range(7)]
+
+
+async def test_pagination_limite_maximale(client):
+    assert (await client.get("/api/classes", params={"limit": 5000})).status_code == 422
+
+
+async def test_flux_ndjson(client, serveur):
+    await _inserer_eleves(serveur, 450)
+
+    reponse = await client.get("/api/eleves", params={"format": "ndjson"})
+
+    assert reponse.headers["content-type"] == "application/x-ndjson"
+    lignes = [json.loads(ligne) for ligne in reponse.text.splitlines()]
+    assert len(lignes) == 450
+    assert "_id" not in lignes[0]
+
+
+async def test_compositions_triees_par_numero(client, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=0, nb_compositions=0)
+    for numero in (3, 1, 2):
+        await client.post("/api/compositions", json={
+            "classe_id": classe["id"], "numero": numero, "date": "2024-10-15", "titre": "C", "mois": "Octobre",
+        })
+
+    compositions = (await client.get("/api/compositions", params={"classe_id": classe["id"]})).json()
+
+    assert [c["numero"] for c in compositions] == [1, 2, 3]
+
+
+@pytest.mark.parametrize("params", [{}, {"limit": 2}])
+async def test_chemin_rapide_identique(client, serveur, creer_classe, params):
+    _, eleves, (composition,) = await creer_classe(nb_eleves=3)
+    await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [{"eleve_id": e["id"], "etude_texte": 20, "aem": 20, "dictee": 10, "math": 20} for e in eleves],
+    })
+    # Un champ parasite en base ne doit pas sortir par le chemin rapide
+    await serveur.db.notes.update_many({}, {"$set": {"interne": True}})
+    url = "/api/notes"
+
+    normal = await client.get(url, params={"composition_id": composition["id"], **params})
+    rapide = await client.get(url, params={"composition_id": composition["id"], "rapide": True, **params})
+
+    attendu = [{k: v for k, v in note.items() if k != "rang_en_attente"} for note in normal.json()]
+    assert rapide.json() == attendu
+    assert rapide.headers.get("X-Curseur-Suivant") == normal.headers.get("X-Curseur-Suivant")
+
+
+async def test_compression_gzip(client, serveur):
+    await _inserer_eleves(serveur, 200)
+
+    reponse = await client.get("/api/eleves", params={"rapide": True}, headers={"Accept-Encoding": "gzip"})
+
+    assert reponse.headers["content-encoding"] == "gzip"
+    assert len(reponse.json()) == 200
@@ -0,0 +1,57 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def _evenement(request_id, nom, collection=None, duree_micros=0):
+    return SimpleNamespace(
+        request_id=request_id,
+        command_name=nom,
+        command={nom: collection} if collection else {nom: 1},
+        duration_micros=duree_micros,
+    )
+
+
+async def test_ecouteur_alimente_la_requete_courante(serveur):
+    serveur.metriques = serveur.Metriques()
+    ecouteur = serveur.EcouteurCommandes()
+    mesure = serveur.MesureRequete()
+    jeton = serveur._mesure_courante.set(mesure)
+    try:
+        ecouteur.started(_evenement(1, "find", "notes"))
+        ecouteur.started(_evenement(2, "update", "notes"))
+        ecouteur.succeeded(_evenement(1, "find", duree_micros=2000))
+        ecouteur.failed(_evenement(2, "update", duree_micros=3000))
+    finally:
+        serveur._mesure_courante.reset(jeton)
+    # Hors requête HTTP, seuls les compteurs globaux bougent
+    ecouteur.succeeded(_evenement(3, "find", duree_micros=1000))
+
+    assert mesure.commandes == [("find", "notes", 0.002), ("update", "notes", 0.003)]
+    assert mesure.duree_mongo_s == pytest.approx(0.005)
+    assert serveur.metriques.commandes["find"][:1] == [2]
+    assert serveur.metriques.commandes["update"][2] == 1
+
+
+async def test_server_timing_et_metrics(client, serveur, creer_classe):
+    serveur.metriques = serveur.Metriques()
+    classe, _, _ = await creer_classe(nb_eleves=2)
+
+    response = await client.get(f"/api/eleves?classe_id={classe['id']}")
+    assert response.headers["Server-Timing"].startswith("mongo;dur=")
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+    texte = (await client.get("/metrics")).text
+    assert 'requetes_http_duree_secondes_count{methode="GET",route="/api/eleves"} 1' in texte
+    assert 'route="/api/eleves/{eleve_id}"' not in texte
+    assert '{methode="POST",route="/api/eleves"} 2' in texte
+
+
+async def test_journal_des_requetes_lentes(client, serveur, caplog, monkeypatch):
+    monkeypatch.setattr(serveur, "SEUIL_REQUETE_LENTE_MS", 0.0001)
+    with caplog.at_level(logging.WARNING, logger="server"):
+        await client.get("/api/classes")
+    assert any("Requête lente GET /api/classes" in message for message in caplog.messages)
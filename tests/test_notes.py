@@ -0,0 +1,111 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def _ligne(eleve, etude, aem=30, dictee=10, math=30):
+    return {"eleve_id": eleve["id"], "etude_texte": etude, "aem": aem, "dictee": dictee, "math": math}
+
+
+async def test_enregistrer_notes_batch(client, serveur, creer_classe):
+    _, eleves, (composition,) = await creer_classe()
+    serveur.db.remettre_a_zero()
+
+    reponse = await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [_ligne(eleves[0], 20), _ligne(eleves[1], 45), _ligne(eleves[2], 20)],
+    })
+
+    assert reponse.status_code == 200
+    notes = reponse.json()
+    assert [n["eleve_id"] for n in notes][0] == eleves[1]["id"]
+    assert [n["rang"] for n in notes] == [1, 2, 2]
+    assert notes[0]["total"] == 115 and notes[0]["observation"] == "C"
+    # Une seule écriture des notes et un seul reclassement pour toute la saisie
+    assert len(serveur.db.operations("notes", "bulk_write")) == 2
+
+    # Une seconde saisie met à jour les notes existantes au lieu d'en créer
+    reponse = await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [_ligne(eleves[0], 50)],
+    })
+    notes = reponse.json()
+    assert len(notes) == 3
+    assert notes[0]["eleve_id"] == eleves[0]["id"] and notes[0]["rang"] == 1
+
+
+async def test_enregistrer_notes_batch_refuse_eleve_inconnu(client, creer_classe):
+    _, eleves, (composition,) = await creer_classe(nb_eleves=1)
+    reponse = await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [_ligne(eleves[0], 20), _ligne({"id": "inconnu"}, 20)],
+    })
+    assert reponse.status_code == 400
+
+
+async def test_enregistrer_notes_batch_valide_les_maximums(client, creer_classe):
+    _, eleves, (composition,) = await creer_classe(nb_eleves=1)
+    reponse = await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [_ligne(eleves[0], 20, dictee=25)],
+    })
+    assert reponse.status_code == 422
+
+
+async def test_statistiques_suivent_les_ecritures(client, creer_classe):
+    _, eleves, (composition,) = await creer_classe()
+    notes = (await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [_ligne(eleves[0], 50, 50, 20, 50), _ligne(eleves[1], 10, 10, 5, 10)],
+    })).json()
+    stats = (await client.get(f"/api/statistiques/{composition['id']}")).json()
+    assert (stats["effectif"], stats["admis"]) == (2, 1)
+
+    await client.put(f"/api/notes/{notes[1]['id']}", json={"etude_texte": 40, "aem": 40, "dictee": 15, "math": 40})
+    stats = (await client.get(f"/api/statistiques/{composition['id']}")).json()
+    assert (stats["effectif"], stats["admis"]) == (2, 2)
+
+    await client.delete(f"/api/notes/{notes[0]['id']}")
+    stats = (await client.get(f"/api/statistiques/{composition['id']}")).json()
+    assert stats["effectif"] == 1
+    assert stats["matieres"]["math"]["max"] == 40
+
+
+async def test_saisir_note_idempotente(client, serveur, creer_classe):
+    _, eleves, (composition,) = await creer_classe(nb_eleves=2)
+    url = f"/api/compositions/{composition['id']}/eleves/{eleves[0]['id']}/note"
+    saisie = {"etude_texte": 40, "aem": 30, "dictee": 10, "math": 30}
+
+    premiere = (await client.put(url, json=saisie)).json()
+    assert premiere["total"] == 110 and premiere["rang"] == 1
+    # Rejouer la même saisie remplace la note au lieu d'en créer une autre
+    seconde = (await client.put(url, json={**saisie, "math": 50})).json()
+    assert seconde["id"] == premiere["id"] and seconde["total"] == 130
+    assert await serveur.db.notes.count_documents({"composition_id": composition["id"]}) == 1
+
+    # Même clé : la réponse d'origine est rejouée sans nouvelle écriture
+    entetes = {"Idempotency-Key": "saisie-1"}
+    reponse = (await client.put(url, json=saisie, headers=entetes)).json()
+    serveur.db.remettre_a_zero()
+    assert (await client.put(url, json=saisie, headers=entetes)).json() == reponse
+    assert serveur.db.operations("notes", "find_one_and_update") == []
+
+    # Même clé pour une autre saisie : refusée
+    autre = await client.put(url, json={**saisie, "math": 0}, headers=entetes)
+    assert autre.status_code == 422
+
+
+async def test_saisir_note_refuse_eleve_hors_classe(client, creer_classe):
+    _, _, (composition,) = await creer_classe(nb_eleves=1)
+    _, (autre_eleve,), _ = await creer_classe(nb_eleves=1)
+    saisie = {"etude_texte": 40, "aem": 30, "dictee": 10, "math": 30}
+    reponse = await client.put(
+        f"/api/compositions/{composition['id']}/eleves/{autre_eleve['id']}/note", json=saisie
+    )
+    assert reponse.status_code == 404
+    reponse = await client.put(f"/api/compositions/inconnue/eleves/{autre_eleve['id']}/note", json=saisie)
+    assert reponse.status_code == 404
+    reponse = await client.post(
+        "/api/notes", json={"composition_id": composition["id"], "eleve_id": autre_eleve["id"], **saisie}
+    )
+    assert reponse.status_code == 404
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+NOTE = {"etude_texte": 30, "aem": 30, "dictee": 12, "math": 30}
+
+
+async def _saisir(client, creer_classe, nb_eleves):
+    _, eleves, (composition,) = await creer_classe(nb_eleves=nb_eleves)
+    notes = (await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [{"eleve_id": eleve["id"], **NOTE} for eleve in eleves],
+    })).json()
+    return composition, notes
+
+
+async def test_ecritures_simultanees_regroupees(client, serveur, creer_classe, monkeypatch):
+    composition, notes = await _saisir(client, creer_classe, nb_eleves=10)
+    monkeypatch.setattr(serveur, "planificateur", serveur.PlanificateurClassement(delai=0.05))
+    serveur.db.remettre_a_zero()
+
+    reponses = await asyncio.gather(*(
+        client.put(f"/api/notes/{note['id']}", json={**NOTE, "math": i})
+        for i, note in enumerate(notes)
+    ))
+
+    # Un seul reclassement pour les dix écritures, et chacune reçoit son rang à jour
+    assert len(serveur.db.operations("statistiques", "bulk_write")) == 1
+    assert sorted(r.json()["rang"] for r in reponses) == list(range(1, 11))
+
+
+async def test_jamais_deux_calculs_simultanes(serveur, monkeypatch):
+    en_cours, maximum, appels = 0, 0, 0
+
+    async def calcul_lent(composition_id):
+        nonlocal en_cours, maximum, appels
+        en_cours += 1
+        appels += 1
+        maximum = max(maximum, en_cours)
+        await asyncio.sleep(0.02)
+        en_cours -= 1
+        return {}
+
+    monkeypatch.setattr(serveur, "calculer_classement", calcul_lent)
+    planificateur = serveur.PlanificateurClassement(delai=0)
+
+    futurs = []
+    for _ in range(5):
+        futurs.append(planificateur.demander("c1"))
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*futurs)
+
+    assert maximum == 1
+    assert 1 < appels < 5
+
+
+async def test_rang_en_attente(client, serveur, creer_classe):
+    composition, notes = await _saisir(client, creer_classe, nb_eleves=3)
+
+    reponse = await client.put(
+        f"/api/notes/{notes[-1]['id']}", params={"attendre_rang": False}, json={**NOTE, "math": 50})
+
+    assert reponse.json()["rang_en_attente"] is True
+    await serveur.planificateur.vider()
+    note = (await client.get(f"/api/notes/{notes[-1]['id']}")).json()
+    assert note["rang"] == 1 and note["rang_en_attente"] is False
+
+
+async def test_bail_partage_entre_workers(client, serveur, creer_classe):
+    composition, notes = await _saisir(client, creer_classe, nb_eleves=3)
+    # Un autre worker reclasse la composition : le bail est pris dans Mongo
+    futur = serveur.datetime.now(serveur.timezone.utc) + serveur.timedelta(seconds=30)
+    await serveur.db.baux_classement.insert_one({"_id": composition["id"], "detenteur": "autre", "expire_le": futur})
+
+    await client.put(f"/api/notes/{notes[0]['id']}", params={"attendre_rang": False}, json={**NOTE, "math": 50})
+    await asyncio.sleep(0.1)
+    assert (await serveur.db.notes.find_one({"id": notes[0]["id"]}))["rang"] == 1
+    assert (await serveur.db.notes.find_one({"id": notes[1]["id"]}))["rang"] == 1
+
+    # Bail rendu par l'autre worker : le reclassement passe
+    await serveur.db.baux_classement.delete_one({"_id": composition["id"]})
+    await serveur.planificateur.vider()
+    assert (await serveur.db.notes.find_one({"id": notes[1]["id"]}))["rang"] == 2
+    assert await serveur.db.baux_classement.count_documents({}) == 0
+
+
+async def test_bail_expire_repris(serveur):
+    passe = serveur.datetime.now(serveur.timezone.utc) - serveur.timedelta(seconds=1)
+    await serveur.db.baux_classement.insert_one({"_id": "c1", "detenteur": "arrete", "expire_le": passe})
+
+    async with serveur.bail_classement("c1"):
+        assert (await serveur.db.baux_classement.find_one({"_id": "c1"}))["detenteur"] != "arrete"
+    assert await serveur.db.baux_classement.count_documents({}) == 0
@@ -0,0 +1,95 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _saisir(client, composition, eleves, maths):
+    return (await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [
+            {"eleve_id": eleve["id"], "etude_texte": 30, "aem": 30, "dictee": 10, "math": math}
+            for eleve, math in zip(eleves, maths)
+        ],
+    })).json()
+
+
+async def _progression(serveur, classe):
+    docs = await serveur.db.progression.find({"classe_id": classe["id"]}, {"_id": 0}).to_list(None)
+    return {doc["eleve_id"]: doc for doc in docs}
+
+
+async def test_moyenne_rang_et_tendance_annuels(client, serveur, creer_classe):
+    classe, eleves, compositions = await creer_classe(nb_eleves=3, nb_compositions=2)
+    # Moyennes /10 : 7.06, 5.29, 6.18 puis 4.71, 5.88 ; le troisième élève est absent à la deuxième
+    await _saisir(client, compositions[0], eleves, [50, 20, 35])
+    await _saisir(client, compositions[1], eleves[:2], [10, 30])
+
+    progression = await _progression(serveur, classe)
+    premier, second, troisieme = (progression[eleve["id"]] for eleve in eleves)
+    assert premier["moyenne_annuelle"] == round((7.06 + 4.71) / 2, 2)
+    assert premier["tendance"] == round(4.71 - 7.06, 2)
+    assert second["tendance"] == round(5.88 - 5.29, 2)
+    assert troisieme["nb_compositions"] == 1 and troisieme["tendance"] is None
+    assert [troisieme["rang_annuel"], premier["rang_annuel"], second["rang_annuel"]] == [1, 2, 3]
+
+    suivi = (await client.get(f"/api/suivi/{classe['id']}")).json()
+    ligne = next(ligne for ligne in suivi["suivi"] if ligne["eleve"]["id"] == eleves[0]["id"])
+    assert (ligne["moyenne_annuelle"], ligne["rang_annuel"]) == (premier["moyenne_annuelle"], 2)
+    assert [note["rang"] for note in ligne["notes"]] == [1, 2]
+    # Les cases restent les notes complètes
+    assert ligne["notes"][0]["eleve_id"] == eleves[0]["id"] and ligne["notes"][0]["math"] == 50
+    assert {"total", "observation", "etude_texte", "aem", "dictee"} <= set(ligne["notes"][0])
+    absente = next(ligne for ligne in suivi["suivi"] if ligne["eleve"]["id"] == eleves[2]["id"])
+    assert absente["notes"][1] is None
+
+
+async def test_mise_a_jour_incrementale(client, serveur, creer_classe):
+    classe, eleves, compositions = await creer_classe(nb_eleves=2, nb_compositions=2)
+    notes = await _saisir(client, compositions[0], eleves, [50, 20])
+    await _saisir(client, compositions[1], eleves, [50, 20])
+
+    serveur.db.remettre_a_zero()
+    note = next(n for n in notes if n["eleve_id"] == eleves[1]["id"])
+    await client.put(f"/api/notes/{note['id']}", json={"etude_texte": 50, "aem": 50, "dictee": 20, "math": 50})
+    # Seules les notes de la fenêtre entre l'ancien et le nouveau total sont relues en entier (les
+    # statistiques ne relisent que les colonnes notées), puis les progressions
+    fenetre, colonnes = serveur.db.operations("notes", "find")
+    assert fenetre[2][0] == {"composition_id": compositions[0]["id"], "total": {"$gte": 90, "$lte": 170}}
+    assert "total" not in colonnes[2][1] and "rang" not in colonnes[2][1]
+    assert len(serveur.db.operations("progression", "find")) == 1
+
+    progression = await _progression(serveur, classe)
+    assert progression[eleves[1]["id"]]["compositions"][compositions[0]["id"]]["rang"] == 1
+    assert progression[eleves[1]["id"]]["tendance"] < 0
+
+    await client.delete(f"/api/eleves/{eleves[0]['id']}")
+    progression = await _progression(serveur, classe)
+    assert list(progression) == [eleves[1]["id"]]
+    assert progression[eleves[1]["id"]]["rang_annuel"] == 1
+
+
+async def test_renumerotation_et_suppression_de_composition(client, serveur, creer_classe):
+    classe, eleves, compositions = await creer_classe(nb_eleves=1, nb_compositions=2)
+    await _saisir(client, compositions[0], eleves, [50])
+    await _saisir(client, compositions[1], eleves, [10])
+    assert (await _progression(serveur, classe))[eleves[0]["id"]]["tendance"] < 0
+
+    # La deuxième composition devient la première : la tendance s'inverse
+    await client.put(f"/api/compositions/{compositions[1]['id']}", json={**compositions[1], "numero": 0})
+    assert (await _progression(serveur, classe))[eleves[0]["id"]]["tendance"] > 0
+
+    await client.delete(f"/api/compositions/{compositions[0]['id']}")
+    doc = (await _progression(serveur, classe))[eleves[0]["id"]]
+    assert list(doc["compositions"]) == [compositions[1]["id"]]
+    assert doc["tendance"] is None
+
+
+async def test_progression_construite_a_la_lecture(client, serveur, creer_classe):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=2)
+    await _saisir(client, composition, eleves, [50, 20])
+    await serveur.db.progression.delete_many({})
+
+    suivi = (await client.get(f"/api/suivi/{classe['id']}")).json()
+
+    assert sorted(ligne["rang_annuel"] for ligne in suivi["suivi"]) == [1, 2]
+    assert len(await _progression(serveur, classe)) == 2
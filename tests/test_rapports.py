@@ -0,0 +1,26 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_rapport_composition(client, creer_classe):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=3)
+    await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [
+            {"eleve_id": eleve["id"], "etude_texte": 10 * (i + 1), "aem": 20, "dictee": 10, "math": 20}
+            for i, eleve in enumerate(eleves)
+        ],
+    })
+
+    rapport = (await client.get(f"/api/rapports/{composition['id']}")).json()
+
+    assert rapport["composition"]["id"] == composition["id"]
+    assert rapport["classe"]["id"] == classe["id"]
+    assert [n["rang"] for n in rapport["notes"]] == [1, 2, 3]
+    assert rapport["notes"][0]["eleve"] == {"id": eleves[2]["id"], "nom": "NOM2", "prenom": "Prenom2"}
+    assert rapport["statistiques"]["effectif"] == 3
+
+
+async def test_rapport_composition_inconnue(client, serveur):
+    assert (await client.get("/api/rapports/inconnue")).status_code == 404
@@ -0,0 +1,54 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _saisir(client, eleves, compositions):
+    for composition in compositions:
+        await client.post("/api/notes/batch", json={
+            "composition_id": composition["id"],
+            "notes": [
+                {"eleve_id": eleve["id"], "etude_texte": 10 + i, "aem": 20, "dictee": 10, "math": 30}
+                # Le dernier élève n'a pas composé
+                for i, eleve in enumerate(eleves[:-1])
+            ],
+        })
+
+
+async def test_suivi_classe(client, creer_classe):
+    classe, eleves, compositions = await creer_classe(nb_eleves=3, nb_compositions=2)
+    await _saisir(client, eleves, compositions)
+
+    suivi = (await client.get(f"/api/suivi/{classe['id']}")).json()
+
+    assert [c["id"] for c in suivi["compositions"]] == [c["id"] for c in compositions]
+    par_eleve = {ligne["eleve"]["id"]: ligne["notes"] for ligne in suivi["suivi"]}
+    assert [n["composition_id"] for n in par_eleve[eleves[0]["id"]]] == [c["id"] for c in compositions]
+    assert par_eleve[eleves[1]["id"]][0]["rang"] == 1
+    assert par_eleve[eleves[2]["id"]] == [None, None]
+
+
+async def test_suivi_eleve(client, creer_classe):
+    classe, eleves, compositions = await creer_classe(nb_eleves=2, nb_compositions=3)
+    await _saisir(client, eleves, compositions)
+
+    suivi = (await client.get(f"/api/suivi/{classe['id']}/{eleves[0]['id']}")).json()
+
+    assert [ligne["composition"]["numero"] for ligne in suivi] == [1, 2, 3]
+    assert all(ligne["note"]["eleve_id"] == eleves[0]["id"] for ligne in suivi)
+
+
+@pytest.mark.parametrize("route", ["/api/suivi/{classe}", "/api/suivi/{classe}/{eleve}"])
+async def test_suivi_nombre_constant_d_allers_retours(client, serveur, creer_classe, route):
+    """Le nombre de requêtes Mongo ne dépend ni de l'effectif ni du nombre de compositions"""
+    mesures = []
+    for nb_eleves, nb_compositions in [(2, 1), (10, 4), (30, 8)]:
+        classe, eleves, compositions = await creer_classe(nb_eleves, nb_compositions)
+        await _saisir(client, eleves, compositions)
+
+        serveur.db.remettre_a_zero()
+        reponse = await client.get(route.format(classe=classe["id"], eleve=eleves[0]["id"]))
+        assert reponse.status_code == 200
+        mesures.append(serveur.db.allers_retours)
+
+    assert len(set(mesures)) == 1, mesures
@@ -0,0 +1,76 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _saisir(client, eleves, compositions):
+    for composition in compositions:
+        await client.post("/api/notes/batch", json={
+            "composition_id": composition["id"],
+            "notes": [
+                {"eleve_id": eleve["id"], "etude_texte": 10 + i, "aem": 20, "dictee": 10, "math": 30}
+                for i, eleve in enumerate(eleves)
+            ],
+        })
+
+
+async def test_supprimer_classe_en_cascade(client, serveur, creer_classe):
+    assert await serveur.transactions_disponibles() is False
+    mesures = []
+    for nb_compositions in (1, 6):
+        classe, eleves, compositions = await creer_classe(nb_eleves=4, nb_compositions=nb_compositions)
+        await _saisir(client, eleves, compositions)
+
+        serveur.db.remettre_a_zero()
+        reponse = await client.delete(f"/api/classes/{classe['id']}")
+        mesures.append(serveur.db.allers_retours)
+
+        assert reponse.json()["supprimes"] == {
+            "classes": 1, "eleves": 4, "compositions": nb_compositions,
+            "notes": 4 * nb_compositions, "statistiques": nb_compositions, "progression": 4,
+        }
+        assert await serveur.db.notes.count_documents({"composition_id": compositions[0]["id"]}) == 0
+
+    assert mesures[0] == mesures[1]
+
+
+async def test_supprimer_eleve_reclasse_ses_compositions(client, serveur, creer_classe):
+    _, eleves, compositions = await creer_classe(nb_eleves=3, nb_compositions=2)
+    await _saisir(client, eleves, compositions)
+
+    reponse = await client.delete(f"/api/eleves/{eleves[2]['id']}")
+
+    assert reponse.json()["supprimes"] == {"eleves": 1, "notes": 2}
+    for composition in compositions:
+        notes = (await client.get("/api/notes", params={"composition_id": composition["id"]})).json()
+        assert [n["rang"] for n in notes] == [1, 2]
+        stats = (await client.get(f"/api/statistiques/{composition['id']}")).json()
+        assert stats["effectif"] == 2
+
+
+async def test_supprimer_composition(client, creer_classe):
+    _, eleves, (composition,) = await creer_classe(nb_eleves=2)
+    await _saisir(client, eleves, [composition])
+
+    reponse = await client.delete(f"/api/compositions/{composition['id']}")
+
+    assert reponse.json()["supprimes"] == {"compositions": 1, "notes": 2, "statistiques": 1}
+    assert (await client.delete(f"/api/compositions/{composition['id']}")).status_code == 404
+
+
+async def test_supprimer_eleve_passe_par_le_planificateur(client, serveur, creer_classe, monkeypatch):
+    _, eleves, compositions = await creer_classe(nb_eleves=3, nb_compositions=2)
+    await _saisir(client, eleves, compositions)
+
+    # Chaque reclassement doit se faire sous le verrou par composition du planificateur
+    hors_planificateur = []
+    reclasser = serveur.reclasser_compositions
+
+    async def reclasser_espionne(composition_ids):
+        hors_planificateur.extend(c for c in composition_ids if c not in serveur.planificateur._en_calcul)
+        return await reclasser(composition_ids)
+
+    monkeypatch.setattr(serveur, "reclasser_compositions", reclasser_espionne)
+    await client.delete(f"/api/eleves/{eleves[0]['id']}")
+
+    assert hors_planificateur == []
@@ -0,0 +1,169 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+NOTE = {"etude_texte": 30, "aem": 30, "dictee": 12, "math": 30}
+
+
+async def _sync(client, **params):
+    return (await client.get("/api/sync", params=params)).json()
+
+
+async def test_etat_complet_puis_changements(client, creer_classe):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=2)
+    complet = await _sync(client)
+    assert [len(complet[nom]) for nom in ("classes", "eleves", "compositions", "notes")] == [1, 2, 1, 0]
+    assert complet["suppressions"] == []
+
+    notes = (await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [{"eleve_id": eleve["id"], **NOTE, "math": 10 * i} for i, eleve in enumerate(eleves)],
+    })).json()
+    delta = await _sync(client, since=complet["jeton"])
+    assert [len(delta[nom]) for nom in ("classes", "eleves", "compositions")] == [0, 0, 0]
+    assert {note["id"] for note in delta["notes"]} == {note["id"] for note in notes}
+    assert delta["jeton"] > complet["jeton"]
+
+    # Rien de neuf : réponse vide, même jeton
+    rien = await _sync(client, since=delta["jeton"])
+    assert rien["notes"] == [] and rien["jeton"] == delta["jeton"]
+
+
+async def test_changement_de_rang_et_pierres_tombales(client, creer_classe):
+    classe, eleves, (composition,) = await creer_classe(nb_eleves=3)
+    notes = (await client.post("/api/notes/batch", json={
+        "composition_id": composition["id"],
+        "notes": [{"eleve_id": eleve["id"], **NOTE, "math": 10 * i} for i, eleve in enumerate(eleves)],
+    })).json()
+    jeton = (await _sync(client))["jeton"]
+
+    # Le dernier passe premier : les rangs des autres changent aussi
+    derniere = next(note for note in notes if note["rang"] == 3)
+    await client.put(f"/api/notes/{derniere['id']}", json={**NOTE, "math": 50})
+    delta = await _sync(client, since=jeton)
+    assert {note["id"]: note["rang"] for note in delta["notes"]} == {
+        note["id"]: (1 if note["id"] == derniere["id"] else note["rang"] + 1) for note in notes
+    }
+
+    await client.delete(f"/api/eleves/{eleves[1]['id']}")
+    await client.delete(f"/api/notes/{derniere['id']}")
+    delta = await _sync(client, since=delta["jeton"])
+    assert [(s["collection"], s["id"]) for s in delta["suppressions"]] == [
+        ("eleves", eleves[1]["id"]), ("notes", derniere["id"]),
+    ]
+
+    await client.delete(f"/api/classes/{classe['id']}")
+    delta = await _sync(client, since=delta["jeton"])
+    assert [(s["collection"], s["id"]) for s in delta["suppressions"]] == [("classes", classe["id"])]
+
+
+async def test_synchronisation_d_une_classe(client, creer_classe):
+    classe, eleves, _ = await creer_classe(nb_eleves=2)
+    autre, _, _ = await creer_classe(nb_eleves=1)
+    jeton = (await _sync(client, classe_id=classe["id"]))["jeton"]
+    jeton_autre = (await _sync(client, classe_id=autre["id"]))["jeton"]
+
+    await client.put(f"/api/classes/{autre['id']}", json={**autre, "enseignant": "M. AUTRE"})
+    # Changer l'élève de classe : il sort de la première
+    await client.put(f"/api/eleves/{eleves[0]['id']}", json={**eleves[0], "classe_id": autre["id"]})
+
+    delta = await _sync(client, since=jeton, classe_id=classe["id"])
+    assert delta["classes"] == [] and delta["eleves"] == []
+    assert [(s["collection"], s["id"]) for s in delta["suppressions"]] == [("eleves", eleves[0]["id"])]
+
+    delta_autre = await _sync(client, since=jeton_autre, classe_id=autre["id"])
+    assert [e["id"] for e in delta_autre["eleves"]] == [eleves[0]["id"]]
+    assert delta_autre["classes"][0]["enseignant"] == "M. AUTRE"
+
+
+async def test_ecriture_en_cours_borne_le_jeton(client, serveur, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=1)
+    jeton = (await _sync(client))["jeton"]
+
+    async with serveur.versions_reservees(serveur.ECOLE_PAR_DEFAUT) as version:
+        # Une écriture plus récente, terminée pendant que la première est en cours
+        await client.post("/api/eleves", json={"nom": "RAPIDE", "prenom": "Eleve", "classe_id": classe["id"]})
+        delta = await _sync(client, since=jeton)
+        assert delta["eleves"] == [] and delta["jeton"] == jeton
+        assert version == jeton + 1
+
+    delta = await _sync(client, since=jeton)
+    assert [e["nom"] for e in delta["eleves"]] == ["RAPIDE"]
+
+
+async def _reserver_ailleurs(serveur, reservation, debut):
+    """Réservation d'un autre worker, qui n'a pas encore écrit : seul le compteur partagé la connaît"""
+    compteur = await serveur.db.compteurs.find_one({"_id": serveur.cle_compteur(serveur.ECOLE_PAR_DEFAUT)})
+    await serveur.db.compteurs.update_one({"_id": compteur["_id"]}, {"$set": {
+        "version": compteur["version"] + 1,
+        f"en_cours.{reservation}": {"premiere": compteur["version"] + 1, "debut": debut},
+    }})
+    return compteur["version"] + 1
+
+
+async def test_reservation_d_un_autre_worker(client, serveur, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=1)
+    jeton = (await _sync(client))["jeton"]
+
+    version = await _reserver_ailleurs(serveur, "autre", serveur.datetime.now(serveur.timezone.utc))
+    await client.post("/api/eleves", json={"nom": "RAPIDE", "prenom": "Eleve", "classe_id": classe["id"]})
+    assert (await _sync(client, since=jeton))["eleves"] == []
+
+    await serveur.liberer_versions(serveur.ECOLE_PAR_DEFAUT, "autre")
+    delta = await _sync(client, since=jeton)
+    assert [e["nom"] for e in delta["eleves"]] == ["RAPIDE"] and delta["jeton"] == version + 1
+
+
+async def test_ecritures_qui_se_chevauchent(client, serveur, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=1)
+    jeton = (await _sync(client))["jeton"]
+    maintenant = serveur.datetime.now(serveur.timezone.utc)
+
+    # Réservations qui se chevauchent sans jamais être toutes closes : la version stable avance quand même
+    await _reserver_ailleurs(serveur, "a", maintenant)
+    await client.post("/api/eleves", json={"nom": "PREMIER", "prenom": "Eleve", "classe_id": classe["id"]})
+    await _reserver_ailleurs(serveur, "b", maintenant)
+    await serveur.liberer_versions(serveur.ECOLE_PAR_DEFAUT, "a")
+    await client.post("/api/eleves", json={"nom": "SECOND", "prenom": "Eleve", "classe_id": classe["id"]})
+
+    delta = await _sync(client, since=jeton)
+    assert [e["nom"] for e in delta["eleves"]] == ["PREMIER"] and delta["jeton"] == jeton + 2
+
+
+async def test_compteur_par_ecole(client, serveur, creer_classe):
+    await creer_classe(nb_eleves=1)
+    # Une réservation ouverte dans une autre école ne retient pas celle-ci
+    await serveur.db.compteurs.insert_one({
+        "_id": serveur.cle_compteur("autre-ecole"), "version": 1,
+        "en_cours": {"x": {"premiere": 1, "debut": serveur.datetime.now(serveur.timezone.utc)}},
+    })
+    assert (await _sync(client))["eleves"] != []
+    assert await serveur.version_stable("autre-ecole") == 0
+
+
+async def test_reservation_abandonnee_expire(client, serveur, creer_classe):
+    classe, _, _ = await creer_classe(nb_eleves=1)
+    jeton = (await _sync(client))["jeton"]
+    # Worker arrêté en pleine écriture : la réservation n'est jamais libérée
+    await _reserver_ailleurs(serveur, "perdue", serveur.datetime(2024, 1, 1))
+    await client.post("/api/eleves", json={"nom": "APRES", "prenom": "Eleve", "classe_id": classe["id"]})
+
+    delta = await _sync(client, since=jeton)
+    assert [e["nom"] for e in delta["eleves"]] == ["APRES"]
+    compteur = await serveur.db.compteurs.find_one({"_id": serveur.cle_compteur(serveur.ECOLE_PAR_DEFAUT)})
+    assert compteur["en_cours"] == {}
+
+
+async def test_reprise_de_l_ancien_compteur_global(serveur, creer_classe):
+    await creer_classe(nb_eleves=1)
+    await serveur.db.compteurs.insert_one({"_id": "sync", "version": 500})
+    await serveur.migrer_compteurs()
+    async with serveur.versions_reservees(serveur.ECOLE_PAR_DEFAUT) as version:
+        assert version == 501
+    assert await serveur.db.compteurs.find_one({"_id": "sync"}) is None
+
+
+async def test_migration_des_documents_anciens(serveur):
+    await serveur.db.classes.insert_one({"id": "ancienne", "nom": "X"})
+    await serveur.migrer_versions()
+    assert (await serveur.db.classes.find_one({"id": "ancienne"}))["version"] == 0